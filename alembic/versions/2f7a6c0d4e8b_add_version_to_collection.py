@@ -0,0 +1,25 @@
+"""Add version to Collection
+
+Revision ID: 2f7a6c0d4e8b
+Revises: 5e9d03b7c1a4
+Create Date: 2026-10-17 13:24:09.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2f7a6c0d4e8b'
+down_revision = '5e9d03b7c1a4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('collection', sa.Column('version', sa.Integer,
+                                          nullable=False, server_default='0'))
+
+
+def downgrade():
+    op.drop_column('collection', 'version')
@@ -0,0 +1,117 @@
+"""Store timestamps as timestamptz
+
+The created and modified columns are converted online: new columns are added,
+kept in sync with the old ones by a trigger and backfilled in batches, then
+swapped with the old columns in a short transaction.
+
+Revision ID: 4a8c1e6d2b95
+Revises: e7b2d5a0c914
+Create Date: 2026-10-17 19:20:43.771902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4a8c1e6d2b95'
+down_revision = 'e7b2d5a0c914'
+branch_labels = None
+depends_on = None
+
+TABLES = ['collection', 'annotation']
+BATCH_SIZE = 10000
+
+
+def upgrade():
+    # Each step is committed as it runs, so that the tables are only locked
+    # against writes while the columns are swapped and the indexes can be
+    # built concurrently
+    op.execute('COMMIT')
+    for table in TABLES:
+        add_timestamptz_columns(table)
+        backfill_timestamptz_columns(table)
+        swap_timestamptz_columns(table)
+
+    op.execute("""
+        CREATE INDEX CONCURRENTLY idx_annotation_collection_created
+            ON annotation (collection_key, created, key)
+    """)
+    op.execute("""
+        CREATE INDEX CONCURRENTLY idx_annotation_created
+            ON annotation USING brin (created)
+    """)
+
+
+def add_timestamptz_columns(table):
+    """Add the new columns, kept in sync by a trigger."""
+    op.execute("""
+        BEGIN;
+
+        ALTER TABLE {0}
+            ADD COLUMN created_tz timestamptz,
+            ADD COLUMN modified_tz timestamptz;
+
+        CREATE FUNCTION {0}_sync_timestamps() RETURNS trigger AS $$
+        BEGIN
+            NEW.created_tz := NEW.created::timestamptz;
+            NEW.modified_tz := NEW.modified::timestamptz;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql;
+
+        CREATE TRIGGER {0}_sync_timestamps
+            BEFORE INSERT OR UPDATE ON {0}
+            FOR EACH ROW EXECUTE PROCEDURE {0}_sync_timestamps();
+
+        COMMIT;
+    """.format(table))
+
+
+def backfill_timestamptz_columns(table):
+    """Fill the new columns for existing rows, one batch at a time."""
+    conn = op.get_bind()
+    max_key = conn.execute('SELECT max(key) FROM {}'.format(table)).scalar()
+    sql = sa.text("""
+        UPDATE {}
+        SET created_tz = created::timestamptz,
+            modified_tz = modified::timestamptz
+        WHERE key > :start AND key <= :stop
+    """.format(table))
+    for start in range(0, max_key or 0, BATCH_SIZE):
+        conn.execute(sql, start=start, stop=start + BATCH_SIZE)
+
+
+def swap_timestamptz_columns(table):
+    """Replace the old columns with the new ones."""
+    op.execute("""
+        BEGIN;
+
+        LOCK TABLE {0} IN ACCESS EXCLUSIVE MODE;
+
+        DROP TRIGGER {0}_sync_timestamps ON {0};
+        DROP FUNCTION {0}_sync_timestamps();
+
+        ALTER TABLE {0}
+            DROP COLUMN created,
+            DROP COLUMN modified;
+        ALTER TABLE {0} RENAME COLUMN created_tz TO created;
+        ALTER TABLE {0} RENAME COLUMN modified_tz TO modified;
+
+        COMMIT;
+    """.format(table))
+
+
+def downgrade():
+    op.drop_index('idx_annotation_created')
+    op.drop_index('idx_annotation_collection_created')
+    for table in TABLES:
+        op.execute("""
+            ALTER TABLE {0}
+                ALTER COLUMN created TYPE text
+                    USING to_char(created AT TIME ZONE 'UTC',
+                                  'YYYY-MM-DD"T"HH24:MI:SS"Z"'),
+                ALTER COLUMN modified TYPE text
+                    USING to_char(modified AT TIME ZONE 'UTC',
+                                  'YYYY-MM-DD"T"HH24:MI:SS"Z"');
+        """.format(table))
@@ -0,0 +1,37 @@
+"""Add annotation count to Collection
+
+Revision ID: 5e9d03b7c1a4
+Revises: 8c2f4e1a9b7d
+Create Date: 2026-10-17 11:02:47.581390
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e9d03b7c1a4'
+down_revision = '8c2f4e1a9b7d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('collection', sa.Column('annotation_count', sa.Integer,
+                                          nullable=False, server_default='0'))
+    sql = """
+        UPDATE collection
+        SET annotation_count = counts.n
+        FROM (
+            SELECT collection_key, count(key) AS n
+            FROM annotation
+            WHERE deleted = false
+            GROUP BY collection_key
+        ) AS counts
+        WHERE collection.key = counts.collection_key
+    """
+    op.execute(sql)
+
+
+def downgrade():
+    op.drop_column('collection', 'annotation_count')
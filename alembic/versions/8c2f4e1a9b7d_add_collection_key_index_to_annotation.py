@@ -0,0 +1,25 @@
+"""Add collection key index to Annotation table
+
+Revision ID: 8c2f4e1a9b7d
+Revises: 0585e7d309a1
+Create Date: 2026-10-17 09:12:31.204518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c2f4e1a9b7d'
+down_revision = '0585e7d309a1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('idx_annotation_collection_key', 'annotation',
+                    ['collection_key', 'key'])
+
+
+def downgrade():
+    op.drop_index('idx_annotation_collection_key')
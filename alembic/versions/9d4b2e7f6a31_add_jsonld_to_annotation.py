@@ -0,0 +1,24 @@
+"""Add stored JSON-LD to Annotation
+
+Revision ID: 9d4b2e7f6a31
+Revises: 2f7a6c0d4e8b
+Create Date: 2026-10-17 14:51:36.402817
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d4b2e7f6a31'
+down_revision = '2f7a6c0d4e8b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('annotation', sa.Column('_jsonld', sa.Text))
+
+
+def downgrade():
+    op.drop_column('annotation', '_jsonld')
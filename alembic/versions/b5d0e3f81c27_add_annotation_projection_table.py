@@ -0,0 +1,34 @@
+"""Add Annotation projection table
+
+Revision ID: b5d0e3f81c27
+Revises: 4a8c1e6d2b95
+Create Date: 2026-10-17 20:37:05.118426
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5d0e3f81c27'
+down_revision = '4a8c1e6d2b95'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'annotation_projection',
+        sa.Column('annotation_key', sa.Integer,
+                  sa.ForeignKey('annotation.key', ondelete='CASCADE'),
+                  primary_key=True),
+        sa.Column('name', sa.Unicode, primary_key=True),
+        sa.Column('value', sa.Unicode, primary_key=True)
+    )
+    op.create_index('idx_annotation_projection_value',
+                    'annotation_projection', ['name', 'value'],
+                    postgresql_ops={'value': 'text_pattern_ops'})
+
+
+def downgrade():
+    op.drop_table('annotation_projection')
@@ -0,0 +1,42 @@
+"""Ensure full-text search indexes on Annotation
+
+Databases created from the models, rather than by running the migrations,
+did not have the full-text search indexes.
+
+Revision ID: c3e1f9a27b60
+Revises: 9d4b2e7f6a31
+Create Date: 2026-10-17 16:02:11.583120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e1f9a27b60'
+down_revision = '9d4b2e7f6a31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    sql = ("""
+        CREATE or REPLACE FUNCTION lang_cast(VARCHAR) RETURNS regconfig
+            AS 'select cast($1 as regconfig)'
+            LANGUAGE SQL
+            IMMUTABLE
+            RETURNS NULL ON NULL INPUT;
+
+        CREATE INDEX IF NOT EXISTS idx_annotation_body
+            ON annotation
+            USING gin (to_tsvector(lang_cast(language), _data -> 'body'));
+
+        CREATE INDEX IF NOT EXISTS idx_annotation_target
+            ON annotation
+            USING gin (to_tsvector(lang_cast(language), _data -> 'target'));
+    """)
+    op.execute(sql)
+
+
+def downgrade():
+    pass
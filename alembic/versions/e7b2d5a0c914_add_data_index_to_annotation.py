@@ -0,0 +1,31 @@
+"""Add data index to Annotation table
+
+Revision ID: e7b2d5a0c914
+Revises: c3e1f9a27b60
+Create Date: 2026-10-17 16:48:27.019364
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7b2d5a0c914'
+down_revision = 'c3e1f9a27b60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Indexes can only be built concurrently outside of a transaction, which
+    # avoids locking the Annotation table against writes while it is built
+    op.execute('COMMIT')
+    op.create_index('idx_annotation_data', 'annotation', ['_data'],
+                    postgresql_using='gin',
+                    postgresql_ops={'_data': 'jsonb_path_ops'},
+                    postgresql_concurrently=True)
+
+
+def downgrade():
+    op.execute('COMMIT')
+    op.drop_index('idx_annotation_data', postgresql_concurrently=True)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""Compare contains search latency with and without the data index.
+
+Adds n Annotations, spread over ten Collections, to the configured database,
+so it should only be run against a scratch database. The Annotations are
+removed again afterwards.
+"""
+
+import sys
+import random
+import timeit
+
+from explicates.core import db, create_app
+from explicates.model.collection import Collection
+from explicates.search import Search
+
+
+app = create_app()
+search = Search(db)
+
+COLLECTIONS = 10
+TARGETS_PER_SOURCE = 10
+
+
+def populate(n):
+    """Add n Annotations, each sharing a target source with nine others."""
+    collections = [Collection(id='benchmark-{}'.format(i))
+                   for i in range(COLLECTIONS)]
+    db.session.add_all(collections)
+    db.session.flush()
+    sql = """
+        INSERT INTO annotation (id, collection_key, language, deleted,
+                                created, _data)
+        SELECT 'benchmark-' || i, (:keys)[i % :collections + 1], 'english',
+               false, '2018-11-19T12:34:56Z',
+               jsonb_build_object(
+                   'type', 'Annotation',
+                   'motivation', 'describing',
+                   'body', jsonb_build_object(
+                       'type', 'TextualBody',
+                       'value', 'A description of image ' || i),
+                   'target', jsonb_build_object(
+                       'source', 'http://example.org/images/' ||
+                                 i / :per_source || '.jpg'))
+        FROM generate_series(0, :n - 1) AS i
+    """
+    db.session.execute(sql, dict(keys=[c.key for c in collections],
+                                 collections=COLLECTIONS,
+                                 per_source=TARGETS_PER_SOURCE, n=n))
+    db.session.commit()
+
+
+def clean():
+    """Remove the benchmark Annotations and Collections."""
+    db.session.execute("DELETE FROM annotation WHERE id LIKE 'benchmark-%'")
+    db.session.execute("DELETE FROM collection WHERE id LIKE 'benchmark-%'")
+    db.session.commit()
+
+
+def set_index(enabled):
+    """Create or drop the data index."""
+    db.session.execute('DROP INDEX IF EXISTS idx_annotation_data')
+    if enabled:
+        db.session.execute("""
+            CREATE INDEX idx_annotation_data ON annotation
+            USING gin (_data jsonb_path_ops)
+        """)
+    db.session.execute('ANALYZE annotation')
+    db.session.commit()
+
+
+def time_search(n, collection=False, repeat=20):
+    """Return the median time to load the first page of a contains search."""
+    times = []
+    for _ in range(repeat):
+        i = random.randrange(n)
+        params = dict(contains={
+            'target': {
+                'source': 'http://example.org/images/{}.jpg'.format(
+                    i // TARGETS_PER_SOURCE)
+            }
+        }, limit=100)
+        if collection:
+            params['collection'] = 'benchmark-{}'.format(i % COLLECTIONS)
+        start = timeit.default_timer()
+        results = search.paginate(**params)
+        len(results)
+        results[:]
+        times.append(timeit.default_timer() - start)
+        db.session.rollback()
+    return sorted(times)[len(times) // 2]
+
+
+def benchmark(n):
+    with app.app_context():
+        populate(n)
+        try:
+            print('{0:<10} {1:>18} {2:>18}'.format('index', 'contains (ms)',
+                                                   '+ collection (ms)'))
+            for enabled in [False, True]:
+                set_index(enabled)
+                contains_t = time_search(n)
+                collection_t = time_search(n, collection=True)
+                print('{0:<10} {1:>18.2f} {2:>18.2f}'.format(
+                    'on' if enabled else 'off', contains_t * 1000,
+                    collection_t * 1000))
+        finally:
+            clean()
+            set_index(True)
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    benchmark(n)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""Compare dictizing Annotations with and without the cached dictize plans.
+
+The uncached run clears the plans and the generated timestamp before each
+Annotation, as if they were worked out for every object. No database is
+needed, as the Annotations are never saved.
+"""
+
+import sys
+import timeit
+from flask import g
+
+from explicates.core import create_app
+from explicates.model import base
+from explicates.model.annotation import Annotation, cache_collection_id
+from explicates.model.collection import Collection
+
+
+app = create_app()
+
+
+def get_annotations(n):
+    """Return n transient Annotations in a single Collection."""
+    collection = Collection(key=1, id='my-container')
+    annotations = []
+    for i in range(n):
+        data = {
+            'type': 'Annotation',
+            'motivation': 'describing',
+            'body': 'http://example.org/tags/{}'.format(i % 50),
+            'target': 'http://example.org/images/{}.jpg'.format(i)
+        }
+        annotations.append(Annotation(key=i + 1, id=str(i),
+                                      collection=collection, data=data))
+    return collection, annotations
+
+
+def dictize_all(annotations, cached=True):
+    """Dictize the Annotations, optionally clearing the cached state."""
+    for annotation in annotations:
+        if not cached:
+            base._dictize_plans.clear()
+            g.pop('generated', None)
+        annotation.dictize()
+
+
+def benchmark(n=1000, repeat=20):
+    with app.test_request_context('/'):
+        collection, annotations = get_annotations(n)
+        cache_collection_id(collection)
+        print('{0:<10} {1:>12} {2:>18}'.format('plans', 'time (ms)',
+                                               'annotations/ms'))
+        for cached in [False, True]:
+            t = min(timeit.repeat(lambda: dictize_all(annotations, cached),
+                                  number=1, repeat=repeat))
+            print('{0:<10} {1:>12.2f} {2:>18.1f}'.format(
+                'cached' if cached else 'uncached', t * 1000, n / (t * 1000)))
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    benchmark(n)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""Compare the installed JSON codecs on a full AnnotationPage."""
+
+import sys
+import timeit
+
+from explicates.codec import CODEC_TYPES, create_codec
+
+
+def get_page(n):
+    """Return an AnnotationPage of n Annotations, as returned by the API."""
+    base = 'http://annotations.example.com/annotations/my-container/'
+    items = []
+    for i in range(n):
+        items.append({
+            'id': '{0}{1}/'.format(base, i),
+            'type': 'Annotation',
+            'motivation': 'describing',
+            'created': '2018-11-19T12:34:56Z',
+            'generated': '2018-11-20T00:00:00Z',
+            'generator': 'http://example.org/client1',
+            'body': [
+                {
+                    'type': 'TextualBody',
+                    'purpose': 'describing',
+                    'value': u'A description of the image, with ✓ in it',
+                    'format': 'text/plain',
+                    'language': 'en'
+                },
+                {
+                    'type': 'SpecificResource',
+                    'purpose': 'classifying',
+                    'source': 'http://example.org/tags/{}'.format(i % 50)
+                }
+            ],
+            'target': {
+                'source': 'http://example.org/images/{}.jpg'.format(i),
+                'selector': {
+                    'conformsTo': 'http://www.w3.org/TR/media-frags/',
+                    'type': 'FragmentSelector',
+                    'value': '?xywh=10,20,{0},{1}'.format(i, i * 2)
+                }
+            }
+        })
+    return {
+        'id': base + '?page=0',
+        'type': 'AnnotationPage',
+        'startIndex': 0,
+        'next': base + '?page=1',
+        'items': items
+    }
+
+
+def benchmark(n=1000, repeat=20):
+    page = get_page(n)
+    print('{0:<10} {1:>12} {2:>12}'.format('codec', 'dumps (ms)',
+                                           'loads (ms)'))
+    for codec_type in CODEC_TYPES:
+        try:
+            codec = create_codec(codec_type)
+        except ImportError:
+            print('{0:<10} {1:>12}'.format(codec_type, 'not installed'))
+            continue
+        body = codec.dumps(page)
+        dumps_t = min(timeit.repeat(lambda: codec.dumps(page), number=1,
+                                    repeat=repeat))
+        loads_t = min(timeit.repeat(lambda: codec.loads(body), number=1,
+                                    repeat=repeat))
+        print('{0:<10} {1:>12.2f} {2:>12.2f}'.format(codec_type,
+                                                     dumps_t * 1000,
+                                                     loads_t * 1000))
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    benchmark(n)
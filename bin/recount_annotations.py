@@ -0,0 +1,18 @@
+#!/usr/bin/env python
+
+from explicates.core import db, create_app
+from explicates.model.collection import recount_annotations
+
+
+app = create_app()
+
+
+def recount():
+    """Recompute the stored Annotation count for every Collection."""
+    with app.app_context():
+        recount_annotations()
+        db.session.commit()
+
+
+if __name__ == '__main__':
+    recount()
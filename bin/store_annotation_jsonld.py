@@ -0,0 +1,18 @@
+#!/usr/bin/env python
+
+from explicates.core import db, create_app
+from explicates.model.annotation import store_annotation_jsonld
+
+
+app = create_app()
+
+
+def store():
+    """Store the serialized data for all existing Annotations."""
+    with app.app_context():
+        store_annotation_jsonld()
+        db.session.commit()
+
+
+if __name__ == '__main__':
+    store()
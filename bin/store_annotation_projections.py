@@ -0,0 +1,18 @@
+#!/usr/bin/env python
+
+from explicates.core import db, create_app
+from explicates.model.projection import store_annotation_projections
+
+
+app = create_app()
+
+
+def store():
+    """Store the projected properties for all existing Annotations."""
+    with app.app_context():
+        store_annotation_projections()
+        db.session.commit()
+
+
+if __name__ == '__main__':
+    store()
@@ -12,6 +12,7 @@ from explicates.api.index import IndexAPI
 from explicates.api.search import SearchAPI
 from explicates.api.export import ExportAPI
 from explicates.api.batch import BatchAPI
+from explicates.api.stats import StatsAPI
 
 
 blueprint = Blueprint('api', __name__)
@@ -30,3 +31,4 @@ register_api(AnnotationsAPI, 'annotations',
 register_api(SearchAPI, 'search', '/search/')
 register_api(ExportAPI, 'export', '/export/<collection_id>/')
 register_api(BatchAPI, 'batch', '/batch/')
+register_api(StatsAPI, 'stats', '/stats/')
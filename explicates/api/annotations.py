@@ -25,9 +25,18 @@ class AnnotationsAPI(APIBase, MethodView):
         return annotation
 
     def get(self, collection_id, annotation_id):
-        """Get an Annotation."""
-        annotation = self._get_annotation(collection_id, annotation_id)
-        return self._jsonld_response(annotation)
+        """Get an Annotation.
+
+        Any change to an Annotation changes its Collection's version, which
+        is used to cache the rendered Annotation and answer conditional
+        requests.
+        """
+        collection = self._get_domain_object(Collection, collection_id)
+        annotation = self._get_domain_object(Annotation, annotation_id,
+                                             collection=collection)
+        last_modified = annotation.modified or annotation.created
+        return self._cached_jsonld_response(collection.id, collection.version,
+                                            lambda: annotation, last_modified)
 
     def put(self, collection_id, annotation_id):
         """Update an Annotation."""
@@ -35,6 +44,7 @@ class AnnotationsAPI(APIBase, MethodView):
         annotation.collection.update()
         repo.save(Collection, annotation.collection)
         self._update(annotation)
+        self._invalidate_caches(collection_id)
         return self._jsonld_response(annotation)
 
     def delete(self, collection_id, annotation_id):
@@ -43,4 +53,5 @@ class AnnotationsAPI(APIBase, MethodView):
         annotation.collection.update()
         repo.save(Collection, annotation.collection)
         self._delete(annotation)
+        self._invalidate_caches(collection_id)
         return self._jsonld_response(None, status_code=204)
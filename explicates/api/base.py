@@ -8,18 +8,40 @@ Design notes:
 """
 
 import os
-import json
+import hmac
+import hashlib
+import itertools
+import base64
+import binascii
+import unidecode
+import zipfile
+import zipstream
 from flask import current_app
-from flask import abort, request, jsonify, make_response, url_for
+from flask import abort, request, make_response
+from flask import Response, stream_with_context
 from jsonschema import validate as validate_json
 from jsonschema.exceptions import ValidationError
+from sqlalchemy import func, select
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Query, load_only
 from past.builtins import basestring
 
-from explicates.core import repo
-from explicates.model.annotation import Annotation
+from explicates import codec
+from explicates.bakery import BakedResults
+from explicates.core import db, repo, render_cache, search_cache
+from explicates.iri import iri_for
+from explicates.jsonld import RawJSON, JSONStream, jsonify
+from explicates.model.annotation import Annotation, get_collection_ids, \
+    load_unstored_data
 from explicates.model.collection import Collection
 from explicates.model.base import BaseDomainObject
+from explicates.model.utils import parse_timestamp
+
+
+JSONLD_CONTEXT = 'http://www.w3.org/ns/anno.jsonld'
+
+#: The number of rows fetched at a time for streamed AnnotationPages.
+STREAM_BATCH_SIZE = 100
 
 
 class APIBase(object):
@@ -37,15 +59,15 @@ class APIBase(object):
         """Get the IRI for an object."""
         if isinstance(obj, Annotation):
             kwargs.pop('iris', None)
-            return url_for('api.annotations', annotation_id=obj.id,
-                           collection_id=obj.collection.id, _external=True,
-                           **kwargs)
+            return iri_for('api.annotations', annotation_id=obj.id,
+                           collection_id=obj.collection_id, **kwargs)
 
         elif isinstance(obj, Collection):
+            # Temporary containers, such as for search results, are
+            # identified by the endpoint that generated them
             if not obj.id:
-                return url_for('api.search', _external=True, **kwargs)
-            return url_for('api.collections', collection_id=obj.id,
-                           _external=True, **kwargs)
+                return iri_for(request.endpoint, **kwargs)
+            return iri_for('api.collections', collection_id=obj.id, **kwargs)
 
         cls_name = obj.__class__.__name__
         raise TypeError('Cannot generated IRI for {}'.format(cls_name))
@@ -85,13 +107,22 @@ class APIBase(object):
             abort(400, err)
 
     def _get_validated_data(self, model_cls):
-        data = request.get_json()
+        data = self._get_json_data()
         try:
             self._validate_data(data, model_cls)
         except ValidationError as err:
             abort(400, err)
         return data
 
+    def _get_json_data(self):
+        """Return the decoded JSON request body, as for request.get_json."""
+        if not request.is_json:
+            return None
+        try:
+            return codec.loads(request.get_data())
+        except ValueError as err:
+            abort(400, 'Failed to decode JSON object: {}'.format(err))
+
     def _validate_data(self, obj, model_cls):
         """Validate data according JSON schema for the model class."""
         schema_fn = '{}.json'.format(model_cls.__name__.lower())
@@ -99,7 +130,7 @@ class APIBase(object):
         schemas_dir = os.path.join(os.path.dirname(here), 'schemas')
         schema_path = os.path.join(schemas_dir, schema_fn)
         with open(schema_path) as json_file:
-            schema = json.load(json_file)
+            schema = codec.loads(json_file.read())
             validate_json(obj, schema)
 
     def _jsonld_response(self, rv, status_code=200, headers=None):
@@ -109,6 +140,13 @@ class APIBase(object):
 
         See https://www.w3.org/TR/annotation-protocol/#annotation-retrieval
         """
+        out = self._get_jsonld_dict(rv)
+        response = jsonify(out, stream=self._is_streaming())
+        self._add_link_headers(response, out)
+        return self._finalize_jsonld_response(response, status_code, headers)
+
+    def _get_jsonld_dict(self, rv):
+        """Return the JSON-LD dict for a domain object or dict."""
         out = rv if rv else {}
         if isinstance(rv, BaseDomainObject):
             out = rv.dictize()
@@ -117,17 +155,29 @@ class APIBase(object):
             err_msg = '{} is not a valid return value'.format(type(rv))
             raise TypeError(err_msg)
 
-        context = 'http://www.w3.org/ns/anno.jsonld'
-        out['@context'] = context
-        response = jsonify(out)
-        response.mimetype = 'application/ld+json; profile="{}"'.format(context)
+        out['@context'] = JSONLD_CONTEXT
+        return out
+
+    def _finalize_jsonld_response(self, response, status_code=200,
+                                  headers=None, etag=None,
+                                  last_modified=None):
+        """Add the JSON-LD content type, validators and common headers.
+
+        Unless an ETag is given one is generated from the response body.
+        """
+        response.mimetype = 'application/ld+json; profile="{}"'.format(
+            JSONLD_CONTEXT)
 
         # Add Etags for HEAD and GET requests
         if request.method in ['HEAD', 'GET']:
-            response.add_etag()
+            if etag:
+                response.set_etag(etag, weak=True)
+            elif not response.is_streamed:
+                response.add_etag()
+            if last_modified:
+                response.last_modified = last_modified
 
         # Add headers
-        self._add_link_headers(response, out)
         common_headers = getattr(self, 'headers', {})
         response.headers.extend(common_headers)
         if headers:
@@ -136,6 +186,143 @@ class APIBase(object):
         response.status_code = status_code
         return response
 
+    def _cached_jsonld_response(self, namespace, version, render,
+                                last_modified=None, head=None):
+        """Return a JSON-LD Response, using the render cache.
+
+        The value returned by render is cached against the namespace, with a
+        key made up of the namespace's version and everything about the
+        request that affects its representation. A weak ETag is derived from
+        the same key, so conditional requests are answered before anything
+        is rendered. Streamed responses are not cached.
+
+        If head is given it returns the type of the representation, from
+        which the headers for HEAD requests are built without rendering it,
+        or None if it must be rendered.
+        """
+        minimal, iris = self._get_container_preferences()
+        args = tuple(sorted(request.args.items(multi=True)))
+        key = (version, request.url_root, request.path, args, minimal, iris)
+        etag = hashlib.sha1(repr((namespace, key)).encode('utf8')).hexdigest()
+        if last_modified:
+            last_modified = parse_timestamp(last_modified)
+
+        if self._is_not_modified(etag, last_modified):
+            response = current_app.response_class(status=304)
+            return self._finalize_jsonld_response(response, 304, etag=etag,
+                                                  last_modified=last_modified)
+
+        cached = render_cache.get(namespace, key)
+        if cached is not None:
+            body, links = cached
+            response = current_app.response_class(body)
+            response.headers.extend([('Link', link) for link in links])
+        elif request.method == 'HEAD':
+            out = head() if head else None
+            if out is None:
+                out = self._get_jsonld_dict(render())
+            response = current_app.response_class()
+            self._add_link_headers(response, out)
+        elif self._is_streaming():
+            out = self._get_jsonld_dict(render())
+            response = jsonify(out, stream=True)
+            self._add_link_headers(response, out)
+        else:
+            out = self._get_jsonld_dict(render())
+            response = jsonify(out)
+            self._add_link_headers(response, out)
+            body = response.get_data()
+            links = response.headers.getlist('Link')
+            render_cache.set(namespace, key, (body, links), len(body))
+        return self._finalize_jsonld_response(response, etag=etag,
+                                              last_modified=last_modified)
+
+    def _get_zip_compression(self):
+        """Return the available ZIP compression."""
+        try:
+            import zlib
+            assert zlib
+            return zipfile.ZIP_DEFLATED
+        except Exception as ex:  # pragma: no cover
+            return zipfile.ZIP_STORED
+
+    def _ascii_encode(self, name):
+        """Ensure a name is ASCII encoded."""
+        name = unidecode.unidecode(name)
+        return name
+
+    def _zip_response(self, name, generator, ext='json'):
+        """Respond with a ZIP file containing the streamed contents of a
+        single file."""
+        compression = self._get_zip_compression()
+        z = zipstream.ZipFile(mode='w', compression=compression)
+        safe_name = self._ascii_encode(name)
+        data_fn = safe_name + '.' + ext
+        zip_fn = safe_name + '.zip'
+        z.write_iter(data_fn, (chunk if isinstance(chunk, bytes)
+                               else chunk.encode('utf8')
+                               for chunk in generator))
+        response = Response(stream_with_context(z), mimetype='application/zip')
+        content_disposition = 'attachment; filename={}'.format(zip_fn)
+        response.headers['Content-Disposition'] = content_disposition
+        return response
+
+    def _is_admin(self):
+        """Return True if the request is authorized with the admin API key.
+
+        The key is sent as a bearer token in the Authorization header.
+        """
+        api_key = current_app.config.get('ADMIN_API_KEY')
+        auth = request.headers.get('Authorization', '')
+        scheme, _, token = auth.partition(' ')
+        if not api_key or scheme.lower() != 'bearer':
+            return False
+        return hmac.compare_digest(token.strip().encode('utf8'),
+                                   api_key.encode('utf8'))
+
+    def _set_statement_timeout(self, endpoint):
+        """Limit how long each database statement for the rest of the request
+        can run, using the timeout set for an endpoint, in milliseconds.
+
+        The timeout only applies to the current transaction.
+        """
+        timeouts = current_app.config.get('STATEMENT_TIMEOUTS') or {}
+        timeout = timeouts.get(endpoint)
+        if not timeout:
+            return
+        set_timeout = func.set_config('statement_timeout', str(int(timeout)),
+                                      True)
+        db.session.execute(select([set_timeout]))
+
+    def _invalidate_caches(self, collection_id):
+        """Invalidate the cached responses for a Collection.
+
+        Cached searches limited to the Collection are invalidated, along
+        with those across all Collections, as its Annotations may match.
+        """
+        render_cache.invalidate(collection_id)
+        search_cache.invalidate(collection_id)
+        search_cache.invalidate(None)
+
+    def _is_streaming(self):
+        """Return True if the items in AnnotationPages should be streamed."""
+        return bool(current_app.config.get('STREAM_PAGES')) and \
+            request.method == 'GET'
+
+    def _is_not_modified(self, etag, last_modified):
+        """Check the request's conditional headers against the validators.
+
+        If-Modified-Since is only evaluated without If-None-Match, as per
+        https://tools.ietf.org/html/rfc7232#section-6
+        """
+        if request.method not in ['HEAD', 'GET']:
+            return False
+        if request.if_none_match:
+            return request.if_none_match.contains_weak(etag)
+        if request.if_modified_since and last_modified:
+            return last_modified <= request.if_modified_since
+        return False
+
     def _add_link_headers(self, response, out):
         """Add Link headers basic on the domain object."""
         types = out.get('type', [])
@@ -198,9 +385,22 @@ class APIBase(object):
         return minimal, iris
 
     def _get_container(self, collection_base, items=None, total=None,
-                       **params):
-        """Return a container for Annotations."""
+                       seekable=False, approximate=False, **params):
+        """Return a container for Annotations.
+
+        If seekable is True then items must be a query that can be paged
+        using keyset cursors. If approximate is True the total is flagged as
+        an estimate, and only used for the link to the last page.
+        """
         out = collection_base.dictize()
+
+        # Defining total manually is useful for search
+        # results returned in fake containers
+        if total is not None:
+            out['total'] = total
+            if approximate:
+                out['approximateTotal'] = True
+
         minimal, iris = self._get_container_preferences()
         if not params:
             params = {}
@@ -208,38 +408,136 @@ class APIBase(object):
 
         out['id'] = self._get_iri(collection_base, **params)
 
-        # Defining total manually is useful for search
-        # results returned in fake containers
-        if total:
-            out['total'] = total
+        if items is not None and params['iris']:
+            items = self._load_iris_only(items)
 
         page = self._get_page_arg()
+        cursor = self._get_cursor_arg() if seekable else None
+        use_cursors = seekable and current_app.config.get('CURSOR_PAGINATION')
         per_page = current_app.config.get('ANNOTATIONS_PER_PAGE')
         n_pages = self._get_n_pages(items, out['total'], per_page)
 
-        if items:
-            items = self._slice_items(items, int(per_page), page)
-            if isinstance(page, int) and not items:
+        if items and cursor:
+            items, cursors = self._seek_items(items, int(per_page), cursor)
+            if not items:
+                abort(404)
+            return self._get_page(None, n_pages, per_page, collection_base,
+                                  items, partof=out, cursors=cursors,
+                                  **params)
+        elif items and use_cursors and not isinstance(page, int):
+            if minimal:
+                first = self._encode_cursor('after', None)
+                out['first'] = self._get_iri(collection_base, cursor=first,
+                                             **params)
+            else:
+                first_items, cursors = self._seek_items(items, int(per_page),
+                                                        ('after', None))
+                out['first'] = self._get_page(None, n_pages, per_page,
+                                              collection_base, first_items,
+                                              cursors=cursors, **params)
+            if n_pages > 1:
+                last = self._encode_cursor('before', None)
+                out['last'] = self._get_iri(collection_base, cursor=last,
+                                            **params)
+        elif items and minimal and not isinstance(page, int):
+            # The minimal container only links to the first page
+            out['first'] = self._get_iri(collection_base, page=0, **params)
+            if n_pages > 1:
+                out['last'] = self._get_iri(collection_base, page=n_pages - 1,
+                                            **params)
+        elif items:
+            # Streamed items are only queried once the response is sent
+            stream = self._is_streaming()
+            has_next = None
+            if approximate:
+                # An estimated total can be too low, so look for the items
+                # on and after the page instead
+                items, empty, has_next = self._probe_items(items,
+                                                           int(per_page),
+                                                           page, stream)
+            else:
+                items = self._slice_items(items, int(per_page), page,
+                                          lazy=stream)
+                start = self._get_page_start(page, int(per_page))
+                empty = start >= out['total'] if stream else not items
+            if isinstance(page, int) and empty:
                 abort(404)
             elif isinstance(page, int):
                 return self._get_page(page, n_pages, per_page, collection_base,
-                                      items, partof=out, **params)
-            elif minimal:
-                out['first'] = self._get_iri(collection_base, page=0, **params)
+                                      items, partof=out, has_next=has_next,
+                                      **params)
             else:
                 out['first'] = self._get_page(0, n_pages, per_page,
-                                              collection_base, items, **params)
+                                              collection_base, items,
+                                              has_next=has_next, **params)
             if n_pages > 1:
                 out['last'] = self._get_iri(collection_base, page=n_pages - 1,
                                             **params)
 
         return out
 
-    def _slice_items(self, items, per_page, page=0):
-        """Return a slice of items. """
-        start = page * per_page if page and page > 0 else 0
+    def _get_container_head(self, collection_base, seekable=False):
+        """Return the type of a container, or of the requested page, without
+        loading any items.
+
+        Returns None for pages requested by cursor, as they must be loaded
+        to tell whether they exist.
+        """
+        if seekable and self._get_cursor_arg():
+            return None
+        page = self._get_page_arg()
+        if not isinstance(page, int):
+            return {'type': collection_base.dictize().get('type')}
+        per_page = int(current_app.config.get('ANNOTATIONS_PER_PAGE'))
+        if self._get_page_start(page, per_page) >= collection_base.total:
+            abort(404)
+        return {'type': 'AnnotationPage'}
+
+    def _load_iris_only(self, items):
+        """Return items that only load the columns needed for their IRIs."""
+        if isinstance(items, Query):
+            model_cls = items.column_descriptions[0]['entity']
+            return items.options(load_only(*model_cls.iri_columns))
+        elif isinstance(items, BakedResults):
+            return items.load_only(*items.model_cls.iri_columns)
+        return items
+
+    def _slice_items(self, items, per_page, page=0, lazy=False):
+        """Return a slice of items.
+
+        If lazy is True the items must be a query or baked results, and a
+        query or baked result for the slice is returned instead, to be read
+        in batches.
+        """
+        start = self._get_page_start(page, per_page)
+        if lazy and isinstance(items, BakedResults):
+            return items.slice(start, start + per_page,
+                               yield_per=STREAM_BATCH_SIZE)
+        elif lazy:
+            return items.slice(start, start + per_page)
         return items[start:start + per_page]
 
+    def _probe_items(self, items, per_page, page=0, lazy=False):
+        """Return a slice of items, whether it is empty and whether there
+        are more items after it, without relying on the total.
+
+        One item more than the page is loaded to check for a next page, or
+        if lazy is True the first item on and after the page are loaded
+        separately.
+        """
+        start = self._get_page_start(page, per_page)
+        if lazy:
+            empty = not items[start:start + 1]
+            has_next = bool(items[start + per_page:start + per_page + 1])
+            return self._slice_items(items, per_page, page, lazy), empty, \
+                has_next
+        items = list(items[start:start + per_page + 1])
+        return items[:per_page], not items, len(items) > per_page
+
+    def _get_page_start(self, page, per_page):
+        """Return the index of the first item on a page."""
+        return page * per_page if page and page > 0 else 0
+
     def _get_page_arg(self):
         """Return the page query param and check it's an int."""
         page = request.args.get('page')
@@ -250,43 +548,171 @@ class APIBase(object):
                 abort(400, 'page must be a valid integer')
         return page
 
+    def _get_cursor_arg(self):
+        """Return the decoded cursor query param, if any."""
+        cursor = request.args.get('cursor')
+        if cursor is None:
+            return None
+        try:
+            return self._decode_cursor(cursor)
+        except ValueError:
+            abort(400, 'cursor is not valid')
+
+    def _encode_cursor(self, direction, key):
+        """Return an opaque cursor for the items either side of a key."""
+        raw = '{0}:{1}'.format(direction, '' if key is None else key)
+        token = base64.urlsafe_b64encode(raw.encode('ascii'))
+        return token.decode('ascii').rstrip('=')
+
+    def _decode_cursor(self, token):
+        """Return the (direction, key) tuple for an opaque cursor."""
+        padding = '=' * (-len(token) % 4)
+        try:
+            raw = base64.urlsafe_b64decode(str(token + padding))
+            direction, key = raw.decode('ascii').split(':')
+        except (TypeError, binascii.Error, UnicodeError):
+            raise ValueError('Invalid cursor')
+        if direction not in ['after', 'before']:
+            raise ValueError('Invalid cursor')
+        return direction, int(key) if key else None
+
+    def _seek_items(self, items, per_page, cursor):
+        """Return a page of items using keyset pagination.
+
+        The query is ordered by primary key and filtered relative to the key
+        in the cursor, so that later pages cost the same as the first. Also
+        returns the current, previous and next cursors for the page.
+        """
+        direction, key = cursor
+        if isinstance(items, BakedResults):
+            rows = items.seek(direction, key, per_page + 1)
+        else:
+            rows = self._seek_query(items, direction, key, per_page + 1)
+        has_more = len(rows) > per_page
+        rows = rows[:per_page]
+        if direction == 'before':
+            rows.reverse()
+        current = self._encode_cursor(direction, key)
+        if not rows:
+            return rows, (current, None, None)
+
+        # Only link back to the side of the page we came from
+        came_from_prev = direction == 'after' and key is not None
+        came_from_next = direction == 'before' and key is not None
+        has_prev = has_more if direction == 'before' else came_from_prev
+        has_next = has_more if direction == 'after' else came_from_next
+
+        prev_cursor = None
+        next_cursor = None
+        if has_prev:
+            prev_cursor = self._encode_cursor('before', rows[0].key)
+        if has_next:
+            next_cursor = self._encode_cursor('after', rows[-1].key)
+        return rows, (current, prev_cursor, next_cursor)
+
+    def _seek_query(self, query, direction, key, limit):
+        """Return up to limit rows of a query either side of a key."""
+        model_cls = query.column_descriptions[0]['entity']
+        query = query.order_by(None)
+        if direction == 'after':
+            query = query.order_by(model_cls.key)
+            if key is not None:
+                query = query.filter(model_cls.key > key)
+        else:
+            query = query.order_by(model_cls.key.desc())
+            if key is not None:
+                query = query.filter(model_cls.key < key)
+        return query.limit(limit).all()
+
     def _get_n_pages(self, items, total, per_page):
         """Return the number of pages."""
         n = 0 if total <= 0 else (total - 1) // per_page
         return n + 1
 
     def _get_page(self, page, n_pages, per_page, collection_base, items,
-                  partof=None, **params):
-        """Return an AnnotationPage."""
-        page_iri = self._get_iri(collection_base, page=page, **params)
+                  partof=None, cursors=None, has_next=None, **params):
+        """Return an AnnotationPage.
+
+        If cursors is given, as a tuple of the current, previous and next
+        cursors, then the page is linked using those instead of page numbers.
+        If has_next is given it decides whether the page links to the next,
+        rather than the number of pages.
+        """
+        if cursors:
+            current, prev_cursor, next_cursor = cursors
+            page_iri = self._get_iri(collection_base, cursor=current,
+                                     **params)
+        else:
+            page_iri = self._get_iri(collection_base, page=page, **params)
         data = {
             'id': page_iri,
             'type': 'AnnotationPage',
             'startIndex': 0
         }
 
-        if page > 0:
-            data['prev'] = self._get_iri(collection_base, page=page - 1,
-                                         **params)
-        if page < n_pages - 1:
-            data['next'] = self._get_iri(collection_base, page=page + 1,
-                                         **params)
+        if cursors:
+            if prev_cursor:
+                data['prev'] = self._get_iri(collection_base,
+                                             cursor=prev_cursor, **params)
+            if next_cursor:
+                data['next'] = self._get_iri(collection_base,
+                                             cursor=next_cursor, **params)
+        else:
+            if page > 0:
+                data['prev'] = self._get_iri(collection_base, page=page - 1,
+                                             **params)
+            if has_next is None:
+                has_next = page < n_pages - 1
+            if has_next:
+                data['next'] = self._get_iri(collection_base, page=page + 1,
+                                             **params)
 
         if partof:
             data['partOf'] = partof
 
-        items = self._decorate_page_items(items, params.get('iris'))
+        if self._is_streaming():
+            items = JSONStream(
+                self._iter_page_items(items, params.get('iris')))
+        else:
+            items = self._decorate_page_items(items, params.get('iris'))
         data['items'] = items
         return data
 
     def _decorate_page_items(self, items, iris=False):
-        """Dictize and decorate a list of page items."""
+        """Dictize and decorate a list of page items.
+
+        Annotations with stored JSON-LD are included without being dictized.
+        """
+        # Look up the Collection IDs for all Annotations at once
+        keys = [item.collection_key for item in items
+                if isinstance(item, Annotation)]
+        get_collection_ids(keys)
+        if not iris:
+            load_unstored_data([item for item in items
+                                if isinstance(item, Annotation)])
+
         out = []
         for item in items:
-            item_dict = item.dictize()
-            item_dict['id'] = self._get_iri(item)
             if iris:
-                out.append(item_dict['id'])
+                out.append(item.iri)
+            elif isinstance(item, Annotation) and item._jsonld is not None:
+                out.append(RawJSON(item.render_jsonld()))
             else:
-                out.append(item_dict)
+                out.append(item.dictize())
         return out
+
+    def _iter_page_items(self, items, iris=False):
+        """Yield decorated page items as they are fetched.
+
+        Queries are read from a server-side cursor, in batches, as are
+        sliced baked results.
+        """
+        if isinstance(items, Query):
+            items = items.yield_per(STREAM_BATCH_SIZE)
+        rows = iter(items)
+        while True:
+            batch = list(itertools.islice(rows, STREAM_BATCH_SIZE))
+            if not batch:
+                break
+            for item in self._decorate_page_items(batch, iris):
+                yield item
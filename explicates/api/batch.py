@@ -1,7 +1,6 @@
 # -*- coding: utf8 -*-
 """Batch API module."""
 
-import json
 from flask import request, abort
 from flask.views import MethodView
 from sqlalchemy.exc import IntegrityError
@@ -11,6 +10,7 @@ try:  # pragma: no cover
 except ImportError:  # pragma: no cover
     from urllib import unquote
 
+from explicates import codec
 from explicates.core import repo
 from explicates.api.base import APIBase
 from explicates.model.annotation import Annotation
@@ -35,12 +35,14 @@ class BatchAPI(APIBase, MethodView):
         """Batch delete items."""
         if not request.data:
             abort(400)
-        json_data = json.loads(request.data.decode('utf8'))
+        json_data = codec.loads(request.data)
         if type(json_data) != list:
             abort(400)
         annotation_ids = [self._get_base_id(anno) for anno in json_data]
         try:
-            repo.batch_delete(Annotation, annotation_ids)
+            collection_ids = repo.batch_delete(Annotation, annotation_ids)
         except (IntegrityError, ValueError) as err:
             abort(400, err)
+        for collection_id in collection_ids:
+            self._invalidate_caches(collection_id)
         return self._jsonld_response(None, status_code=204)
@@ -3,11 +3,14 @@
 
 from flask import request, abort
 from flask.views import MethodView
+from sqlalchemy.sql import bindparam
 
 from explicates.api.base import APIBase
-from explicates.core import repo
+from explicates.bakery import bakery, BakedResults
+from explicates.core import db, repo
 from explicates.model.collection import Collection
-from explicates.model.annotation import Annotation
+from explicates.model.annotation import Annotation, cache_collection_id
+from explicates.model.annotation import load_for_render
 
 
 class CollectionsAPI(APIBase, MethodView):
@@ -20,14 +23,36 @@ class CollectionsAPI(APIBase, MethodView):
 
     def _get_collection(self, collection_id):
         """Get a Collection object."""
-        return self._get_domain_object(Collection, collection_id)
+        collection = self._get_domain_object(Collection, collection_id)
+        cache_collection_id(collection)
+        return collection
 
     def get(self, collection_id):
         """Get a Collection."""
         collection = self._get_collection(collection_id)
-        items = collection.annotations.filter(Annotation.deleted == False)
-        container = self._get_container(collection, items=items)
-        return self._jsonld_response(container)
+
+        def render():
+            self._set_statement_timeout('collections')
+            items = self._items(collection)
+            return self._get_container(collection, items=items, seekable=True)
+
+        def head():
+            return self._get_container_head(collection, seekable=True)
+
+        last_modified = collection.modified or collection.created
+        return self._cached_jsonld_response(collection.id, collection.version,
+                                            render, last_modified, head)
+
+    def _items(self, collection):
+        """Return the Annotations in a Collection, as baked results."""
+        bq = bakery(lambda session: session.query(Annotation)
+                    .filter(Annotation.collection_key ==
+                            bindparam('collection_key'),
+                            Annotation.deleted == False)
+                    .order_by(Annotation.key))
+        return BakedResults(Annotation, load_for_render(bq), db.session(),
+                            params=dict(collection_key=collection.key),
+                            total=collection.total)
 
     def post(self, collection_id):
         """Create an Annotation."""
@@ -35,6 +60,7 @@ class CollectionsAPI(APIBase, MethodView):
         annotation = self._create(Annotation, collection=collection)
         collection.update()
         repo.save(Collection, collection)
+        self._invalidate_caches(collection.id)
         extra_headers = {'Location': annotation.iri}
         return self._jsonld_response(annotation, status_code=201,
                                      headers=extra_headers)
@@ -43,8 +69,10 @@ class CollectionsAPI(APIBase, MethodView):
         """Update a Collection."""
         collection = self._get_collection(collection_id)
         self._update(collection)
-        items = collection.annotations.filter(Annotation.deleted == False)
-        container = self._get_container(collection, items=items)
+        self._invalidate_caches(collection.id)
+        container = self._get_container(collection,
+                                        items=self._items(collection),
+                                        seekable=True)
         return self._jsonld_response(container)
 
     def delete(self, collection_id):
@@ -61,4 +89,5 @@ class CollectionsAPI(APIBase, MethodView):
             msg = 'The collection is not empty so cannot be deleted'
             abort(400, msg)
         self._delete(collection)
+        self._invalidate_caches(collection.id)
         return self._jsonld_response(None, status_code=204)
@@ -1,7 +1,7 @@
 # -*- coding: utf8 -*-
 """Index API module."""
 
-from flask import url_for, request
+from flask import request, abort
 from flask.views import MethodView
 
 from explicates.core import repo
@@ -17,20 +17,49 @@ class IndexAPI(APIBase, MethodView):
         'Allow': 'GET,POST,OPTIONS,HEAD'
     }
 
+    # The columns that AnnotationCollections can be ordered by
+    order_by_columns = {
+        'key': Collection.key,
+        'created': Collection.created,
+        'modified': Collection.modified,
+        'total': Collection.total
+    }
+
+    def _get_order_by_params(self):
+        """Return the valid order_by and desc query params."""
+        order_by = request.args.get('order_by') or 'key'
+        if order_by not in self.order_by_columns:
+            valid = ', '.join(sorted(self.order_by_columns))
+            abort(400, 'order_by must be one of {}'.format(valid))
+        desc = 1 if request.args.get('desc') == '1' else None
+        return order_by, desc
+
     def get(self):
         """Return a list of all AnnotationCollections."""
-        collections = repo.filter_by(Collection, deleted=False)
-        iris = True if request.args.get('iris') == '1' else False
-        container = {
-            'id': url_for('api.index', _external=True),
+        order_by, desc = self._get_order_by_params()
+        column = self.order_by_columns[order_by]
+        items = repo.query_by(Collection, deleted=False)
+        if desc:
+            items = items.order_by(column.desc(), Collection.key.desc())
+        else:
+            items = items.order_by(column, Collection.key)
+
+        params = {}
+        if order_by != 'key':
+            params['order_by'] = order_by
+        if desc:
+            params['desc'] = desc
+
+        tmp_collection = Collection(data={
             'label': 'All collections',
             'type': [
                 'AnnotationCollection',
                 'BasicContainer'
-            ],
-            'total': len(collections),
-            'items': self._decorate_page_items(collections, iris)
-        }
+            ]
+        })
+        container = self._get_container(tmp_collection, items=items,
+                                        total=repo.count(Collection),
+                                        seekable=not params, **params)
         return self._jsonld_response(container)
 
     def post(self):
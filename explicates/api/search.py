@@ -1,17 +1,30 @@
 # -*- coding: utf8 -*-
 """Search API module."""
 
-import json
-from flask import abort, request
+import re
+import timeit
+import itertools
+from flask import abort, current_app, request, stream_with_context
 from flask.views import MethodView
-from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.exc import DataError, OperationalError, ProgrammingError
+from past.builtins import basestring
 
-from explicates.core import search
-from explicates.api.base import APIBase
+from explicates import codec
+from explicates.core import db, is_query_canceled, search, search_cache
+from explicates.api.base import APIBase, STREAM_BATCH_SIZE
+from explicates.diagnostics import QueryRecorder
+from explicates.jsonld import iterlines, jsonify
 from explicates.model.collection import Collection
 from explicates.model.annotation import Annotation
 
 
+#: The media type of newline delimited JSON.
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+#: The ways the total number of search results can be counted.
+COUNT_MODES = ['exact', 'estimated']
+
+
 class SearchAPI(APIBase, MethodView):
     """Search API class."""
 
@@ -23,19 +36,175 @@ class SearchAPI(APIBase, MethodView):
     def _filter_valid_params(self, data):
         """Return the valid search parameters."""
         valid_keys = ['contains', 'collection', 'fts', 'fts_phrase', 'limit',
-                      'range', 'order_by', 'offset', 'deleted']
+                      'range', 'order_by', 'offset', 'deleted', 'target',
+                      'motivation']
         return {k: v for k, v in data.items() if k in valid_keys}
 
+    def _get_canonical_params(self, params):
+        """Return the search parameters in a canonical form, as JSON.
+
+        JSON sent as a string in the query string is decoded, so that the
+        same search has the same form whether it is sent in the query string
+        or the request body, and whatever the order of its keys.
+        """
+        canonical = {}
+        for key, value in params.items():
+            if isinstance(value, basestring) and value[:1] in ['{', '[']:
+                try:
+                    value = codec.loads(value)
+                except ValueError:
+                    pass
+            elif not isinstance(value, (basestring, dict, list)):
+                value = str(value)
+            canonical[key] = value
+        return codec.dumps(canonical)
+
+    def _get_cache_key(self, params, count, count_only):
+        """Return the key for caching the results of a search."""
+        minimal, iris = self._get_container_preferences()
+        return (request.url_root, self._get_canonical_params(params),
+                request.args.get('page'), request.args.get('iris'), minimal,
+                iris, count, count_only)
+
+    def _get_count_mode(self, data):
+        """Return how the total number of results should be counted.
+
+        Totals are exact unless estimated totals are requested with the count
+        parameter or a Prefer: count=estimated header.
+        """
+        count = data.get('count')
+        if count is None:
+            headers = request.headers.getlist('Prefer')
+            prefs = [pref.strip() for header in headers
+                     for pref in re.split('[,;]', header)]
+            return 'estimated' if 'count=estimated' in prefs else 'exact'
+        elif count not in COUNT_MODES:
+            abort(400, 'invalid "count" parameter: {}'.format(count))
+        return count
+
+    def _is_count_only(self, data):
+        """Return True if only the total number of results was requested."""
+        return str(data.get('count_only', '')).lower() in ['1', 'true']
+
+    def _get_cache_namespace(self, params):
+        """Return the ID of the Collection that a search is limited to, if
+        any, so that its results can be invalidated when it changes."""
+        collection = params.get('collection')
+        if not collection:
+            return None
+        return search._get_collection_id(collection)
+
+    def _is_debug(self, data):
+        """Return True if diagnostics were requested for a search.
+
+        Only admins can request diagnostics.
+        """
+        if str(data.get('debug', '')).lower() not in ['1', 'true']:
+            return False
+        if not self._is_admin():
+            abort(403, 'debug requires an admin API key')
+        return True
+
+    def _is_ndjson(self, data):
+        """Return True if every result should be streamed as newline
+        delimited JSON, as requested by the format parameter or the Accept
+        header."""
+        if data.get('format') == 'ndjson':
+            return True
+        best = request.accept_mimetypes.best_match(
+            ['application/ld+json', 'application/json', NDJSON_MIMETYPE])
+        return best == NDJSON_MIMETYPE
+
+    def _is_streaming(self):
+        """Return True if the search results should be streamed.
+
+        Results are never streamed when debugging, so that every query is
+        recorded.
+        """
+        if getattr(self, '_debug', False):
+            return False
+        return super(SearchAPI, self)._is_streaming()
+
     def get(self):
-        """Search Annotations."""
+        """Search Annotations.
+
+        Results are cached, if enabled, until they expire or a Collection
+        that they could include is changed. Searches slower than the
+        SLOW_SEARCH_THRESHOLD are logged along with their query plans.
+        """
         data = request.args.to_dict(flat=True)
         if request.data:
-            data = json.loads(request.data.decode('utf8'))
+            data = codec.loads(request.data)
         params = self._filter_valid_params(data)
+        debug = self._is_debug(data)
+        if not debug and self._is_ndjson(data):
+            return self._ndjson_response(params, str(data.get('zip')) == '1')
+        count = self._get_count_mode(data)
+        count_only = self._is_count_only(data)
+        link_params = dict(params, count=data.get('count'))
+
+        key = self._get_cache_key(params, count, count_only)
+        namespace = self._get_cache_namespace(params)
+        # Clients that have just written skip the cache, which may hold
+        # results read from a replica that had not replayed their writes
+        skip_cache = debug or db.replicas.has_write_lsn()
+        cached = None if skip_cache else search_cache.get(namespace, key)
+        if cached is not None:
+            body, links = cached
+            response = current_app.response_class(body)
+            response.headers.extend([('Link', link) for link in links])
+            return self._finalize_jsonld_response(response)
+
+        self._set_statement_timeout('search')
+
+        # Streamed pages are only queried once the response is sent, so are
+        # not recorded, unless debugging
+        threshold = current_app.config.get('SLOW_SEARCH_THRESHOLD')
+        self._debug = debug
+        start = timeit.default_timer()
+        if debug or threshold is not None:
+            try:
+                with QueryRecorder(db.session.connection()) as recorder:
+                    response = self._search(params, link_params, count,
+                                            count_only)
+            except OperationalError as err:
+                if threshold is not None and is_query_canceled(err):
+                    elapsed = (timeit.default_timer() - start) * 1000
+                    self._log_slow_search(params, recorder, elapsed,
+                                          cancelled=True)
+                raise
+        else:
+            response = self._search(params, link_params, count, count_only)
+        elapsed = (timeit.default_timer() - start) * 1000
 
+        if debug:
+            return self._get_debug_response(params, recorder, elapsed)
+        elif threshold is not None and elapsed >= threshold:
+            self._log_slow_search(params, recorder, elapsed)
+
+        if request.method == 'GET' and not response.is_streamed:
+            body = response.get_data()
+            links = response.headers.getlist('Link')
+            ttl = db.replicas.get_cache_ttl()
+            if ttl is None or ttl > 0:
+                search_cache.set(namespace, key, (body, links), len(body),
+                                 ttl=ttl)
+        return response
+
+    def _search(self, params, link_params, count='exact', count_only=False):
+        """Return the JSON-LD Response for a search.
+
+        If count is 'estimated' the total is estimated by the query planner
+        rather than counted. If count_only is True the container is returned
+        without any pages of results.
+        """
+        # Count the results up front so that invalid queries fail here
         try:
-            results = search.search(**params)
-        except (ValueError, ProgrammingError) as err:
+            results = search.paginate(**params)
+            if count == 'estimated':
+                results = results.estimated()
+            total = len(results)
+        except (ValueError, DataError, ProgrammingError) as err:
             abort(400, err)
 
         tmp_collection = Collection(data={
@@ -44,6 +213,58 @@ class SearchAPI(APIBase, MethodView):
                 "BasicContainer"
             ]
         })
-        container = self._get_container(tmp_collection, items=results,
-                                        total=len(results), **params)
+        items = None if count_only else results
+        container = self._get_container(tmp_collection, items=items,
+                                        total=total,
+                                        approximate=results.approximate,
+                                        **link_params)
         return self._jsonld_response(container)
+
+    def _ndjson_response(self, params, _zip=False):
+        """Return a Response streaming every result of a search, with one
+        Annotation per line, optionally as a ZIP file.
+
+        The results are read from a server-side cursor as they are sent, so
+        are not cached. The first results are read up front so that invalid
+        queries still fail with an error response.
+        """
+        self._set_statement_timeout('search')
+        try:
+            results = search.paginate(**params)
+            rows = results.slice(0, None, yield_per=STREAM_BATCH_SIZE)
+            lines = iterlines(self._iter_page_items(rows))
+            first = list(itertools.islice(lines, 1))
+        except (ValueError, DataError, ProgrammingError) as err:
+            abort(400, err)
+
+        lines = itertools.chain(first, lines)
+        if _zip:
+            return self._zip_response('search', lines, ext='ndjson')
+        response = current_app.response_class(stream_with_context(lines),
+                                              mimetype=NDJSON_MIMETYPE)
+        response.headers.extend(self.headers)
+        return response
+
+    def _get_debug_response(self, params, recorder, elapsed):
+        """Return the compiled SQL, analyzed plan and timings of a search."""
+        out = dict(params=codec.loads(self._get_canonical_params(params)),
+                   queries=recorder.report(analyze=True),
+                   time=round(elapsed, 3))
+        response = jsonify(out)
+        response.headers.extend(self.headers)
+        return response
+
+    def _log_slow_search(self, params, recorder, elapsed, cancelled=False):
+        """Log the normalized parameters and plans of a slow search.
+
+        Plans cannot be explained in the failed transaction of a cancelled
+        search, so only the queries are logged.
+        """
+        lines = ['{0} search ({1:.1f} ms): {2}'.format(
+            'Cancelled' if cancelled else 'Slow', elapsed,
+            self._get_canonical_params(params))]
+        for query in recorder.report(explain=not cancelled):
+            lines.append('{0:.1f} ms: {1}'.format(query['time'],
+                                                  query['sql']))
+            lines.extend(query['plan'] or [])
+        current_app.logger.warning('\n'.join(lines))
@@ -0,0 +1,29 @@
+# -*- coding: utf8 -*-
+"""Stats API module."""
+
+from flask import abort
+from flask.views import MethodView
+
+from explicates.api.base import APIBase
+from explicates.bakery import statement_cache
+from explicates.core import render_cache, search_cache
+from explicates.jsonld import jsonify
+
+
+class StatsAPI(APIBase, MethodView):
+    """Stats API class."""
+
+    # Common headers for all responses
+    headers = {
+        'Allow': 'GET,OPTIONS,HEAD'
+    }
+
+    def get(self):
+        """Return the server's cache statistics, to admins only."""
+        if not self._is_admin():
+            abort(403, 'stats require an admin API key')
+        response = jsonify(dict(render_cache=render_cache.stats(),
+                                search_cache=search_cache.stats(),
+                                statement_cache=statement_cache.stats()))
+        response.headers.extend(self.headers)
+        return response
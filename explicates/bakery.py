@@ -0,0 +1,176 @@
+# -*- coding: utf8 -*-
+"""Baked query module.
+
+The queries run for every request are baked, so that each one is only built
+and compiled to SQL once per process, with the values that differ between
+requests bound as parameters. The SQL strings and the query contexts are
+held in a single least recently used cache.
+
+Note that the psycopg2 driver interpolates parameters on the client, so
+the statements are not prepared by the server.
+"""
+
+from sqlalchemy import util
+from sqlalchemy.ext import baked
+from sqlalchemy.orm import load_only
+from sqlalchemy.sql import bindparam
+
+from explicates.diagnostics import estimate_rows
+
+
+class StatementCache(util.LRUCache):
+    """A cache for baked queries that counts hits and misses."""
+
+    def __init__(self, capacity=200, threshold=0.5):
+        super(StatementCache, self).__init__(capacity, threshold)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        value = super(StatementCache, self).get(key, default)
+        if value is default:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def stats(self):
+        """Return the cache statistics."""
+        lookups = self.hits + self.misses
+        return dict(hits=self.hits, misses=self.misses,
+                    hit_rate=float(self.hits) / lookups if lookups else 0.0,
+                    statements=len(self))
+
+
+statement_cache = StatementCache()
+
+#: Create a new baked query, cached in the statement cache.
+bakery = baked.Bakery(baked.BakedQuery, statement_cache)
+
+
+def set_cache_size(size):
+    """Set the number of statements held in the cache."""
+    statement_cache.capacity = size
+
+
+class BakedResults(object):
+    """Lazily evaluated results of a baked query for domain objects.
+
+    Slices of the results are loaded with the offset and limit bound as
+    parameters, so that every page is loaded using the same statement. If
+    the total number of results is not given it is counted by the database.
+    Like a query, the results are truthy even if there are none.
+    """
+
+    #: True if the total number of results is an estimate.
+    approximate = False
+
+    def __init__(self, model_cls, bq, session, params=None, limit=None,
+                 offset=0, total=None):
+        self.model_cls = model_cls
+        self.bq = bq
+        self.session = session
+        self.params = params or {}
+        self.limit = limit
+        self.offset = offset
+        self._count = total
+        self._total = None
+
+    def __len__(self):
+        if self._total is None:
+            if self._count is None:
+                self._count = self._result(self.bq.with_criteria(
+                    lambda q: q.order_by(None))).count()
+            total = max(self._count - self.offset, 0)
+            if self.limit is not None:
+                total = min(total, self.limit)
+            self._total = total
+        return self._total
+
+    def __bool__(self):
+        return True
+
+    __nonzero__ = __bool__
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, key):
+        """Return a slice of the results from the database."""
+        if not isinstance(key, slice):
+            raise TypeError('Results can only be sliced')
+        return self.slice(key.start, key.stop).all()
+
+    @property
+    def query(self):
+        """Return the query for all of the results, without baking it."""
+        return self._result(self.bq)._as_query()
+
+    def _result(self, bq, **params):
+        """Return the result of a baked query with the bound parameters."""
+        return bq(self.session).params(self.params, **params)
+
+    def _copy(self, bq):
+        """Return the same results for a different baked query."""
+        results = self.__class__.__new__(self.__class__)
+        results.__dict__.update(self.__dict__)
+        results.bq = bq
+        return results
+
+    def estimated(self):
+        """Return the same results, with their total estimated by the query
+        planner rather than counted."""
+        results = self._copy(self.bq)
+        query = self._result(self.bq.with_criteria(
+            lambda q: q.order_by(None)))._as_query()
+        results._count = estimate_rows(self.session,
+                                       query.with_labels().statement)
+        results._total = None
+        results.approximate = True
+        return results
+
+    def load_only(self, *attrs):
+        """Return the same results, loading only the given attributes."""
+        return self._copy(self.bq.with_criteria(
+            lambda q: q.options(load_only(*attrs)), attrs))
+
+    def slice(self, start, stop, yield_per=None):
+        """Return the baked result for a slice of the results.
+
+        If yield_per is given the rows are read from a server-side cursor,
+        that many at a time.
+        """
+        start = start or 0
+        if self.limit is not None:
+            stop = self.limit if stop is None else min(stop, self.limit)
+        if stop is not None and stop < start:
+            stop = start
+        bq = self.bq.with_criteria(
+            lambda q: q.offset(bindparam('page_offset')))
+        params = dict(page_offset=self.offset + start)
+        if stop is not None:
+            bq += lambda q: q.limit(bindparam('page_limit'))
+            params['page_limit'] = stop - start
+        if yield_per:
+            bq += (lambda q: q.yield_per(yield_per), yield_per)
+        return self._result(bq, **params)
+
+    def seek(self, direction, key, limit):
+        """Return up to limit results either side of a key, ordered by key
+        in the direction of travel."""
+        model_key = self.model_cls.key
+        if direction == 'after':
+            order_by = model_key
+            key_clause = model_key > bindparam('seek_key')
+        else:
+            order_by = model_key.desc()
+            key_clause = model_key < bindparam('seek_key')
+        bq = self.bq.with_criteria(
+            lambda q: q.order_by(None).order_by(order_by), model_key,
+            direction)
+        params = dict(seek_limit=limit)
+        if key is not None:
+            bq += (lambda q: q.filter(key_clause), model_key, direction)
+            params['seek_key'] = key
+        bq += lambda q: q.limit(bindparam('seek_limit'))
+        return self._result(bq, **params).all()
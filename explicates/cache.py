@@ -0,0 +1,130 @@
+# -*- coding: utf8 -*-
+"""Cache module.
+
+Rendered responses are cached against a namespace, such as a Collection ID, so
+that all entries for a namespace can be invalidated at once when it changes.
+Keys should also include a version that changes on every write, so that
+entries cached by other processes are never served once out of date, or else
+be given a time to live.
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from werkzeug.utils import import_string
+
+
+class NullCache(object):
+    """A cache that doesn't cache anything."""
+
+    def __init__(self, **kwargs):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes_cached = 0
+
+    def get(self, namespace, key):
+        """Return the cached value for a key, or None."""
+        self.misses += 1
+        return None
+
+    def set(self, namespace, key, value, size, ttl=None):
+        """Cache a value of the given size, in bytes.
+
+        If ttl is given the value expires after at most that many seconds.
+        """
+        pass
+
+    def invalidate(self, namespace):
+        """Remove all values cached for a namespace."""
+        pass
+
+    def stats(self):
+        """Return the cache statistics."""
+        lookups = self.hits + self.misses
+        return dict(hits=self.hits, misses=self.misses,
+                    hit_rate=float(self.hits) / lookups if lookups else 0.0,
+                    evictions=self.evictions,
+                    bytes_cached=self.bytes_cached)
+
+
+class LRUCache(NullCache):
+    """An in-process cache that evicts the least recently used values once
+    the total size of the cached values reaches max_bytes.
+
+    If ttl is given values expire that many seconds after they are set.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=None, **kwargs):
+        super(LRUCache, self).__init__(**kwargs)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._namespaces = {}
+        self._lock = threading.Lock()
+
+    def get(self, namespace, key):
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is not None and self._is_expired(entry):
+                self._remove((namespace, key))
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            del self._entries[(namespace, key)]
+            self._entries[(namespace, key)] = entry
+            self.hits += 1
+            return entry[0]
+
+    def set(self, namespace, key, value, size, ttl=None):
+        if size > self.max_bytes:
+            return
+        if self.ttl and (ttl is None or self.ttl < ttl):
+            ttl = self.ttl
+        with self._lock:
+            self._remove((namespace, key))
+            expires = time.time() + ttl if ttl is not None else None
+            self._entries[(namespace, key)] = (value, size, expires)
+            self._namespaces.setdefault(namespace, set()).add(key)
+            self.bytes_cached += size
+            while self.bytes_cached > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, namespace):
+        with self._lock:
+            for key in list(self._namespaces.get(namespace, [])):
+                self._remove((namespace, key))
+
+    def _is_expired(self, entry):
+        """Return True if an entry has outlived the time to live."""
+        expires = entry[2]
+        return expires is not None and expires <= time.time()
+
+    def _remove(self, entry_key):
+        """Remove an entry, if it exists."""
+        entry = self._entries.pop(entry_key, None)
+        if entry is None:
+            return
+        namespace, key = entry_key
+        self.bytes_cached -= entry[1]
+        keys = self._namespaces[namespace]
+        keys.discard(key)
+        if not keys:
+            del self._namespaces[namespace]
+
+
+CACHE_TYPES = {
+    'null': NullCache,
+    'lru': LRUCache
+}
+
+
+def create_cache(cache_type, **kwargs):
+    """Return a cache of the given type, or the class at an import path."""
+    cache_cls = CACHE_TYPES.get(cache_type or 'null')
+    if not cache_cls:
+        cache_cls = import_string(cache_type)
+    return cache_cls(**kwargs)
@@ -0,0 +1,152 @@
+# -*- coding: utf8 -*-
+"""JSON codec module.
+
+Encoding large AnnotationPages is one of the most expensive things the server
+does, so JSON is encoded and decoded using the fastest available library,
+falling back to the standard library json module. All codecs sort keys and
+produce equivalent JSON, although only the standard library codec escapes
+non-ASCII characters.
+"""
+
+from collections import OrderedDict
+from flask import json
+
+
+class JSONCodec(object):
+    """Codec for the standard library json module, via Flask's settings."""
+
+    def dumps(self, obj, pretty=False, default=None):
+        """Serialize obj to a JSON formatted str.
+
+        If given, default is called for objects that can't otherwise be
+        serialized, and should return a serializable version of the object
+        or raise a TypeError.
+        """
+        indent = 2 if pretty else None
+        separators = (', ', ': ') if pretty else (',', ':')
+        return json.dumps(obj, cls=_FallbackEncoder, fallback=default,
+                          indent=indent, separators=separators,
+                          sort_keys=True)
+
+    def loads(self, s):
+        """Deserialize a JSON document from a str or bytes.
+
+        Raises a ValueError if the document is not valid.
+        """
+        if isinstance(s, bytes):
+            s = s.decode('utf8')
+        return json.loads(s)
+
+
+class _FallbackEncoder(json.JSONEncoder):
+    """Flask's JSON encoder, trying a fallback for unknown objects first."""
+
+    def __init__(self, fallback=None, **kwargs):
+        super(_FallbackEncoder, self).__init__(**kwargs)
+        self.fallback = fallback
+
+    def default(self, o):
+        if self.fallback:
+            try:
+                return self.fallback(o)
+            except TypeError:
+                pass
+        return super(_FallbackEncoder, self).default(o)
+
+
+class OrjsonCodec(JSONCodec):
+    """Codec for orjson."""
+
+    def __init__(self):
+        import orjson
+        self.orjson = orjson
+
+    def dumps(self, obj, pretty=False, default=None):
+        option = self.orjson.OPT_SORT_KEYS
+        if pretty:
+            option |= self.orjson.OPT_INDENT_2
+        return self.orjson.dumps(obj, default=default,
+                                 option=option).decode('utf8')
+
+    def loads(self, s):
+        return self.orjson.loads(s)
+
+
+class RapidjsonCodec(JSONCodec):
+    """Codec for python-rapidjson."""
+
+    def __init__(self):
+        import rapidjson
+        self.rapidjson = rapidjson
+
+    def dumps(self, obj, pretty=False, default=None):
+        indent = 2 if pretty else None
+        return self.rapidjson.dumps(obj, default=default, indent=indent,
+                                    sort_keys=True, ensure_ascii=False)
+
+    def loads(self, s):
+        if isinstance(s, bytes):
+            s = s.decode('utf8')
+        return self.rapidjson.loads(s)
+
+
+class UjsonCodec(JSONCodec):
+    """Codec for ujson (5.0 or higher)."""
+
+    def __init__(self):
+        import ujson
+        self.ujson = ujson
+
+    def dumps(self, obj, pretty=False, default=None):
+        indent = 2 if pretty else 0
+        return self.ujson.dumps(obj, default=default, indent=indent,
+                                sort_keys=True, ensure_ascii=False,
+                                escape_forward_slashes=False)
+
+    def loads(self, s):
+        return self.ujson.loads(s)
+
+
+#: The available codecs, in order of preference.
+CODEC_TYPES = OrderedDict([
+    ('orjson', OrjsonCodec),
+    ('rapidjson', RapidjsonCodec),
+    ('ujson', UjsonCodec),
+    ('json', JSONCodec)
+])
+
+_codec = None
+
+
+def create_codec(codec_type=None):
+    """Return a codec of the given type, or the fastest one installed."""
+    if codec_type and codec_type != 'auto':
+        return CODEC_TYPES[codec_type]()
+    for codec_cls in CODEC_TYPES.values():
+        try:
+            return codec_cls()
+        except ImportError:
+            continue
+
+
+def set_codec(codec_type=None):
+    """Set the codec used by dumps and loads."""
+    global _codec
+    _codec = create_codec(codec_type)
+
+
+def get_codec():
+    """Return the codec used by dumps and loads."""
+    if _codec is None:
+        set_codec()
+    return _codec
+
+
+def dumps(obj, pretty=False, default=None):
+    """Serialize obj to a JSON formatted str."""
+    return get_codec().dumps(obj, pretty=pretty, default=default)
+
+
+def loads(s):
+    """Deserialize a JSON document from a str or bytes."""
+    return get_codec().loads(s)
@@ -2,13 +2,18 @@
 """Core module."""
 
 import os
-from flask import Flask, jsonify, _app_ctx_stack
+from flask import Flask, jsonify
 from werkzeug.exceptions import HTTPException
+from sqlalchemy.exc import OperationalError
 
 from explicates import default_settings
 from explicates.extensions import *
 
 
+#: The Postgres error code for cancelled statements.
+QUERY_CANCELED = '57014'
+
+
 def create_app():
     """Create app."""
     app = Flask(__name__)
@@ -17,6 +22,10 @@ def create_app():
     setup_repository(app)
     setup_search(app)
     setup_exporter(app)
+    setup_render_cache(app)
+    setup_search_cache(app)
+    setup_json_codec(app)
+    setup_statement_cache(app)
     setup_blueprint(app)
     setup_error_handler(app)
     setup_cors(app)
@@ -71,32 +80,9 @@ def setup_search(app):
 
 def setup_db(app):
     """Setup database."""
-    from explicates.model.indexes import indexes
-
-    def create_slave_session(db, bind):
-        slave = app.config.get('SQLALCHEMY_BINDS')['slave']
-        if slave == app.config.get('SQLALCHEMY_DATABASE_URI'):
-            return db.session
-        options = dict(bind=engine, scopefunc=_app_ctx_stack.__ident_func__)
-        slave_session = db.create_scoped_session(options=options)
-
-        for idx in indexes:
-            idx.create(bind=engine)
-
-        return slave_session
-
     db.app = app
     db.init_app(app)
-    db.slave_session = create_slave_session(db, bind='slave')
-    if db.slave_session is not db.session:
-        # flask-sqlalchemy does it already for default session db.session
-        @app.teardown_appcontext
-        def _shutdown_session(response_or_exc):  # pragma: no cover
-            if app.config['SQLALCHEMY_COMMIT_ON_TEARDOWN']:
-                if response_or_exc is None:
-                    db.slave_session.commit()
-            db.slave_session.remove()
-            return response_or_exc
+    app.after_request(db.replicas.set_write_lsn)
 
 
 def setup_error_handler(app):
@@ -104,9 +90,14 @@ def setup_error_handler(app):
     @app.errorhandler(Exception)
     def handle_error(e):
         code = 500
+        message = str(e)
         if isinstance(e, HTTPException):
             code = e.code
-        error_dict = dict(code=code, message=str(e))
+        elif is_query_canceled(e):
+            db.session.rollback()
+            code = 504
+            message = 'The query took too long and was cancelled'
+        error_dict = dict(code=code, message=message)
         response = jsonify(error_dict)
         response.status_code = code
 
@@ -116,6 +107,13 @@ def setup_error_handler(app):
         return response
 
 
+def is_query_canceled(e):
+    """Return True if an error is for a statement cancelled by Postgres,
+    such as when the statement timeout is reached."""
+    return isinstance(e, OperationalError) and \
+        getattr(e.orig, 'pgcode', None) == QUERY_CANCELED
+
+
 def setup_cors(app):
     """Setup CORS."""
     cors.init_app(app, resources=app.config.get('CORS_RESOURCES'))
@@ -126,3 +124,34 @@ def setup_exporter(app):
     global exporter
     from explicates.exporter import Exporter
     exporter = Exporter()
+
+
+def setup_render_cache(app):
+    """Setup render cache."""
+    global render_cache
+    from explicates.cache import create_cache
+    max_bytes = app.config.get('RENDER_CACHE_MAX_BYTES')
+    render_cache = create_cache(app.config.get('RENDER_CACHE_TYPE'),
+                                max_bytes=max_bytes)
+
+
+def setup_search_cache(app):
+    """Setup search cache."""
+    global search_cache
+    from explicates.cache import create_cache
+    search_cache = create_cache(app.config.get('SEARCH_CACHE_TYPE'),
+                                max_bytes=app.config.get(
+                                    'SEARCH_CACHE_MAX_BYTES'),
+                                ttl=app.config.get('SEARCH_CACHE_TTL'))
+
+
+def setup_json_codec(app):
+    """Setup JSON codec."""
+    from explicates.codec import set_codec
+    set_codec(app.config.get('JSON_CODEC'))
+
+
+def setup_statement_cache(app):
+    """Setup statement cache."""
+    from explicates.bakery import set_cache_size
+    set_cache_size(app.config.get('STATEMENT_CACHE_SIZE'))
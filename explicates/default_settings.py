@@ -5,6 +5,27 @@ PORT = 3000
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 STRICT_SLASHES = False
 ANNOTATIONS_PER_PAGE = 1000
+CURSOR_PAGINATION = False
+RENDER_CACHE_TYPE = 'null'
+RENDER_CACHE_MAX_BYTES = 64 * 1024 * 1024
+SEARCH_CACHE_TYPE = 'null'
+SEARCH_CACHE_MAX_BYTES = 64 * 1024 * 1024
+SEARCH_CACHE_TTL = 60
+STORE_ANNOTATION_JSONLD = False
+JSON_CODEC = 'auto'
+STREAM_PAGES = False
+STATEMENT_CACHE_SIZE = 200
+ADMIN_API_KEY = None
+SLOW_SEARCH_THRESHOLD = None
+STATEMENT_TIMEOUTS = {
+    'search': 10000,
+    'collections': 10000,
+    'export': 600000
+}
+REPLICA_BINDS = ['slave']
+REPLICA_POLICY = 'round_robin'
+REPLICA_MAX_LAG = 10
+REPLICA_LAG_CHECK_INTERVAL = 1
 CORS_RESOURCES = {
     r"/*": {
         "origins": "*",
@@ -22,6 +43,12 @@ CORS_RESOURCES = {
     }
 }
 FTS_DEFAULT = 'english'
+FTS_UNINDEXED_FIELDS = True
+FTS_RANK_FUNCTION = 'ts_rank_cd'
+FTS_RANK_WEIGHTS = {
+    'body': 1.0,
+    'target': 0.5
+}
 FTS_LANGUAGE_MAP = {
     'da': 'danish',
     'nl': 'dutch',
@@ -0,0 +1,115 @@
+# -*- coding: utf8 -*-
+"""Query diagnostics module.
+
+The statements executed on a connection can be recorded, along with how long
+each one took, so that they can be explained for slow requests. The number of
+rows a query will return can also be estimated from its plan, without running
+it.
+"""
+
+import timeit
+from sqlalchemy import event
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+from past.builtins import basestring
+
+from explicates import codec
+
+
+class Explain(Executable, ClauseElement):
+    """An EXPLAIN statement that returns the plan of a query as JSON."""
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, 'postgresql')
+def _compile_explain(element, compiler, **kwargs):
+    return 'EXPLAIN (FORMAT JSON) ' + compiler.process(element.statement,
+                                                       **kwargs)
+
+
+def estimate_rows(session, statement):
+    """Return the number of rows that the query planner estimates a
+    statement will return."""
+    plan = session.execute(Explain(statement)).scalar()
+    if isinstance(plan, basestring):
+        plan = codec.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class QueryRecorder(object):
+    """Records the statements executed on a connection while in use as a
+    context manager, including any that fail."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.queries = []
+        self._started = {}
+
+    def __enter__(self):
+        event.listen(self.connection, 'before_cursor_execute', self._before)
+        event.listen(self.connection, 'after_cursor_execute', self._after)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.connection, 'before_cursor_execute', self._before)
+        event.remove(self.connection, 'after_cursor_execute', self._after)
+
+        # Statements that raised are timed until they were abandoned
+        now = timeit.default_timer()
+        for statement, parameters, start in self._started.values():
+            self.queries.append((statement, parameters, (now - start) * 1000))
+        self._started.clear()
+
+    def _before(self, conn, cursor, statement, parameters, context,
+                executemany):
+        self._started[id(cursor)] = (statement, parameters,
+                                     timeit.default_timer())
+
+    def _after(self, conn, cursor, statement, parameters, context,
+               executemany):
+        statement, parameters, start = self._started.pop(id(cursor))
+        elapsed = (timeit.default_timer() - start) * 1000
+        self.queries.append((statement, parameters, elapsed))
+
+    @property
+    def time(self):
+        """Return the total time spent executing statements, in ms."""
+        return sum(query[2] for query in self.queries)
+
+    def report(self, analyze=False, explain=True):
+        """Return the SQL, plan and time of each recorded query.
+
+        If analyze is True the queries are run again to measure each step of
+        the plan, so this should only be used for read-only queries. If
+        explain is False no plans are returned, as when the transaction has
+        failed.
+        """
+        return [dict(sql=self._get_sql(statement, parameters),
+                     plan=self._explain(statement, parameters, analyze)
+                     if explain else None,
+                     time=round(elapsed, 3))
+                for statement, parameters, elapsed in self.queries]
+
+    def _cursor(self):
+        """Return a DBAPI cursor for the connection, which runs statements
+        without them being recorded."""
+        return self.connection.connection.cursor()
+
+    def _get_sql(self, statement, parameters):
+        """Return a statement with its parameters, as sent to the database."""
+        cursor = self._cursor()
+        if not hasattr(cursor, 'mogrify'):  # pragma: no cover
+            return statement
+        sql = cursor.mogrify(statement, parameters)
+        return sql.decode('utf8') if isinstance(sql, bytes) else sql
+
+    def _explain(self, statement, parameters, analyze=False):
+        """Return the lines of a SELECT statement's plan."""
+        if not statement.lstrip().upper().startswith('SELECT'):
+            return None
+        options = '(ANALYZE, BUFFERS) ' if analyze else ''
+        cursor = self._cursor()
+        cursor.execute('EXPLAIN ' + options + statement, parameters)
+        return [row[0] for row in cursor.fetchall()]
@@ -1,18 +1,18 @@
 # -*- coding: utf8 -*-
 """Exporter module."""
 
-import json
 import string
+import itertools
 import tempfile
 import zipfile
 import unidecode
 from flask import current_app
-from sqlalchemy import and_
+from sqlalchemy import and_, case, select
 from werkzeug.utils import secure_filename
 from werkzeug.datastructures import FileStorage
 
 from explicates.core import repo, db
-from explicates.model.annotation import Annotation
+from explicates.model.annotation import Annotation, cache_collection_id
 from explicates.model.collection import Collection
 
 
@@ -26,9 +26,15 @@ class Exporter(object):
             table.c.deleted is not True
         ]
 
-        query = table.select().where(and_(*where_clauses))
-        exec_opts = dict(stream_results=True)
-        res = db.session.connection(execution_options=exec_opts).execute(query)
+        # The data is only needed for Annotations without stored JSON-LD
+        jsonld = table.c['_jsonld']
+        data = case([(jsonld.is_(None), table.c['_data'])]).label('_data')
+        columns = [col for col in table.c if col.name != '_data'] + [data]
+        query = select(columns).where(and_(*where_clauses))
+        # The session has already connected, so the options are set on the
+        # connection itself
+        conn = db.session.connection().execution_options(stream_results=True)
+        res = conn.execute(query)
         while True:
             chunk = res.fetchmany(10000)
             if not chunk:
@@ -40,13 +46,20 @@ class Exporter(object):
         """Return all Annotations as JSON-LD."""
         collection = repo.get_by(Collection, id=collection_id)
         data_gen = self._stream_annotation_data(collection)
+        cache_collection_id(collection)
+
+        # Fetch the first rows before anything is sent, so that errors
+        # running the query can still be returned
+        first_row = next(data_gen, None)
+        if first_row is not None:
+            data_gen = itertools.chain([first_row], data_gen)
         first = True
         yield '['
         for row in data_gen:
-            anno = Annotation(**dict(row))
-            anno.collection = collection
-            anno_dict = anno.dictize()
-            out = json.dumps(anno_dict)
+            jsonld = row.pop('_jsonld')
+            anno = Annotation(**row)
+            anno._jsonld = jsonld
+            out = anno.render_jsonld()
             yield out if first else ', ' + out
             first = False
         yield ']'
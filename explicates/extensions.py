@@ -1,13 +1,12 @@
 # -*- coding: utf8 -*-
 """Extensions module."""
 
-__all__ = ['db', 'cors', 'exporter']
+__all__ = ['db', 'cors', 'exporter', 'render_cache', 'search_cache']
 
 
 # DB
-from flask_sqlalchemy import SQLAlchemy
+from explicates.replicas import SQLAlchemy
 db = SQLAlchemy()
-db.slave_session = db.session
 
 # CORS
 from flask_cors import CORS
@@ -15,3 +14,9 @@ cors = CORS()
 
 # Exporter
 exporter = None
+
+# Render cache
+render_cache = None
+
+# Search cache
+search_cache = None
@@ -0,0 +1,65 @@
+# -*- coding: utf8 -*-
+"""IRI module.
+
+Building an IRI with Flask's url_for matches the endpoint's URL rule for
+every call, which adds up when generating IRIs for pages of thousands of
+Annotations. Instead, each rule is built once per app context, with
+placeholders for its arguments, and IRIs are then completed with plain string
+formatting.
+"""
+
+from flask import current_app, request, url_for, g, has_request_context
+from werkzeug.urls import url_encode
+
+
+class IRITemplate(object):
+    """A pre-built external IRI for an endpoint."""
+
+    def __init__(self, endpoint):
+        url_map = current_app.url_map
+        rule = next(url_map.iter_rules(endpoint))
+        self.arguments = sorted(rule.arguments)
+        self.converters = dict((arg, rule._converters[arg])
+                               for arg in self.arguments)
+        self.url_map = url_map
+
+        placeholders = dict((arg, 'iriplaceholder{}'.format(i))
+                            for i, arg in enumerate(self.arguments))
+        pattern = url_for(endpoint, _external=True, **placeholders)
+        pattern = pattern.replace('%', '%%')
+        for arg, placeholder in placeholders.items():
+            pattern = pattern.replace(placeholder, '%({})s'.format(arg))
+        self.pattern = pattern
+
+    def build(self, **values):
+        """Return the IRI, with any unknown values added to the query."""
+        args = {}
+        for arg in self.arguments:
+            args[arg] = self.converters[arg].to_url(values.pop(arg))
+        iri = self.pattern % args
+
+        query = [(k, v) for k, v in values.items() if v is not None]
+        if query:
+            iri += '?' + url_encode(query, charset=self.url_map.charset,
+                                    sort=self.url_map.sort_parameters,
+                                    key=self.url_map.sort_key)
+        return iri
+
+
+def get_template(endpoint):
+    """Return the IRI template for an endpoint in the current app context."""
+    root = request.url_root if has_request_context() else None
+    templates = g.setdefault('iri_templates', {})
+    template = templates.get((endpoint, root))
+    if not template:
+        template = IRITemplate(endpoint)
+        templates[(endpoint, root)] = template
+    return template
+
+
+def iri_for(endpoint, **values):
+    """Return the external IRI for an endpoint.
+
+    Equivalent to url_for(endpoint, _external=True, **values).
+    """
+    return get_template(endpoint).build(**values)
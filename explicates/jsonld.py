@@ -0,0 +1,148 @@
+# -*- coding: utf8 -*-
+"""JSON-LD module.
+
+Annotations can store their JSON-LD at write time, in which case it is
+spliced into responses as is, rather than being decoded and encoded again.
+The items in AnnotationPages can also be streamed, so that the whole page is
+never held in memory, as can lists of items as newline delimited JSON.
+"""
+
+import re
+import uuid
+import itertools
+from flask import current_app, stream_with_context
+
+from explicates import codec
+
+
+#: The minimum size of each chunk of streamed JSON.
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class RawJSON(object):
+    """A value that has already been serialized to JSON."""
+
+    def __init__(self, value):
+        self.value = value
+
+
+class JSONStream(object):
+    """A list whose items are only serialized as they are iterated."""
+
+    def __init__(self, items):
+        self.items = items
+
+
+def dumps(obj, pretty=False, default=None):
+    """Serialize obj to a JSON formatted str, including any RawJSON values."""
+    raw = []
+    token = uuid.uuid4().hex
+
+    def _default(o):
+        if isinstance(o, RawJSON):
+            raw.append(o.value)
+            return '{0}:{1}'.format(token, len(raw) - 1)
+        elif default:
+            return default(o)
+        raise TypeError('{} is not JSON serializable'.format(type(o)))
+
+    out = codec.dumps(obj, pretty=pretty, default=_default)
+    if not raw:
+        return out
+    pattern = r'"{0}:(\d+)"'.format(token)
+    return re.sub(pattern, lambda m: raw[int(m.group(1))], out)
+
+
+def iterdumps(obj, pretty=False, chunk_size=STREAM_CHUNK_SIZE):
+    """Serialize obj to JSON in chunks, including any RawJSON values.
+
+    The items of any JSONStream values are serialized as they are iterated.
+    The output is identical to dumps for the same items in a list.
+    """
+    return _iter_chunks(_iter_parts(obj, pretty), chunk_size)
+
+
+def iterlines(items, chunk_size=STREAM_CHUNK_SIZE):
+    """Serialize each item to JSON on its own line, in chunks, as newline
+    delimited JSON, including any RawJSON values."""
+    lines = (dumps(item) + '\n' for item in items)
+    return _iter_chunks(lines, chunk_size)
+
+
+def _iter_chunks(parts, chunk_size):
+    """Join parts of a str into chunks of at least chunk_size."""
+    chunk = []
+    size = 0
+    for part in parts:
+        chunk.append(part)
+        size += len(part)
+        if size >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        yield ''.join(chunk)
+
+
+def _iter_parts(obj, pretty=False):
+    """Serialize obj to JSON in parts, streaming any JSONStream values."""
+    streams = []
+    token = uuid.uuid4().hex
+
+    def default(o):
+        if isinstance(o, JSONStream):
+            streams.append(o)
+            n = len(streams) - 1
+            return ['{0}:{1}:first'.format(token, n),
+                    '{0}:{1}:last'.format(token, n)]
+        raise TypeError('{} is not JSON serializable'.format(type(o)))
+
+    out = dumps(obj, pretty=pretty, default=default)
+    positions = []
+    for n, stream in enumerate(streams):
+        first = out.index('"{0}:{1}:first"'.format(token, n))
+        positions.append((first, n, stream))
+
+    pos = 0
+    for first, n, stream in sorted(positions):
+        # Find the list written by the codec for two placeholder items, so
+        # that the streamed items are formatted the same way
+        last_marker = '"{0}:{1}:last"'.format(token, n)
+        last = out.index(last_marker)
+        start = out.rindex('[', 0, first)
+        end = out.index(']', last) + 1
+        opening = out[start:first]
+        separator = out[out.index('"', first + 1) + 1:last]
+        closing = out[last + len(last_marker):end]
+        indent = separator[separator.rfind('\n') + 1:] \
+            if '\n' in separator else ''
+
+        yield out[pos:start]
+        empty = True
+        for item in stream.items:
+            value = dumps(item, pretty=pretty)
+            if indent:
+                value = value.replace('\n', '\n' + indent)
+            yield (opening if empty else separator) + value
+            empty = False
+        yield '[]' if empty else closing
+        pos = end
+    yield out[pos:]
+
+
+def jsonify(obj, stream=False):
+    """Return a JSON response, as for flask.jsonify, for a dict that may
+    contain RawJSON values.
+
+    If stream is True the body is streamed, along with the items of any
+    JSONStream values.
+    """
+    pretty = current_app.config['JSONIFY_PRETTYPRINT_REGULAR'] or \
+        current_app.debug
+    mimetype = current_app.config['JSONIFY_MIMETYPE']
+    if stream:
+        chunks = itertools.chain(iterdumps(obj, pretty=pretty), ['\n'])
+        return current_app.response_class(stream_with_context(chunks),
+                                          mimetype=mimetype)
+    body = dumps(obj, pretty=pretty) + '\n'
+    return current_app.response_class(body, mimetype=mimetype)
@@ -1,19 +1,32 @@
 # -*- coding: utf8 -*-
 """Annotation model."""
 
-from flask import url_for, current_app
-from sqlalchemy.schema import Column, ForeignKey
-from sqlalchemy import Integer, String
+from flask import current_app, g, has_app_context
+from sqlalchemy.schema import Column, ForeignKey, Index
+from sqlalchemy import Integer, String, Text, event, select, bindparam, \
+    inspect
+from sqlalchemy.sql import and_
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext.baked import BakedQuery
+from sqlalchemy.orm import defer, undefer
 
+from explicates import codec
 from explicates.core import db
-from explicates.model.base import BaseDomainObject
+from explicates.iri import iri_for
+from explicates.model.base import BaseDomainObject, get_generated
 
 
 Base = declarative_base(cls=BaseDomainObject)
 
 
+#: Properties added when rendering, which must not be stored.
+RENDERED_PROPERTIES = ['id', 'generated']
+
+#: Properties that are only stored if not overridden by the Annotation data.
+COLUMN_PROPERTIES = ['created', 'modified', 'generator']
+
+
 def get_language(context):
     """Return the language to be used for full-text searches."""
     data = context.current_parameters.get('_data')
@@ -43,11 +56,42 @@ def get_language(context):
     return current_app.config['FTS_DEFAULT']
 
 
+def get_collection_ids(keys):
+    """Return a map of Collection keys to Collection IDs.
+
+    IDs are cached for the current app context so that rendering a page of
+    Annotations from many Collections issues at most one query.
+    """
+    from explicates.model.collection import Collection
+    cache = g.setdefault('collection_ids', {}) if has_app_context() else {}
+    missing = set(key for key in keys if key not in cache)
+    if missing:
+        query = db.session.query(Collection.key, Collection.id) \
+                          .filter(Collection.key.in_(missing))
+        cache.update(query.all())
+    return dict((key, cache.get(key)) for key in keys)
+
+
+def cache_collection_id(collection):
+    """Add a known Collection ID to the cache for the current app context."""
+    if has_app_context():
+        g.setdefault('collection_ids', {})[collection.key] = collection.id
+
+
 class Annotation(db.Model, Base):
     """An Annotation"""
 
     __tablename__ = 'annotation'
 
+    __table_args__ = (
+        Index('idx_annotation_collection_key', 'collection_key', 'key'),
+        Index('idx_annotation_collection_created', 'collection_key',
+              'created', 'key'),
+        Index('idx_annotation_created', 'created', postgresql_using='brin'),
+        Index('idx_annotation_data', '_data', postgresql_using='gin',
+              postgresql_ops={'_data': 'jsonb_path_ops'})
+    )
+
     #: The related Collection ID.
     collection_key = Column(Integer, ForeignKey('collection.key'),
                             nullable=False)
@@ -55,8 +99,133 @@ class Annotation(db.Model, Base):
     #: The language used for full-text searches.
     language = Column(String, nullable=False, default=get_language)
 
+    #: The Annotation data serialized at write time, if enabled.
+    _jsonld = Column(Text)
+
+    #: The columns needed to generate the Annotation's IRI.
+    iri_columns = ['key', 'id', 'collection_key']
+
+    @property
+    def collection_id(self):
+        """Return the related Collection ID without loading the Collection."""
+        if self.__dict__.get('collection') is not None:
+            return self.collection.id
+        if self.collection_key is None:
+            return None
+        return get_collection_ids([self.collection_key])[self.collection_key]
+
     @hybrid_property
     def iri(self):
         if self.id:
-            return url_for('api.annotations', collection_id=self.collection.id,
-                           annotation_id=self.id, _external=True)
+            return iri_for('api.annotations', collection_id=self.collection_id,
+                           annotation_id=self.id)
+
+    def store_jsonld(self):
+        """Store the serialized Annotation data.
+
+        Nothing is stored if the data overrides any of the column properties,
+        so that those Annotations are always dictized.
+        """
+        data = self._data or {}
+        if set(data).intersection(COLUMN_PROPERTIES):
+            self._jsonld = None
+            return
+        stored = dict((k, v) for k, v in data.items()
+                      if k not in RENDERED_PROPERTIES)
+        self._jsonld = codec.dumps(stored)
+
+    def render_jsonld(self):
+        """Return the Annotation as serialized JSON-LD.
+
+        Equivalent to serializing dictize(), using the stored data if
+        available.
+        """
+        if self._jsonld is None:
+            return codec.dumps(self.dictize())
+
+        out = {}
+        for name in ['created', 'modified']:
+            value = getattr(self, name)
+            if value:
+                out[name] = value
+        generator = current_app.config.get('GENERATOR')
+        if generator:
+            out['generator'] = generator
+        out['generated'] = get_generated()
+        out['id'] = self.iri
+        head = codec.dumps(out)
+        if self._jsonld == '{}':
+            return head
+        return head[:-1] + ',' + self._jsonld[1:]
+
+
+def _defer_data(query):
+    """Return an Annotation query that does not load the data."""
+    return query.options(defer(Annotation._data))
+
+
+def load_for_render(query):
+    """Return an Annotation query, or baked query, that loads only what is
+    needed to render the Annotations, when their data is stored at write
+    time.
+
+    The data of any Annotations without stored data must then be loaded with
+    load_unstored_data().
+    """
+    if not current_app.config.get('STORE_ANNOTATION_JSONLD'):
+        return query
+    elif isinstance(query, BakedQuery):
+        return query.with_criteria(_defer_data)
+    return _defer_data(query)
+
+
+def load_unstored_data(annotations):
+    """Load the deferred data of Annotations without stored JSON-LD.
+
+    The data is loaded for all of the Annotations at once, so that rendering
+    a page of them issues at most one more query.
+    """
+    keys = [annotation.key for annotation in annotations
+            if annotation._jsonld is None and
+            '_data' in inspect(annotation).unloaded]
+    if keys:
+        db.session.query(Annotation).filter(Annotation.key.in_(keys)) \
+                  .options(undefer(Annotation._data)).all()
+
+
+def store_annotation_jsonld(batch_size=1000):
+    """Store the serialized data for all Annotations that are missing it.
+
+    The modified time is left alone, as the Annotations are not changed.
+    """
+    table = Annotation.__table__
+    data_col = table.c['_data']
+    jsonld_col = table.c['_jsonld']
+    update = table.update() \
+        .where(table.c.key == bindparam('row_key')) \
+        .values(_jsonld=bindparam('row_jsonld'), modified=table.c.modified)
+    last_key = 0
+    while True:
+        query = select([table.c.key, data_col]) \
+            .where(and_(jsonld_col.is_(None), table.c.key > last_key)) \
+            .order_by(table.c.key) \
+            .limit(batch_size)
+        rows = db.session.execute(query).fetchall()
+        if not rows:
+            break
+        params = []
+        for row in rows:
+            annotation = Annotation(data=row[data_col])
+            annotation.store_jsonld()
+            if annotation._jsonld is not None:
+                params.append(dict(row_key=row.key,
+                                   row_jsonld=annotation._jsonld))
+        if params:
+            db.session.execute(update, params)
+        last_key = rows[-1].key
+
+
+@event.listens_for(Annotation._data, 'set')
+def _clear_stored_jsonld(target, value, oldvalue, initiator):
+    """Clear the stored JSON-LD whenever the Annotation data is changed."""
+    target._jsonld = None
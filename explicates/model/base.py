@@ -3,15 +3,61 @@
 
 import os
 import datetime
-from flask import url_for, current_app
+from flask import current_app, g, has_app_context
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.dialects.postgresql import JSONB
-from sqlalchemy import Integer, Text, Unicode, Boolean
+from sqlalchemy import Integer, Unicode, Boolean
 from sqlalchemy.schema import Column
 from sqlalchemy.inspection import inspect as sa_inspect
 
-from explicates.model.utils import make_timestamp, make_uuid
+from explicates.model.utils import make_timestamp, make_uuid, Timestamp
+
+
+#: Attributes that are never added to the dictized domain objects.
+PRIVATE_ATTRIBUTES = [
+    'key',
+    'id',
+    '_data',
+    '_jsonld',
+    'deleted',
+    'collection_key',
+    'annotation_count',
+    'version',
+    'data',
+    'iri',
+    'language'
+]
+
+_dictize_plans = {}
+
+
+def _get_dictize_plan(model_cls):
+    """Return the columns and hybrid properties to dictize for a model class.
+
+    Inspecting the model is relatively slow, so the plan is cached per class.
+    """
+    plan = _dictize_plans.get(model_cls)
+    if plan is None:
+        columns = [col.name for col in model_cls.__table__.c
+                   if col.name not in PRIVATE_ATTRIBUTES]
+        hybrids = [item.__name__
+                   for item in sa_inspect(model_cls).all_orm_descriptors
+                   if isinstance(item, hybrid_property) and
+                   item.__name__ not in PRIVATE_ATTRIBUTES]
+        add_generator = model_cls.__name__ == 'Annotation'
+        plan = (columns, hybrids, add_generator)
+        _dictize_plans[model_cls] = plan
+    return plan
+
+
+def get_generated():
+    """Return the generated timestamp, which is fixed for each app context."""
+    if not has_app_context():
+        return make_timestamp()
+    if 'generated' not in g:
+        g.generated = make_timestamp()
+    return g.generated
 
 
 class BaseDomainObject(object):
@@ -24,10 +70,10 @@ class BaseDomainObject(object):
     id = Column(Unicode, unique=True, default=make_uuid)
 
     #: The time at which the object was created.
-    created = Column(Text, default=make_timestamp)
+    created = Column(Timestamp, default=make_timestamp)
 
     #: The time at which the object was modified, after creation.
-    modified = Column(Text, onupdate=make_timestamp)
+    modified = Column(Timestamp, onupdate=make_timestamp)
 
     #: True if the object was deleted, False otherwise.
     deleted = Column(Boolean, default=False)
@@ -43,50 +89,44 @@ class BaseDomainObject(object):
     def data(self, data):
         self._data = data
 
+    #: The columns needed to generate the object's IRI.
+    iri_columns = ['key', 'id']
+
     def dictize(self):
         """Return the domain object as a dictionary."""
-        private = [
-            'key',
-            'id',
-            '_data',
-            'deleted',
-            'collection_key',
-            'data',
-            'iri',
-            'language'
-        ]
+        columns, hybrids, add_generator = _get_dictize_plan(self.__class__)
         out = {}
 
         # Add column values
-        for col in self.__table__.c:
-            obj = getattr(self, col.name)
-            if not obj or col.name in private:
+        for name in columns:
+            obj = getattr(self, name)
+            if not obj:
                 continue
             elif isinstance(obj, datetime.datetime):
                 obj = obj.isoformat()
-            out[col.name] = obj
+            out[name] = obj
 
         # Add default generator to Annotations
-        generator = current_app.config.get('GENERATOR')
-        if generator and self.__class__.__name__ == 'Annotation':
-            out['generator'] = generator
+        if add_generator:
+            generator = current_app.config.get('GENERATOR')
+            if generator:
+                out['generator'] = generator
 
         # Add data
         if self._data:
             out.update(self._data)
 
         # Add hybrid properties
-        for item in sa_inspect(self.__class__).all_orm_descriptors:
-            if type(item) == hybrid_property and item.__name__ not in private:
-                obj = getattr(self, item.__name__)
-                out[item.__name__] = obj
+        for name in hybrids:
+            out[name] = getattr(self, name)
 
         # Add generated
-        out['generated'] = make_timestamp()
+        out['generated'] = get_generated()
 
         # Add ID
-        if self.iri:
-            out['id'] = self.iri
+        iri = self.iri
+        if iri:
+            out['id'] = iri
 
         return out
 
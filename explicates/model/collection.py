@@ -1,13 +1,15 @@
 # -*- coding: utf8 -*-
 """Collection model."""
 
-from flask import url_for
-from sqlalchemy import func, and_
+from sqlalchemy import Integer, func, event, select
+from sqlalchemy.schema import Column
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.ext.hybrid import hybrid_property
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, object_session
+from sqlalchemy.inspection import inspect as sa_inspect
 
 from explicates.core import db
+from explicates.iri import iri_for
 from explicates.model.base import BaseDomainObject
 from explicates.model.annotation import Annotation
 
@@ -23,23 +25,80 @@ class Collection(db.Model, Base):
     annotations = relationship(Annotation, backref='collection',
                                lazy='dynamic')
 
+    #: The number of non-deleted Annotations, maintained on write.
+    annotation_count = Column(Integer, nullable=False, default=0,
+                              server_default='0')
+
+    #: Incremented whenever the Collection or any of its Annotations change.
+    version = Column(Integer, nullable=False, default=0, server_default='0')
+
     @hybrid_property
     def total(self):
-        count_q = func.count(Annotation.id) \
-                      .filter(Annotation.deleted == False) \
-                      .filter(Annotation.collection_key == self.key)
-        return db.session.execute(db.session.query(count_q)).scalar()
+        return self.annotation_count or 0
 
     @total.expression
     def total(cls):
-        return (select([func.count(Annotation.id)]).
-                and_(
-                    where(Annotation.collection_key == cls.key),
-                    where(Annotation.deleted == False)).
-                label("total"))
+        return cls.annotation_count
 
     @hybrid_property
     def iri(self):
         if self.id:
-            return url_for('api.collections', collection_id=self.id,
-                           _external=True)
+            return iri_for('api.collections', collection_id=self.id)
+
+
+def _update_annotation_count(connection, collection_key, delta):
+    """Add delta to the stored Annotation count for a Collection.
+
+    The Collection version is also incremented, while the modified time is
+    left alone, as it would be by the ORM.
+    """
+    table = Collection.__table__
+    n = table.c.annotation_count + delta
+    connection.execute(table.update()
+                            .where(table.c.key == collection_key)
+                            .values(annotation_count=n,
+                                    version=table.c.version + 1,
+                                    modified=table.c.modified))
+
+
+@event.listens_for(Annotation, 'after_insert')
+def _count_inserted_annotation(mapper, connection, target):
+    """Increment the Annotation count when an Annotation is created."""
+    delta = 0 if target.deleted else 1
+    _update_annotation_count(connection, target.collection_key, delta)
+
+
+@event.listens_for(Annotation, 'after_update')
+def _count_updated_annotation(mapper, connection, target):
+    """Update the Annotation count when an Annotation is changed."""
+    session = object_session(target)
+    if not session.is_modified(target, include_collections=False):
+        return
+    history = sa_inspect(target).attrs.deleted.history
+    was_deleted = bool(history.deleted[0]) if history.deleted \
+        else bool(target.deleted)
+    delta = 0
+    if bool(target.deleted) != was_deleted:
+        delta = 1 if was_deleted else -1
+    _update_annotation_count(connection, target.collection_key, delta)
+
+
+@event.listens_for(Collection, 'before_update')
+def _increment_version(mapper, connection, target):
+    """Increment the Collection version when the Collection is changed."""
+    session = object_session(target)
+    if session.is_modified(target, include_collections=False):
+        target.version = Collection.version + 1
+
+
+def recount_annotations():
+    """Recompute the stored Annotation counts for all Collections."""
+    collection = Collection.__table__
+    annotation = Annotation.__table__
+    count_q = select([func.count(annotation.c.key)]) \
+        .where(annotation.c.collection_key == collection.c.key) \
+        .where(annotation.c.deleted == False) \
+        .as_scalar()
+    db.session.execute(collection.update()
+                                 .values(annotation_count=count_q,
+                                         modified=collection.c.modified))
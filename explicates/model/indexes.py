@@ -1,15 +1,42 @@
 # -*- coding: utf8 -*-
-"""Indexes."""
+"""Indexes.
 
+Full-text searches are supported by GIN indexes on the tsvector of each
+searchable field of the Annotation data, built using the dictionary for each
+Annotation's language. Search queries must use exactly the same expressions,
+as returned by get_fts_vector, for the indexes to be used.
+"""
+
+from sqlalchemy import DDL, event, func
 from sqlalchemy.schema import Index
-from sqlalchemy.sql import text
+
+from explicates.model.annotation import Annotation
+
+
+#: The fields of the Annotation data that are indexed for full-text search.
+FTS_FIELDS = ['body', 'target']
+
+#: Casts a language to a regconfig. Unlike a plain cast, the function is
+#: immutable, so it can be used in an index.
+lang_cast = DDL("""
+    CREATE OR REPLACE FUNCTION lang_cast(VARCHAR) RETURNS regconfig
+        AS 'select cast($1 as regconfig)'
+        LANGUAGE SQL
+        IMMUTABLE
+        RETURNS NULL ON NULL INPUT;
+""")
+
+event.listen(Annotation.__table__, 'before_create', lang_cast)
+
+
+def get_fts_vector(field):
+    """Return the indexed tsvector expression for a full-text search field."""
+    return func.to_tsvector(func.lang_cast(Annotation.language),
+                            Annotation._data[field])
 
 
 indexes = [
-    Index('idx_annotation_body',
-          text("to_tsvector(language::regconfig, _data -> 'body')"),
-          postgresql_using='gin'),
-    Index('idx_annotation_target',
-          text("to_tsvector(language::regconfig, _data -> 'target')"),
+    Index('idx_annotation_{}'.format(field), get_fts_vector(field),
           postgresql_using='gin')
+    for field in FTS_FIELDS
 ]
@@ -0,0 +1,110 @@
+# -*- coding: utf8 -*-
+"""Annotation projection model.
+
+The target IRIs, motivations and body types of each Annotation are copied to
+their own rows when the Annotation is written, so that Annotations can be
+looked up by them using ordinary indexes rather than by searching the data.
+"""
+
+from sqlalchemy.schema import Column, ForeignKey, Index
+from sqlalchemy import Integer, Unicode, select
+from past.builtins import basestring
+
+from explicates.core import db
+from explicates.model.annotation import Annotation
+
+
+class AnnotationProjection(db.Model):
+    """A projected property of an Annotation."""
+
+    __tablename__ = 'annotation_projection'
+
+    __table_args__ = (
+        Index('idx_annotation_projection_value', 'name', 'value',
+              postgresql_ops={'value': 'text_pattern_ops'}),
+    )
+
+    #: The related Annotation key.
+    annotation_key = Column(Integer,
+                            ForeignKey('annotation.key', ondelete='CASCADE'),
+                            primary_key=True)
+
+    #: The name of the property.
+    name = Column(Unicode, primary_key=True)
+
+    #: The normalized value of the property.
+    value = Column(Unicode, primary_key=True)
+
+
+def normalize_iri(iri):
+    """Return an IRI without any fragment."""
+    return iri.split('#')[0]
+
+
+def _as_list(value):
+    """Return a single value or list of values as a list."""
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _get_target_iris(target):
+    """Return the IRIs of a target and, for specific resources, its
+    source."""
+    if isinstance(target, basestring):
+        return [target]
+    elif not isinstance(target, dict):
+        return []
+    iris = [target.get('id')]
+    source = target.get('source')
+    iris.append(source.get('id') if isinstance(source, dict) else source)
+    return [iri for iri in iris if isinstance(iri, basestring)]
+
+
+def get_projection(data):
+    """Return the projected (name, value) pairs for Annotation data."""
+    data = data or {}
+    pairs = set()
+    for target in _as_list(data.get('target')):
+        for iri in _get_target_iris(target):
+            pairs.add(('target', normalize_iri(iri)))
+    for motivation in _as_list(data.get('motivation')):
+        if isinstance(motivation, basestring):
+            pairs.add(('motivation', motivation))
+    for body in _as_list(data.get('body')):
+        if isinstance(body, dict):
+            for body_type in _as_list(body.get('type')):
+                if isinstance(body_type, basestring):
+                    pairs.add(('body_type', body_type))
+    if 'bodyValue' in data:
+        pairs.add(('body_type', 'TextualBody'))
+    return sorted(pairs)
+
+
+def store_projection(annotation_key, data):
+    """Replace the projected properties stored for an Annotation."""
+    table = AnnotationProjection.__table__
+    db.session.execute(table.delete()
+                            .where(table.c.annotation_key == annotation_key))
+    rows = [dict(annotation_key=annotation_key, name=name, value=value)
+            for name, value in get_projection(data)]
+    if rows:
+        db.session.execute(table.insert(), rows)
+
+
+def store_annotation_projections(batch_size=1000):
+    """Store the projected properties for all Annotations."""
+    table = Annotation.__table__
+    data_col = table.c['_data']
+    last_key = 0
+    while True:
+        query = select([table.c.key, data_col]) \
+            .where(table.c.key > last_key) \
+            .order_by(table.c.key) \
+            .limit(batch_size)
+        rows = db.session.execute(query).fetchall()
+        if not rows:
+            break
+        for row in rows:
+            store_projection(row.key, row[data_col])
+        last_key = rows[-1].key
@@ -3,11 +3,38 @@
 
 import uuid
 from datetime import datetime
+from sqlalchemy.types import DateTime, TypeDecorator
+
+
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
 
 
 def make_timestamp():
     """Return timestamp expressed in the UTC xsd:datetime format."""
-    return datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+    return datetime.utcnow().strftime(TIMESTAMP_FORMAT)
+
+
+def parse_timestamp(timestamp):
+    """Return the datetime for a timestamp returned by make_timestamp."""
+    return datetime.strptime(timestamp, TIMESTAMP_FORMAT)
+
+
+class Timestamp(TypeDecorator):
+    """A timestamp stored as a timestamptz and loaded in the xsd:datetime
+    format returned by make_timestamp.
+
+    Strings are passed to the database as they are, so that timestamps in
+    any format understood by PostgreSQL can be compared with the column.
+    """
+
+    impl = DateTime(timezone=True)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        if value.utcoffset() is not None:
+            value = value - value.utcoffset()
+        return value.strftime(TIMESTAMP_FORMAT)
 
 
 def make_uuid():
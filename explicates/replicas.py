@@ -0,0 +1,218 @@
+# -*- coding: utf8 -*-
+"""Read replica module.
+
+Statements run for GET and HEAD requests are sent to one of the replicas
+named in REPLICA_BINDS, chosen according to REPLICA_POLICY. Replicas that are
+more than REPLICA_MAX_LAG seconds behind the primary, or that cannot be
+reached, are skipped and the primary is used if none are left.
+
+After a client writes, the position of the primary's write-ahead log is sent
+back to it in a cookie. While the cookie is set, reads for that client are
+only sent to replicas that have replayed up to that position, so that it
+always sees its own writes. Data read from replicas is only cached for as
+long as it could be missing a client's writes after its cookie has expired.
+"""
+
+import re
+import math
+import random
+import timeit
+import itertools
+from flask import current_app, request, _request_ctx_stack
+from flask_sqlalchemy import SQLAlchemy as BaseSQLAlchemy, SignallingSession
+from sqlalchemy import orm, text
+from sqlalchemy.exc import DBAPIError
+
+
+#: The request methods that are read from replicas.
+READ_METHODS = ('GET', 'HEAD')
+
+#: The request methods after which the write position is returned.
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+#: The cookie holding the write position of a client's last write.
+LSN_COOKIE = 'explicates_lsn'
+
+LSN_PATTERN = re.compile(r'^[0-9A-F]{1,8}/[0-9A-F]{1,8}$', re.IGNORECASE)
+
+#: The seconds since a replica last replayed a write, or 0 if it is not a
+#: replica or has replayed everything it has received.
+LAG_SQL = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+""")
+
+REPLAYED_SQL = text("""
+    SELECT NOT pg_is_in_recovery()
+        OR pg_last_wal_replay_lsn() >= CAST(:lsn AS pg_lsn)
+""")
+
+CURRENT_LSN_SQL = text('SELECT CAST(pg_current_wal_lsn() AS text)')
+
+
+class ReplicaRouter(object):
+    """Chooses the replica to read from for each request."""
+
+    def __init__(self, db):
+        self.db = db
+        self._lags = {}
+        self._counter = itertools.count()
+
+    def _get_binds(self):
+        """Return the configured replica binds that are not the primary."""
+        primary = current_app.config.get('SQLALCHEMY_DATABASE_URI')
+        uris = current_app.config.get('SQLALCHEMY_BINDS') or {}
+        return [bind for bind in current_app.config.get('REPLICA_BINDS') or []
+                if uris.get(bind) not in (None, primary)]
+
+    def _execute(self, bind, statement, **params):
+        """Return the result of a statement run outside of any session."""
+        engine = self.db.get_engine(current_app, bind=bind)
+        with engine.connect() as conn:
+            return conn.execute(statement, **params).scalar()
+
+    def get_lag(self, bind):
+        """Return the number of seconds a replica is behind the primary, or
+        None if it cannot be reached.
+
+        Each replica is checked at most once every REPLICA_LAG_CHECK_INTERVAL
+        seconds.
+        """
+        interval = current_app.config.get('REPLICA_LAG_CHECK_INTERVAL')
+        engine = self.db.get_engine(current_app, bind=bind)
+        now = timeit.default_timer()
+        checked = self._lags.get(engine)
+        if checked and now - checked[0] < interval:
+            return checked[1]
+        try:
+            lag = self._execute(bind, LAG_SQL)
+        except DBAPIError as e:
+            current_app.logger.warning('Replica %s unavailable: %s', bind, e)
+            lag = None
+        if lag is not None:
+            lag = float(lag)
+        self._lags[engine] = (now, lag)
+        return lag
+
+    def _has_replayed(self, bind, lsn):
+        """Return True if a replica has replayed up to a write position."""
+        try:
+            return self._execute(bind, REPLAYED_SQL, lsn=lsn)
+        except DBAPIError:
+            return False
+
+    def _order(self, lags):
+        """Return the replicas in the order they should be tried."""
+        binds = sorted(lags)
+        policy = current_app.config.get('REPLICA_POLICY')
+        if policy == 'round_robin':
+            start = next(self._counter) % len(binds) if binds else 0
+            return binds[start:] + binds[:start]
+        elif policy == 'random':
+            random.shuffle(binds)
+            return binds
+        elif policy == 'least_lag':
+            return sorted(binds, key=lambda bind: lags[bind])
+        raise ValueError('Invalid REPLICA_POLICY: {}'.format(policy))
+
+    def choose(self, lsn=None):
+        """Return the bind of the replica to read from, or None to read from
+        the primary.
+
+        If the position of a write is given only replicas that have replayed
+        it are chosen.
+        """
+        max_lag = current_app.config.get('REPLICA_MAX_LAG')
+        lags = {}
+        for bind in self._get_binds():
+            lag = self.get_lag(bind)
+            if lag is not None and (max_lag is None or lag <= max_lag):
+                lags[bind] = lag
+        for bind in self._order(lags):
+            if lsn is None or self._has_replayed(bind, lsn):
+                return bind
+        return None
+
+    def _get_write_lsn(self):
+        """Return the position of the client's last write, if valid."""
+        lsn = request.cookies.get(LSN_COOKIE)
+        if lsn and LSN_PATTERN.match(lsn):
+            return lsn
+        return None
+
+    def has_write_lsn(self):
+        """Return True if the client has written recently."""
+        return self._get_write_lsn() is not None
+
+    def get_cache_ttl(self):
+        """Return how many seconds data read for the current request can be
+        cached, or None if there is no limit.
+
+        Data read from a replica that may not have replayed a client's
+        writes must expire before the client's write position cookie does,
+        so that the client never reads it from the cache.
+        """
+        ctx = _request_ctx_stack.top
+        bind = getattr(ctx, 'replica_bind', None)
+        if bind is None or self._get_write_lsn() is not None:
+            return None
+        max_lag = current_app.config.get('REPLICA_MAX_LAG')
+        lag = self.get_lag(bind)
+        if max_lag is None or lag is None:
+            return 0
+        return max(max_lag - lag, 0)
+
+    def get_engine(self):
+        """Return the engine to read from for the current request, or None
+        if it should use the primary.
+
+        The replica is chosen once per request.
+        """
+        ctx = _request_ctx_stack.top
+        if ctx is None or ctx.request.method not in READ_METHODS:
+            return None
+        if not hasattr(ctx, 'replica_bind'):
+            ctx.replica_bind = self.choose(self._get_write_lsn())
+        if ctx.replica_bind is None:
+            return None
+        return self.db.get_engine(current_app, bind=ctx.replica_bind)
+
+    def set_write_lsn(self, response):
+        """Send the primary's write position to a client that has written."""
+        if request.method not in WRITE_METHODS or \
+                response.status_code >= 400 or not self._get_binds():
+            return response
+        lsn = self.db.session.execute(CURRENT_LSN_SQL).scalar()
+        max_lag = current_app.config.get('REPLICA_MAX_LAG')
+        max_age = int(math.ceil(max_lag)) if max_lag is not None else None
+        response.set_cookie(LSN_COOKIE, lsn, max_age=max_age, httponly=True)
+        return response
+
+
+class RoutingSession(SignallingSession):
+    """A session that reads from a replica during read-only requests."""
+
+    def __init__(self, db, **options):
+        self.db = db
+        super(RoutingSession, self).__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if not self._flushing:
+            engine = self.db.replicas.get_engine()
+            if engine is not None:
+                return engine
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+class SQLAlchemy(BaseSQLAlchemy):
+    """Flask-SQLAlchemy with reads routed to replicas."""
+
+    def __init__(self, *args, **kwargs):
+        self.replicas = ReplicaRouter(self)
+        super(SQLAlchemy, self).__init__(*args, **kwargs)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
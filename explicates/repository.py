@@ -2,12 +2,20 @@
 """Repository module."""
 
 import json
-from sqlalchemy import func
-from sqlalchemy.sql import and_, or_
+from flask import current_app
+from sqlalchemy import func, inspect, select
+from sqlalchemy.sql import and_, or_, bindparam
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import RelationshipProperty
 from sqlalchemy.orm.base import _entity_descriptor
 from future.utils import iteritems
 
+from explicates.bakery import bakery
+from explicates.model.annotation import Annotation
+from explicates.model.collection import Collection
+from explicates.model.projection import store_projection
+from explicates.model.utils import make_timestamp
+
 
 class Repository(object):
     """Repository class for all domain objects."""
@@ -20,12 +28,57 @@ class Repository(object):
         return self.db.session.query(model_cls).get(key)
 
     def get_by(self, model_cls, **attrs):
-        """Get an object by given attributes."""
-        return self.db.session.query(model_cls).filter_by(**attrs).first()
+        """Get an object by given attributes.
+
+        The query is baked for each model class and set of attribute names,
+        with the values bound as parameters.
+        """
+        filters = self._get_filters(model_cls, attrs)
+        criteria = tuple((param, value is None)
+                         for _, param, value in filters)
+
+        def filter_by(query):
+            clauses = [col.is_(None) if value is None
+                       else col == bindparam(param)
+                       for col, param, value in filters]
+            return query.filter(*clauses)
+
+        bq = bakery(lambda session: session.query(model_cls), model_cls)
+        bq += (filter_by, criteria)
+        params = {param: value for _, param, value in filters
+                  if value is not None}
+        return bq(self.db.session()).params(params).first()
+
+    def _get_filters(self, model_cls, attrs):
+        """Return the (column, param, value) to filter by for each attribute.
+
+        Related objects are filtered by their foreign keys.
+        """
+        mapper = inspect(model_cls)
+        filters = []
+        for name in sorted(attrs):
+            value = attrs[name]
+            prop = mapper.get_property(name)
+            if not isinstance(prop, RelationshipProperty):
+                filters.append((getattr(model_cls, name), name, value))
+                continue
+            for local, remote in prop.local_remote_pairs:
+                related_value = None
+                if value is not None:
+                    related_attr = prop.mapper.get_property_by_column(remote)
+                    related_value = getattr(value, related_attr.key)
+                param = '{0}_{1}'.format(name, local.key)
+                filters.append((local, param, related_value))
+        return filters
 
     def filter_by(self, model_cls, **attrs):
         """Get all objects filtered by given attributes."""
-        return self.db.session.query(model_cls).filter_by(**attrs).all()
+        return self.db.session.query(model_cls).filter_by(**attrs) \
+                                               .order_by(model_cls.key).all()
+
+    def query_by(self, model_cls, **attrs):
+        """Return a query for all objects filtered by given attributes."""
+        return self.db.session.query(model_cls).filter_by(**attrs)
 
     def count(self, model_cls):
         """Count all non-deleted objects."""
@@ -35,8 +88,11 @@ class Repository(object):
     def save(self, model_cls, obj):
         """Save an object."""
         self._validate_can_be(model_cls, 'saved', obj)
+        self._store_jsonld(obj)
         try:
             self.db.session.add(obj)
+            self.db.session.flush()
+            self._store_projection(obj)
             self.db.session.commit()
         except IntegrityError as err:  # pragma: no cover
             self.db.session.rollback()
@@ -46,15 +102,35 @@ class Repository(object):
         """Update an object."""
         self._validate_can_be(model_cls, 'updated', obj)
         obj.modified
+        self._store_jsonld(obj)
         try:
             self.db.session.merge(obj)
+            self._store_projection(obj)
             self.db.session.commit()
         except IntegrityError as err:  # pragma: no cover
             self.db.session.rollback()
             raise err
 
+    def _store_jsonld(self, obj):
+        """Store the serialized data for Annotations, if enabled."""
+        if not isinstance(obj, Annotation):
+            return
+        if current_app.config.get('STORE_ANNOTATION_JSONLD'):
+            obj.store_jsonld()
+
+    def _store_projection(self, obj):
+        """Store the projected properties for Annotations, in the same
+        transaction as the Annotation."""
+        if not isinstance(obj, Annotation):
+            return
+        store_projection(obj.key, obj.data)
+
     def delete(self, model_cls, key):
-        """Mark an object as deleted."""
+        """Mark an object as deleted.
+
+        Any projected properties are kept, as deleted Annotations can still
+        be searched for.
+        """
         obj = self.db.session.query(model_cls).get(key)
         obj.deleted = True
         try:
@@ -65,9 +141,16 @@ class Repository(object):
             raise err
 
     def batch_delete(self, model_cls, ids):
-        """Mark a list of objects as deleted."""
+        """Mark a list of objects as deleted.
+
+        Returns the IDs of any Collections that contained deleted Annotations.
+        """
         batch_clause = self._get_batch_clause(model_cls, ids)
+        collection_ids = []
         try:
+            if model_cls is Annotation:
+                collection_ids = \
+                    self._update_batch_annotation_counts(batch_clause)
             self.db.session.execute(model_cls.__table__.update()
                                                        .values(deleted=True)
                                                        .where(batch_clause))
@@ -75,6 +158,30 @@ class Repository(object):
         except IntegrityError as err:  # pragma: no cover
             self.db.session.rollback()
             raise err
+        return collection_ids
+
+    def _update_batch_annotation_counts(self, batch_clause):
+        """Decrement Collection counts for a batch of Annotations to delete.
+
+        Bulk updates bypass the ORM events that maintain the counts, so
+        this has to be done separately, in the same transaction. The
+        Collections are marked as modified, as when Annotations are deleted
+        individually. Returns the IDs of the updated Collections.
+        """
+        annotation = Annotation.__table__
+        collection = Collection.__table__
+        counts = select([annotation.c.collection_key,
+                         func.count(annotation.c.key).label('n')]) \
+            .where(and_(batch_clause, annotation.c.deleted == False)) \
+            .group_by(annotation.c.collection_key) \
+            .alias('counts')
+        n = collection.c.annotation_count - counts.c.n
+        query = collection.update() \
+            .values(annotation_count=n, version=collection.c.version + 1,
+                    modified=make_timestamp()) \
+            .where(collection.c.key == counts.c.collection_key) \
+            .returning(collection.c.id)
+        return [row.id for row in self.db.session.execute(query)]
 
     def _validate_batch_clause(self, model_cls, batch_clause, ids):
         """Confirm that all IDs exist for the batch clause."""
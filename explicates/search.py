@@ -2,11 +2,15 @@
 """Search module."""
 
 import json
-from sqlalchemy import func
-from sqlalchemy.sql import and_, or_
+import operator
+from flask import current_app
+from sqlalchemy import JSON, Unicode, func
+from sqlalchemy.sql import and_, bindparam, select
 from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.orm import contains_eager
 from sqlalchemy.orm.base import _entity_descriptor
 from future.utils import iteritems
+from past.builtins import basestring
 
 try:  # pragma: no cover
     from urllib.parse import unquote
@@ -18,54 +22,211 @@ try:  # pragma: no cover
 except ImportError:  # pragma: no cover
     JSONDecodeError = ValueError
 
+from explicates.bakery import bakery, BakedResults
 from explicates.model.collection import Collection
-from explicates.model.annotation import Annotation
+from explicates.model.annotation import Annotation, load_for_render
+from explicates.model.indexes import FTS_FIELDS, get_fts_vector
+from explicates.model.projection import AnnotationProjection, normalize_iri
+
+
+#: The range clause operators.
+RANGE_OPERATORS = {
+    'lte': operator.le,
+    'lt': operator.lt,
+    'gte': operator.ge,
+    'gt': operator.gt
+}
+
+#: The escape character for LIKE patterns.
+LIKE_ESCAPE = '/'
+
+
+class SearchResults(BakedResults):
+    """Lazily evaluated search results.
+
+    Slicing the results runs a bounded query for just the requested items and
+    the length is counted by the database, so no more than one page of
+    Annotations is ever loaded into memory.
+    """
+
+    def __init__(self, bq, session, params=None, limit=None, offset=0):
+        limit = self._get_int('limit', limit)
+        offset = self._get_int('offset', offset) or 0
+        super(SearchResults, self).__init__(Annotation, bq, session,
+                                            params=params, limit=limit,
+                                            offset=offset)
+
+    def _get_int(self, key, value):
+        """Return a search parameter as an integer."""
+        if value is None or value == '':
+            return None
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            msg = 'invalid "{0}" clause: {1} is not an integer'.format(key,
+                                                                       value)
+            raise ValueError(msg)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    __nonzero__ = __bool__
 
 
 class Search(object):
-    """Search class for Annotations."""
+    """Search class for Annotations.
+
+    Each search is split into criteria, which describe the shape of the
+    query, and the values to bind to them. Searches with the same criteria
+    share a baked query, so the clauses are only built and compiled once.
+    """
 
     def __init__(self, db):
         self.db = db
 
     def search(self, contains=None, collection=None, fts=None, fts_phrase=None,
                limit=None, range=None, order_by='created', offset=0,
-               deleted=None):
+               deleted=None, target=None, motivation=None):
         """Search for Annotations."""
-        clauses = [Annotation.deleted == False]
-        if deleted:
-            clauses = self._get_deleted_clause(deleted)
+        return self.paginate(contains=contains, collection=collection,
+                             fts=fts, fts_phrase=fts_phrase, limit=limit,
+                             range=range, order_by=order_by, offset=offset,
+                             deleted=deleted, target=target,
+                             motivation=motivation)[:]
+
+    def paginate(self, contains=None, collection=None, fts=None,
+                 fts_phrase=None, limit=None, range=None, order_by='created',
+                 offset=0, deleted=None, target=None, motivation=None):
+        """Return lazily evaluated search results for Annotations."""
+        criteria, params = self._get_criteria(
+            contains=contains, collection=collection, fts=fts,
+            fts_phrase=fts_phrase, range=range, order_by=order_by,
+            deleted=deleted, target=target, motivation=motivation)
+        return SearchResults(self._get_baked_query(criteria),
+                             self.db.session(), params=params, limit=limit,
+                             offset=offset)
+
+    def _get_criteria(self, contains=None, collection=None, fts=None,
+                      fts_phrase=None, range=None, order_by='created',
+                      deleted=None, target=None, motivation=None):
+        """Return the criteria for a search and the values to bind to them.
+
+        Raises a ValueError if any of the search clauses are invalid.
+        """
+        criteria = [('deleted', self._get_deleted_mode(deleted))]
+        params = {}
 
         if contains:
-            contains_clause = self._get_contains_clause(contains)
-            clauses.append(contains_clause)
+            criteria.append(('contains',))
+            params['contains'] = self._parse_json('contains', contains)
+
+        if target:
+            match, value = self._get_projection_match(
+                'target', target, normalize=normalize_iri)
+            criteria.append(('target', match))
+            params['target'] = value
+
+        if motivation:
+            match, value = self._get_projection_match('motivation',
+                                                      motivation)
+            criteria.append(('motivation', match))
+            params['motivation'] = value
 
         if collection:
-            collection_clause = self._get_collection_clause(collection)
-            clauses.append(collection_clause)
+            criteria.append(('collection',))
+            params['collection'] = self._get_collection_id(collection)
 
+        ts_queries = []
         if fts:
-            fts_clauses = self._get_fts_clauses(fts)
-            clauses.append(and_(*fts_clauses))
+            ts_queries += self._get_fts_queries(fts)
 
         if fts_phrase:
-            fts_phrase_clauses = self._get_fts_phrase_clauses(fts_phrase)
-            clauses.append(and_(*fts_phrase_clauses))
+            ts_queries += self._get_fts_phrase_queries(fts_phrase)
+
+        ts_fields = []
+        for i, (col, config, query_str) in enumerate(ts_queries):
+            ts_fields.append((col, i))
+            criteria.append(('fts', col, i))
+            params['fts_config_{}'.format(i)] = config
+            params['fts_query_{}'.format(i)] = query_str
 
         if range:
-            range_clauses = self._get_range_clauses(range)
-            clauses.append(and_(*range_clauses))
+            ranges = self._get_ranges(range)
+            for i, (col, op, value) in enumerate(ranges):
+                criteria.append(('range', col, op, i))
+                params['range_{}'.format(i)] = self._get_range_value(col,
+                                                                     value)
 
-        if len(clauses) > 1:
-            clauses = and_(*clauses)
+        criteria.append(self._get_order_by_criterion(order_by, ts_fields))
+        return tuple(criteria), params
 
-        return (self.db.session.query(Annotation)
-                .join(Collection)
-                .filter(*clauses)
-                .order_by(order_by)
-                .limit(limit)
-                .offset(offset)
-                .all())
+    def _get_baked_query(self, criteria):
+        """Return the baked query for a set of criteria."""
+        # Load the Collection IDs from the join, for generating IRIs
+        bq = bakery(lambda session: session.query(Annotation)
+                    .join(Collection)
+                    .options(contains_eager(Annotation.collection)
+                             .load_only('key', 'id')))
+        bq += (lambda q: q.filter(*self._get_clauses(criteria))
+                          .order_by(*self._get_order_by(criteria[-1])),
+               criteria)
+        return load_for_render(bq)
+
+    def _get_clauses(self, criteria):
+        """Return the clauses for all search criteria except the order."""
+        clauses = []
+        for criterion in criteria[:-1]:
+            name = criterion[0]
+            get_clause = getattr(self, '_get_{}_clause'.format(name))
+            clause = get_clause(*criterion[1:])
+            if clause is not None:
+                clauses.append(clause)
+        return clauses
+
+    def _get_order_by_criterion(self, order_by, ts_fields):
+        """Return the criterion for ordering the results.
+
+        Results can only be ordered by an Annotation column or by rank. The
+        rank settings are included, as they are built into the query.
+        """
+        if order_by in Annotation.__table__.c.keys():
+            return ('order_by', order_by)
+        elif order_by != 'rank':
+            msg = 'invalid "order_by" clause: {} is not a valid ' \
+                  'property'.format(order_by)
+            raise ValueError(msg)
+        elif not ts_fields:
+            msg = 'invalid "order_by" clause: rank requires "fts" or ' \
+                  '"fts_phrase"'
+            raise ValueError(msg)
+        weights = current_app.config['FTS_RANK_WEIGHTS']
+        return ('order_by', order_by, tuple(ts_fields),
+                current_app.config['FTS_RANK_FUNCTION'],
+                tuple(sorted(weights.items())))
+
+    def _get_order_by(self, criterion):
+        """Return the order by clauses.
+
+        Results ordered by rank are sorted by relevance to the full-text
+        search queries, most relevant first. Only the rank is computed for
+        each match, so with a limit the database keeps just the top results
+        while sorting, rather than loading every match.
+
+        Results ordered by an Annotation column are also ordered by key, so
+        that pages are stable and can be read from the column's index.
+        """
+        order_by = criterion[1]
+        columns = Annotation.__table__.c
+        if order_by in columns:
+            return [columns[order_by], Annotation.key]
+        ts_fields, rank_func_name, weights = criterion[2:]
+        rank_func = getattr(func, rank_func_name)
+        weights = dict(weights)
+        ranks = [weights.get(col, 1.0) *
+                 rank_func(get_fts_vector(col), self._get_ts_query(i))
+                 for col, i in ts_fields]
+        rank = sum(ranks[1:], ranks[0])
+        return [rank.desc(), Annotation.key]
 
     def _parse_json(self, key, data):
         if isinstance(data, dict):
@@ -79,50 +240,143 @@ class Search(object):
             raise ValueError(msg)
         return q
 
-    def _get_contains_clause(self, data):
+    def _get_deleted_mode(self, data):
+        """Return the mode for including deleted Annotations."""
+        mode = (data or 'exclude').lower()
+        if mode not in ['include', 'exclude', 'only']:
+            msg_base = 'invalid "deleted" clause'
+            msg_suffix = 'value must be "include", "exclude" or "only"'
+            msg = '{0}: {1}'.format(msg_base, msg_suffix)
+            raise ValueError(msg)
+        return mode
+
+    def _get_deleted_clause(self, mode):
+        """Return the deleted clause."""
+        if mode == 'exclude':
+            return Annotation.deleted == False
+        elif mode == 'only':
+            return Annotation.deleted == True
+
+    def _get_contains_clause(self):
         """Return contains clause."""
-        query = self._parse_json('contains', data)
-        return Annotation._data.contains(query)
+        return Annotation._data.contains(bindparam('contains'))
 
-    def _get_collection_clause(self, iri):
-        """Return Collection by IRI."""
-        collection_id = unquote(iri).rstrip('/').split('/')[-1]
-        return (Collection.id == collection_id)
+    def _get_projection_match(self, name, data, normalize=None):
+        """Return how to match a projected property and the value to match.
 
-    def _get_range_clauses(self, data):
-        """Return range clauses."""
+        Values are matched exactly, or as a prefix if given as a dict.
+        """
+        err_base = 'invalid "{}" clause'.format(name)
+        if isinstance(data, basestring) and data.startswith('{'):
+            data = self._parse_json(name, data)
+        if isinstance(data, dict):
+            prefix = data.get('prefix')
+            if not isinstance(prefix, basestring) or not prefix:
+                msg = '{0}: "prefix" is required'.format(err_base)
+                raise ValueError(msg)
+            return 'prefix', self._escape_like(prefix) + '%'
+        elif isinstance(data, basestring):
+            return 'equal', normalize(data) if normalize else data
+        msg = '{0}: {1} is not a string or {2}'.format(err_base, data, dict)
+        raise ValueError(msg)
+
+    def _escape_like(self, value):
+        """Escape the wildcards in a LIKE pattern."""
+        for char in [LIKE_ESCAPE, '%', '_']:
+            value = value.replace(char, LIKE_ESCAPE + char)
+        return value
+
+    def _get_target_clause(self, match):
+        """Return target clause."""
+        return self._get_projection_clause('target', match)
+
+    def _get_motivation_clause(self, match):
+        """Return motivation clause."""
+        return self._get_projection_clause('motivation', match)
+
+    def _get_projection_clause(self, name, match):
+        """Return the clause for Annotations with a projected property equal
+        to a value, or starting with a prefix."""
+        table = AnnotationProjection.__table__
+        if match == 'prefix':
+            value_clause = table.c.value.like(bindparam(name),
+                                              escape=LIKE_ESCAPE)
+        else:
+            value_clause = table.c.value == bindparam(name)
+        keys = select([table.c.annotation_key]) \
+            .where(and_(table.c.name == name, value_clause))
+        return Annotation.key.in_(keys)
+
+    def _get_collection_id(self, iri):
+        """Return the ID of a Collection from its IRI."""
+        return unquote(iri).rstrip('/').split('/')[-1]
+
+    def _get_collection_clause(self):
+        """Return Collection clause.
+
+        The Collection key is looked up first, so that Annotations can be
+        filtered using the same indexes as any contains clause.
+        """
+        collection_key = select([Collection.key]) \
+            .where(Collection.id == bindparam('collection')) \
+            .as_scalar()
+        return (Annotation.collection_key == collection_key)
+
+    def _get_ranges(self, data):
+        """Return the (column, operator, value) for each range."""
         q = self._parse_json('range', data)
         err_base = 'invalid "range" clause'
-        clauses = []
+        ranges = []
         for col, operators in q.items():
-            vector = self._get_vector(col)
             if not isinstance(operators, dict):
                 msg = '{0}: {1} is not {2}'.format(err_base, col, dict)
                 raise ValueError(msg)
             for op, value in operators.items():
-                if op == 'lte':
-                    clauses.append(vector <= str(value))
-                    continue
-                elif op == 'lt':
-                    clauses.append(vector < str(value))
-                    continue
-                elif op == 'gte':
-                    clauses.append(vector >= str(value))
-                    continue
-                elif op == 'gt':
-                    clauses.append(vector > str(value))
-                    continue
-                msg = '{0}: {1} is not a known operator'.format(err_base, op)
-                raise ValueError(msg)
-        return clauses
+                if op not in RANGE_OPERATORS:
+                    msg = '{0}: {1} is not a known operator'.format(err_base,
+                                                                    op)
+                    raise ValueError(msg)
+                ranges.append((col, op, value))
+        return sorted(ranges)
+
+    def _get_range_clause(self, col, op, i):
+        """Return range clause."""
+        vector = self._get_vector(col)
+
+        # Values for data fields are bound as JSON-encoded text, which
+        # Postgres parses as JSON
+        type_ = Unicode if isinstance(vector.type, JSON) else None
+        value = bindparam('range_{}'.format(i), type_=type_)
+        return RANGE_OPERATORS[op](vector, value)
+
+    def _get_range_value(self, col, value):
+        """Return the value to bind to a range clause.
+
+        Values for data fields are JSON-encoded, so that strings are
+        compared with strings and numbers with numbers.
+        """
+        if isinstance(self._get_vector(col).type, JSON):
+            return json.dumps(value)
+        return str(value)
+
+    def _get_fts_clause(self, col, i):
+        """Return the clause matching an indexed vector to a text search
+        query."""
+        return get_fts_vector(col).op('@@')(self._get_ts_query(i))
 
-    def _get_fts_clauses(self, data):
-        """Return full-text search clauses."""
+    def _get_ts_query(self, i):
+        """Return a text search query."""
+        return func.to_tsquery(bindparam('fts_config_{}'.format(i)),
+                               bindparam('fts_query_{}'.format(i)))
+
+    def _get_fts_queries(self, data):
+        """Return the (field, config, query) for each full-text search
+        field."""
         q = self._parse_json('fts', data)
         err_base = 'invalid "fts" clause'
-        clauses = []
+        queries = []
         for col, settings in q.items():
-            vector = self._get_vector(col)
+            self._check_fts_field(err_base, col)
 
             # Check params
             if not isinstance(settings, dict):
@@ -134,29 +388,26 @@ class Search(object):
                 raise ValueError(msg)
             operator = settings.get('operator', 'and')
             prefix = settings.get('prefix', True)
+            config = self._get_fts_config(err_base, settings)
 
-            # Generate clauses
+            # Generate query
             tokens = query.split()
-            word_clauses = []
-            for t in tokens:
-                if prefix:
-                    t += ':*'
-                clause = func.to_tsvector(vector).match(t)
-                word_clauses.append(clause)
-            if operator == 'or':
-                clauses.append(or_(*word_clauses))
-            else:
-                clauses.append(and_(*word_clauses))
-
-            return clauses
-
-    def _get_fts_phrase_clauses(self, data):
-        """Return full-text search phrase clauses."""
+            if prefix:
+                tokens = [t + ':*' for t in tokens]
+            joiner = ' | ' if operator == 'or' else ' & '
+            query_str = joiner.join(tokens)
+            queries.append((col, config, query_str))
+
+        return sorted(queries)
+
+    def _get_fts_phrase_queries(self, data):
+        """Return the (field, config, query) for each full-text search
+        phrase field."""
         q = self._parse_json('fts_phrase', data)
         err_base = 'invalid "fts_phrase" clause'
-        clauses = []
+        queries = []
         for col, settings in q.items():
-            vector = self._get_vector(col)
+            self._check_fts_field(err_base, col)
 
             # Check params
             if not isinstance(settings, dict):
@@ -168,16 +419,39 @@ class Search(object):
                 raise ValueError(msg)
             distance = settings.get('distance', 1)
             operator = ' <{}> '.format(distance)
+            config = self._get_fts_config(err_base, settings)
 
-            # Generate clause
+            # Generate query
             tokens = query.split()
-            word_clauses = []
             query_str = operator.join(tokens)
-            ts_query = func.to_tsquery(query_str)
-            clause = func.to_tsvector(vector).op('@@')(ts_query)
-            clauses.append(clause)
+            queries.append((col, config, query_str))
 
-        return clauses
+        return sorted(queries)
+
+    def _check_fts_field(self, err_base, col):
+        """Check that a field can be searched.
+
+        Fields without a full-text search index are parsed from the data of
+        every Annotation, so can be disabled with FTS_UNINDEXED_FIELDS.
+        """
+        if col not in FTS_FIELDS and \
+                not current_app.config.get('FTS_UNINDEXED_FIELDS'):
+            msg = '{0}: {1} is not a full-text searchable field'.format(
+                err_base, col)
+            raise ValueError(msg)
+
+    def _get_fts_config(self, err_base, settings):
+        """Return the dictionary used to parse a full-text search query."""
+        language = settings.get('language')
+        if not language:
+            return current_app.config['FTS_DEFAULT']
+        lang_map = current_app.config['FTS_LANGUAGE_MAP']
+        code = str(language).split('-')[0]
+        if code not in lang_map:
+            msg = '{0}: {1} is not a supported language'.format(
+                err_base, language)
+            raise ValueError(msg)
+        return lang_map[code]
 
     def _get_vector(self, col):
         """Return the query vector."""
@@ -185,17 +459,3 @@ class Search(object):
             return _entity_descriptor(Annotation, col)
         except InvalidRequestError:
             return _entity_descriptor(Annotation, '_data')[col]
-
-    def _get_deleted_clause(self, data):
-        """Return the deleted clause."""
-        if data.lower() == 'exclude':
-            return [Annotation.deleted == False]
-        elif data.lower() == 'include':
-            return []
-        elif data.lower() == 'only':
-            return [Annotation.deleted == True]
-        else:
-            msg_base = 'invalid "deleted" clause'
-            msg_suffix = 'value must be "include", "exclude" or "only"'
-            msg = '{0}: {1}'.format(msg_base, msg_suffix)
-            raise ValueError(msg)
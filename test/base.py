@@ -2,7 +2,9 @@
 
 import os
 import json
+from contextlib import contextmanager
 from functools import wraps
+from sqlalchemy import event
 
 from factories import reset_all_pk_sequences
 
@@ -22,6 +24,26 @@ def with_context(f):
     return decorated_function
 
 
+@contextmanager
+def capture_statements(bind=None, cursors=False):
+    """Capture the SQL statements run on the engine for a bind.
+
+    Yields a list that the statements are added to as they are run, or
+    (statement, cursor name) tuples if cursors is True.
+    """
+    engine = db.get_engine(flask_app, bind=bind)
+    statements = []
+
+    def before_execute(conn, cursor, statement, *args):
+        statements.append((statement, cursor.name) if cursors else statement)
+
+    event.listen(engine, 'before_cursor_execute', before_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_execute)
+
+
 def rebuild_db():
     """Rebuild the DB."""
     db.drop_all()
@@ -283,3 +283,27 @@ class TestAnnotationsAPI(Test):
         schema = json.load(open(schema_path))
         mock_validate.assert_called_once_with(bad_data, schema)
         assert_not_equal(annotation._data, bad_data)
+
+    @with_context
+    def test_304_when_annotation_not_modified(self):
+        """Test 304 when Annotation matches conditional headers."""
+        with freeze_time('1984-11-19'):
+            annotation = AnnotationFactory()
+        endpoint = u'/annotations/{}/{}/'.format(annotation.collection.id,
+                                                 annotation.id)
+        res = self.app_get_json_ld(endpoint)
+        etag = res.headers.get('ETag')
+        last_modified = res.headers.get('Last-Modified')
+        assert_equal(last_modified, 'Mon, 19 Nov 1984 00:00:00 GMT')
+
+        res = self.app_get_json_ld(endpoint, headers={'If-None-Match': etag})
+        assert_equal(res.status_code, 304)
+        headers = {'If-Modified-Since': last_modified}
+        res = self.app_get_json_ld(endpoint, headers=headers)
+        assert_equal(res.status_code, 304)
+
+        annotation.data = {'body': 'foo', 'target': 'bar'}
+        repo.update(Annotation, annotation)
+        res = self.app_get_json_ld(endpoint, headers={'If-None-Match': etag})
+        assert_equal(res.status_code, 200)
+        assert_not_equal(res.headers.get('ETag'), etag)
@@ -43,3 +43,15 @@ class TestBaseAPI(Test):
     def test_get_json_reponse_with_unknown_object(self):
         """Test get JSON response with unknown object."""
         assert_raises(TypeError, self.api_base._jsonld_response, [42])
+
+    def test_cursor_round_trip(self):
+        """Test a cursor can be decoded after being encoded."""
+        for cursor in [('after', None), ('after', 42), ('before', 7)]:
+            token = self.api_base._encode_cursor(*cursor)
+            assert_equal(self.api_base._decode_cursor(token), cursor)
+
+    def test_decode_invalid_cursor(self):
+        """Test decoding an invalid cursor."""
+        invalid = ['foo', self.api_base._encode_cursor('sideways', 1)]
+        for token in invalid:
+            assert_raises(ValueError, self.api_base._decode_cursor, token)
@@ -5,14 +5,17 @@ import json
 from nose.tools import *
 from mock import patch, call
 from freezegun import freeze_time
-from base import Test, with_context
+from base import Test, with_context, capture_statements
 from factories import CollectionFactory, AnnotationFactory
 from flask import current_app, url_for
 from jsonschema.exceptions import ValidationError
 
-from explicates.core import repo
+from explicates.core import repo, db
 from explicates.model.collection import Collection
 from explicates.model.annotation import Annotation
+from explicates.api.base import APIBase
+from explicates.api.collections import CollectionsAPI
+from explicates.cache import LRUCache
 
 
 class TestCollectionsAPI(Test):
@@ -641,3 +644,393 @@ class TestCollectionsAPI(Test):
         res = self.app_get_json_ld(endpoint)
         data = json.loads(res.data.decode('utf8'))
         assert_dict_equal(data, expected)
+
+    @with_context
+    @freeze_time("1984-11-19")
+    def test_get_page_with_cursor(self):
+        """Test get AnnotationPage with a cursor."""
+        collection = CollectionFactory()
+        per_page = current_app.config.get('ANNOTATIONS_PER_PAGE')
+        annotations = AnnotationFactory.create_batch(per_page * 3,
+                                                     collection=collection)
+        api_base = APIBase()
+        cursor = api_base._encode_cursor('after',
+                                         annotations[per_page - 1].key)
+        next_cursor = api_base._encode_cursor('after',
+                                              annotations[-per_page - 1].key)
+        prev_cursor = api_base._encode_cursor('before',
+                                              annotations[per_page].key)
+
+        endpoint = u'/annotations/{0}/?cursor={1}'.format(collection.id,
+                                                          cursor)
+        res = self.app_get_json_ld(endpoint)
+        data = json.loads(res.data.decode('utf8'))
+        item_ids = [item['id'] for item in data['items']]
+        assert_equal(item_ids, [
+            url_for('api.annotations', collection_id=collection.id,
+                    annotation_id=anno.id)
+            for anno in annotations[per_page:per_page * 2]
+        ])
+        assert_equal(data['id'], url_for('api.collections',
+                                         collection_id=collection.id,
+                                         cursor=cursor))
+        assert_equal(data['next'], url_for('api.collections',
+                                           collection_id=collection.id,
+                                           cursor=next_cursor))
+        assert_equal(data['prev'], url_for('api.collections',
+                                           collection_id=collection.id,
+                                           cursor=prev_cursor))
+        assert_equal(data['partOf']['total'], len(annotations))
+
+    @with_context
+    @freeze_time("1984-11-19")
+    def test_get_last_page_with_cursor(self):
+        """Test get last AnnotationPage with a cursor."""
+        collection = CollectionFactory()
+        per_page = current_app.config.get('ANNOTATIONS_PER_PAGE')
+        annotations = AnnotationFactory.create_batch(per_page * 2,
+                                                     collection=collection)
+        api_base = APIBase()
+        cursor = api_base._encode_cursor('before', None)
+        prev_cursor = api_base._encode_cursor('before',
+                                              annotations[per_page].key)
+
+        endpoint = u'/annotations/{0}/?cursor={1}'.format(collection.id,
+                                                          cursor)
+        res = self.app_get_json_ld(endpoint)
+        data = json.loads(res.data.decode('utf8'))
+        item_ids = [item['id'] for item in data['items']]
+        assert_equal(item_ids, [
+            url_for('api.annotations', collection_id=collection.id,
+                    annotation_id=anno.id)
+            for anno in annotations[per_page:]
+        ])
+        assert_equal(data['prev'], url_for('api.collections',
+                                           collection_id=collection.id,
+                                           cursor=prev_cursor))
+        assert_not_in('next', data)
+
+    @with_context
+    def test_400_with_invalid_cursor(self):
+        """Test 400 when cursor is invalid."""
+        collection = CollectionFactory()
+        AnnotationFactory(collection=collection)
+        endpoint = u'/annotations/{0}/?cursor={1}'.format(collection.id,
+                                                          'foo')
+        res = self.app_get_json_ld(endpoint)
+        assert_equal(res.status_code, 400, res.data)
+
+    @with_context
+    def test_404_when_cursor_page_is_empty(self):
+        """Test 404 when AnnotationPage for a cursor is empty."""
+        collection = CollectionFactory()
+        annotation = AnnotationFactory(collection=collection)
+        cursor = APIBase()._encode_cursor('after', annotation.key)
+        endpoint = u'/annotations/{0}/?cursor={1}'.format(collection.id,
+                                                          cursor)
+        res = self.app_get_json_ld(endpoint)
+        assert_equal(res.status_code, 404, res.data)
+
+    @with_context
+    @freeze_time("1984-11-19")
+    def test_default_container_with_cursor_pagination(self):
+        """Test Collection with default container and cursor pagination."""
+        collection = CollectionFactory()
+        per_page = current_app.config.get('ANNOTATIONS_PER_PAGE')
+        annotations = AnnotationFactory.create_batch(per_page * 2,
+                                                     collection=collection)
+        api_base = APIBase()
+        first_cursor = api_base._encode_cursor('after', None)
+        next_cursor = api_base._encode_cursor('after',
+                                              annotations[per_page - 1].key)
+        last_cursor = api_base._encode_cursor('before', None)
+
+        endpoint = u'/annotations/{}/'.format(collection.id)
+        with patch.dict(current_app.config, {'CURSOR_PAGINATION': True}):
+            res = self.app_get_json_ld(endpoint)
+        data = json.loads(res.data.decode('utf8'))
+        assert_equal(data['first']['id'], url_for('api.collections',
+                                                  collection_id=collection.id,
+                                                  cursor=first_cursor))
+        next_iri = url_for('api.collections', collection_id=collection.id,
+                           cursor=next_cursor)
+        assert_equal(data['first']['next'], next_iri)
+        assert_not_in('prev', data['first'])
+        assert_equal(len(data['first']['items']), per_page)
+        assert_equal(data['last'], url_for('api.collections',
+                                           collection_id=collection.id,
+                                           cursor=last_cursor))
+
+    @with_context
+    @freeze_time("1984-11-19")
+    def test_get_collection_uses_render_cache(self):
+        """Test Collection pages served from the render cache."""
+        collection = CollectionFactory()
+        AnnotationFactory(collection=collection)
+        endpoint = u'/annotations/{}/'.format(collection.id)
+        cache = LRUCache()
+        with patch('explicates.api.base.render_cache', cache):
+            res1 = self.app_get_json_ld(endpoint)
+            res2 = self.app_get_json_ld(endpoint)
+        assert_equal(res1.data, res2.data)
+        assert_equal(res1.headers.getlist('Link'),
+                     res2.headers.getlist('Link'))
+        assert_equal(res1.headers.get('ETag'), res2.headers.get('ETag'))
+        assert_equal(cache.stats()['hits'], 1)
+        assert_equal(cache.stats()['bytes_cached'], len(res1.data))
+
+    @with_context
+    @freeze_time("1984-11-19")
+    def test_render_cache_keyed_by_preferences(self):
+        """Test Collection pages cached separately for each preference."""
+        collection = CollectionFactory()
+        AnnotationFactory(collection=collection)
+        endpoint = u'/annotations/{}/'.format(collection.id)
+        prefer = ('return=representation;include='
+                  '"http://www.w3.org/ns/oa#PreferContainedIRIs"')
+        cache = LRUCache()
+        with patch('explicates.api.base.render_cache', cache):
+            res1 = self.app_get_json_ld(endpoint)
+            res2 = self.app_get_json_ld(endpoint, headers=dict(prefer=prefer))
+            res3 = self.app_get_json_ld(endpoint + '?page=0')
+        assert_not_equal(res1.data, res2.data)
+        assert_not_equal(res1.data, res3.data)
+        assert_equal(cache.stats()['hits'], 0)
+
+    @with_context
+    @freeze_time("1984-11-19")
+    def test_render_cache_not_served_after_changes(self):
+        """Test Collection pages in the render cache not served once stale."""
+        collection = CollectionFactory()
+        AnnotationFactory(collection=collection)
+        endpoint = u'/annotations/{}/'.format(collection.id)
+        cache = LRUCache()
+        with patch('explicates.api.base.render_cache', cache):
+            self.app_get_json_ld(endpoint)
+
+            # Changes made elsewhere change the Collection version
+            AnnotationFactory(collection=collection)
+            res = self.app_get_json_ld(endpoint)
+            data = json.loads(res.data.decode('utf8'))
+            assert_equal(data['total'], 2)
+
+            # Changes made via the API invalidate the cache
+            data['label'] = 'foo'
+            self.app_put_json_ld(endpoint, data=data)
+            assert_equal(cache.stats()['bytes_cached'], 0)
+            res = self.app_get_json_ld(endpoint)
+            data = json.loads(res.data.decode('utf8'))
+            assert_equal(data['label'], 'foo')
+        assert_equal(cache.stats()['hits'], 0)
+
+    @with_context
+    def test_etag_stable_between_renders(self):
+        """Test Collection ETag does not change until the Collection does."""
+        collection = CollectionFactory()
+        AnnotationFactory(collection=collection)
+        endpoint = u'/annotations/{}/'.format(collection.id)
+        res1 = self.app_get_json_ld(endpoint)
+        res2 = self.app_get_json_ld(endpoint)
+        assert_equal(res1.headers.get('ETag'), res2.headers.get('ETag'))
+        assert_true(res1.headers.get('ETag').startswith('W/'))
+
+        AnnotationFactory(collection=collection)
+        res3 = self.app_get_json_ld(endpoint)
+        assert_not_equal(res3.headers.get('ETag'), res1.headers.get('ETag'))
+
+        res4 = self.app_get_json_ld(endpoint + '?page=0')
+        assert_not_equal(res4.headers.get('ETag'), res3.headers.get('ETag'))
+
+    @with_context
+    @patch('explicates.api.collections.CollectionsAPI._items')
+    def test_304_when_etag_matches(self, mock_items):
+        """Test 304 without querying the page when If-None-Match matches."""
+        collection = CollectionFactory()
+        endpoint = u'/annotations/{}/'.format(collection.id)
+        mock_items.side_effect = lambda c: c.annotations
+        res = self.app_get_json_ld(endpoint)
+        etag = res.headers.get('ETag')
+        mock_items.reset_mock()
+
+        res = self.app_get_json_ld(endpoint, headers={'If-None-Match': etag})
+        assert_equal(res.status_code, 304)
+        assert_equal(res.data, b'')
+        assert_equal(res.headers.get('ETag'), etag)
+        assert_false(mock_items.called)
+
+        headers = {'If-None-Match': 'W/"foo"'}
+        res = self.app_get_json_ld(endpoint, headers=headers)
+        assert_equal(res.status_code, 200)
+        assert_true(mock_items.called)
+
+    @with_context
+    def test_304_when_not_modified_since(self):
+        """Test 304 when If-Modified-Since is not before Last-Modified."""
+        with freeze_time('1984-11-19'):
+            collection = CollectionFactory()
+        endpoint = u'/annotations/{}/'.format(collection.id)
+        res = self.app_get_json_ld(endpoint)
+        last_modified = 'Mon, 19 Nov 1984 00:00:00 GMT'
+        assert_equal(res.headers.get('Last-Modified'), last_modified)
+
+        headers = {'If-Modified-Since': last_modified}
+        res = self.app_get_json_ld(endpoint, headers=headers)
+        assert_equal(res.status_code, 304)
+
+        headers = {'If-Modified-Since': 'Sun, 18 Nov 1984 00:00:00 GMT'}
+        res = self.app_get_json_ld(endpoint, headers=headers)
+        assert_equal(res.status_code, 200)
+
+        # If-None-Match takes precedence
+        headers = {
+            'If-Modified-Since': last_modified,
+            'If-None-Match': 'W/"foo"'
+        }
+        res = self.app_get_json_ld(endpoint, headers=headers)
+        assert_equal(res.status_code, 200)
+
+    @with_context
+    def test_head_collection(self):
+        """Test HEAD Collection returns headers without a body."""
+        collection = CollectionFactory()
+        AnnotationFactory(collection=collection)
+        endpoint = u'/annotations/{}/'.format(collection.id)
+        for url in [endpoint, endpoint + '?page=0']:
+            get_res = self.app_get_json_ld(url)
+            with patch('explicates.api.base.jsonify') as mock_jsonify:
+                with capture_statements() as statements:
+                    res = self.app.head(url)
+            assert_false(mock_jsonify.called)
+            assert_equal(res.status_code, 200)
+            assert_equal(res.data, b'')
+            assert_equal(res.headers.get('ETag'), get_res.headers.get('ETag'))
+            assert_equal(res.headers.getlist('Link'),
+                         get_res.headers.getlist('Link'))
+            assert_equal(res.headers.get('Content-Type'),
+                         get_res.headers.get('Content-Type'))
+            pages = [sql for sql in statements if 'FROM annotation' in sql]
+            assert_equal(pages, [])
+        res = self.app.head(endpoint + '?page=1')
+        assert_equal(res.status_code, 404)
+
+    @with_context
+    @freeze_time("1984-11-19")
+    def test_get_page_with_stored_jsonld(self):
+        """Test Annotations with stored JSON-LD returned as when dictized."""
+        collection = CollectionFactory()
+        AnnotationFactory.create_batch(2, collection=collection)
+        for annotation in repo.filter_by(Annotation):
+            annotation.update()
+            repo.update(Annotation, annotation)
+        endpoint = u'/annotations/{}/?page=0'.format(collection.id)
+        res = self.app_get_json_ld(endpoint)
+        expected = json.loads(res.data.decode('utf8'))
+
+        with patch.dict(current_app.config, {'STORE_ANNOTATION_JSONLD': True}):
+            for annotation in repo.filter_by(Annotation):
+                repo.update(Annotation, annotation)
+            with patch.object(Annotation, 'dictize') as mock_dictize:
+                res = self.app_get_json_ld(endpoint)
+                data = json.loads(res.data.decode('utf8'))
+        assert_false(mock_dictize.called)
+        assert_dict_equal(data, expected)
+
+    @with_context
+    @freeze_time("1984-11-19")
+    def test_get_page_with_unstored_jsonld_loads_data_once(self):
+        """Test the data for Annotations without stored JSON-LD loaded in
+        one query."""
+        collection = CollectionFactory()
+        stored = AnnotationFactory(collection=collection)
+        AnnotationFactory(collection=collection,
+                          data={'body': 'foo', 'target': 'bar',
+                                'generator': 'baz'})
+        AnnotationFactory(collection=collection)
+        stored.update()
+        repo.update(Annotation, stored)
+        key = stored.key
+        endpoint = u'/annotations/{}/?page=0'.format(collection.id)
+        expected = json.loads(self.app_get_json_ld(endpoint).data
+                              .decode('utf8'))
+        settings = {'STORE_ANNOTATION_JSONLD': True}
+        for stream in [False, True]:
+            settings['STREAM_PAGES'] = stream
+            with patch.dict(current_app.config, settings):
+                repo.update(Annotation, repo.get(Annotation, key))
+                db.session.expunge_all()
+                statements = self.get_statements(endpoint)
+                data = json.loads(self.app_get_json_ld(endpoint).data
+                                  .decode('utf8'))
+            loads = [sql for sql in statements if 'annotation._data' in sql]
+            assert_equal(len(loads), 1)
+            assert_dict_equal(data, expected)
+
+    @with_context
+    def test_streamed_pages_same_as_rendered_pages(self):
+        """Test streamed Collection pages are identical to rendered pages."""
+        collection = CollectionFactory()
+        AnnotationFactory.create_batch(4, collection=collection)
+        endpoint = u'/annotations/{}/'.format(collection.id)
+        urls = [endpoint, endpoint + '?page=0', endpoint + '?page=1',
+                endpoint + '?iris=1']
+        expected = [self.app.get(url).data for url in urls]
+        with patch.dict(current_app.config, {'STREAM_PAGES': True}):
+            for url, data in zip(urls, expected):
+                res = self.app.get(url, buffered=True)
+                assert_equal(res.headers.get('Content-Length'), None)
+                assert_equal(res.data, data)
+            res = self.app.get(endpoint + '?page=2', buffered=True)
+            assert_equal(res.status_code, 404)
+
+    def get_statements(self, url, headers=None):
+        """Return the SQL statements executed for a request."""
+        with capture_statements() as statements:
+            res = self.app_get_json_ld(url, headers=headers)
+        assert_equal(res.status_code, 200, res.data)
+        return statements
+
+    @with_context
+    def test_get_page_with_iris_does_not_load_data(self):
+        """Test AnnotationPages with IRIs only load the Annotation IRIs."""
+        collection = CollectionFactory()
+        AnnotationFactory.create_batch(2, collection=collection)
+        endpoint = u'/annotations/{}/'.format(collection.id)
+        db.session.expunge_all()
+        prefer = ('return=representation;include='
+                  '"http://www.w3.org/ns/oa#PreferContainedIRIs"')
+        for url, headers in [(endpoint + '?iris=1', None),
+                             (endpoint + '?page=0&iris=1', None),
+                             (endpoint, dict(prefer=prefer))]:
+            statements = self.get_statements(url, headers=headers)
+            selects = [s for s in statements if 'FROM annotation' in s]
+            assert_equal(len(selects), 1)
+            assert_not_in('annotation._data', selects[0])
+            assert_not_in('annotation.created', selects[0])
+            db.session.expunge_all()
+
+    @with_context
+    def test_get_minimal_container_does_not_load_annotations(self):
+        """Test PreferMinimalContainer does not query the Annotations."""
+        collection = CollectionFactory()
+        AnnotationFactory.create_batch(2, collection=collection)
+        endpoint = u'/annotations/{}/'.format(collection.id)
+        prefer = ('return=representation;include='
+                  '"http://www.w3.org/ns/ldp#PreferMinimalContainer"')
+        statements = self.get_statements(endpoint, headers=dict(prefer=prefer))
+        assert_equal([s for s in statements if 'FROM annotation' in s], [])
+
+    @with_context
+    def test_page_cancelled_after_statement_timeout(self):
+        """Test page statements cancelled after the statement timeout."""
+        def slow_items(collection, **kwargs):
+            db.session.execute('SELECT pg_sleep(1)')
+
+        collection = CollectionFactory()
+        endpoint = u'/annotations/{}/'.format(collection.id)
+        settings = {'STATEMENT_TIMEOUTS': {'collections': 10}}
+        with patch.dict(current_app.config, settings):
+            with patch.object(CollectionsAPI, '_items',
+                              side_effect=slow_items):
+                res = self.app_get_json_ld(endpoint)
+        assert_equal(res.status_code, 504, res.data)
+        assert_equal(json.loads(res.data.decode('utf8'))['code'], 504)
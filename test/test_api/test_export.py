@@ -1,11 +1,16 @@
 # -*- coding: utf8 -*-
 
+import io
 import json
+import zipfile
 from nose.tools import *
 from freezegun import freeze_time
 from base import Test, with_context
 from factories import AnnotationFactory
 from flask import current_app, url_for
+from mock import patch
+
+from explicates.core import db, exporter
 
 
 class TestExportAPI(Test):
@@ -58,3 +63,23 @@ class TestExportAPI(Test):
         assert_equal(res.headers['Content-Type'], 'application/zip')
         content_disposition = 'attachment; filename=collection1.zip'
         assert_equal(res.headers['Content-Disposition'], content_disposition)
+        with zipfile.ZipFile(io.BytesIO(res.data)) as z:
+            data = json.loads(z.read('collection1.json').decode('utf8'))
+        assert_equal([anno['id'] for anno in data], [annotation.iri])
+
+    @with_context
+    def test_export_cancelled_after_statement_timeout(self):
+        """Test export statements cancelled after the statement timeout."""
+        def slow_export(collection):
+            db.session.execute('SELECT pg_sleep(1)')
+            yield
+
+        annotation = AnnotationFactory()
+        endpoint = u'/export/{}/'.format(annotation.collection.id)
+        settings = {'STATEMENT_TIMEOUTS': {'export': 10}}
+        with patch.dict(current_app.config, settings):
+            with patch.object(exporter, '_stream_annotation_data',
+                              side_effect=slow_export):
+                res = self.app_get_json_ld(endpoint)
+        assert_equal(res.status_code, 504, res.data)
+        assert_equal(json.loads(res.data.decode('utf8'))['code'], 504)
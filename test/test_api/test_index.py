@@ -29,30 +29,81 @@ class TestIndexAPI(Test):
                 'AnnotationCollection',
                 'BasicContainer'
             ],
+            'generated': '1984-11-19T00:00:00Z',
             'total': 2,
-            'items': [
-                {
-                    'id': url_for('api.collections',
-                                  collection_id=collection1.id,
-                                  _external=True),
-                    'type': collection1.data['type'],
-                    'created': '1984-11-19T00:00:00Z',
-                    'generated': '1984-11-19T00:00:00Z',
-                    'total': 3
-                },
-                {
-                    'id': url_for('api.collections',
-                                  collection_id=collection2.id,
-                                  _external=True),
-                    'type': collection2.data['type'],
-                    'created': '1984-11-19T00:00:00Z',
-                    'generated': '1984-11-19T00:00:00Z',
-                    'total': 0
-                }
-            ]
+            'first': {
+                'id': url_for('api.index', page=0, _external=True),
+                'type': 'AnnotationPage',
+                'startIndex': 0,
+                'items': [
+                    {
+                        'id': url_for('api.collections',
+                                      collection_id=collection1.id,
+                                      _external=True),
+                        'type': collection1.data['type'],
+                        'created': '1984-11-19T00:00:00Z',
+                        'generated': '1984-11-19T00:00:00Z',
+                        'total': 3
+                    },
+                    {
+                        'id': url_for('api.collections',
+                                      collection_id=collection2.id,
+                                      _external=True),
+                        'type': collection2.data['type'],
+                        'created': '1984-11-19T00:00:00Z',
+                        'generated': '1984-11-19T00:00:00Z',
+                        'total': 0
+                    }
+                ]
+            }
         }
 
         endpoint = '/annotations/'
         res = self.app_get_json_ld(endpoint)
         data = json.loads(res.data.decode('utf8'))
         assert_dict_equal(data, expected)
+
+    @with_context
+    @freeze_time("1984-11-19")
+    def test_collections_paged(self):
+        """Test Annotation Collections are returned in AnnotationPages."""
+        per_page = current_app.config.get('ANNOTATIONS_PER_PAGE')
+        collections = CollectionFactory.create_batch(per_page + 1)
+        endpoint = '/annotations/?page=1'
+        res = self.app_get_json_ld(endpoint)
+        data = json.loads(res.data.decode('utf8'))
+        assert_equal(data['type'], 'AnnotationPage')
+        assert_equal(data['partOf']['total'], per_page + 1)
+        assert_equal(data['prev'], url_for('api.index', page=0,
+                                           _external=True))
+        assert_equal([item['id'] for item in data['items']], [
+            url_for('api.collections', collection_id=collections[-1].id,
+                    _external=True)
+        ])
+
+    @with_context
+    @freeze_time("1984-11-19")
+    def test_collections_ordered_by_total(self):
+        """Test Annotation Collections ordered by total."""
+        collection1 = CollectionFactory()
+        collection2 = CollectionFactory()
+        collection3 = CollectionFactory()
+        AnnotationFactory.create_batch(2, collection=collection2)
+        AnnotationFactory.create_batch(1, collection=collection3)
+        endpoint = '/annotations/?order_by=total&desc=1&iris=1'
+        res = self.app_get_json_ld(endpoint)
+        data = json.loads(res.data.decode('utf8'))
+        assert_equal(data['id'], url_for('api.index', order_by='total',
+                                         desc=1, iris=1, _external=True))
+        assert_equal(data['first']['items'], [
+            url_for('api.collections', collection_id=collection.id,
+                    _external=True)
+            for collection in [collection2, collection3, collection1]
+        ])
+
+    @with_context
+    def test_400_when_ordered_by_invalid_column(self):
+        """Test 400 when Annotation Collections ordered by invalid column."""
+        CollectionFactory()
+        res = self.app_get_json_ld('/annotations/?order_by=_data')
+        assert_equal(res.status_code, 400, res.data)
@@ -1,12 +1,18 @@
 # -*- coding: utf8 -*-
 
+import io
 import json
+import zipfile
 from nose.tools import *
+from mock import patch
 from freezegun import freeze_time
-from base import Test, with_context
+from base import Test, with_context, capture_statements
 from factories import CollectionFactory, AnnotationFactory
 from flask import current_app, url_for
 
+from explicates.cache import LRUCache
+from explicates.core import db, search
+
 
 class TestSearchAPI(Test):
 
@@ -70,3 +76,395 @@ class TestSearchAPI(Test):
         }
         res = self.app_get_json_ld(endpoint, data=query)
         assert_equal(res.status_code, 400, res.data)
+
+    @with_context
+    def test_search_ordered_by_rank(self):
+        """Test search ordered by rank."""
+        endpoint = '/search/'
+        anno1 = AnnotationFactory(data={'body': 'foo'})
+        anno2 = AnnotationFactory(data={'body': 'foo foo'})
+        query = {
+            'fts': {
+                'body': {
+                    'query': 'foo'
+                }
+            },
+            'order_by': 'rank'
+        }
+        res = self.app_get_json_ld(endpoint, data=query)
+        data = json.loads(res.data.decode('utf8'))
+        ids = [item['id'] for item in data['first']['items']]
+        assert_equal(ids, [anno2.iri, anno1.iri])
+
+    @with_context
+    def test_search_ordered_by_rank_without_fts(self):
+        """Test search ordered by rank without a full-text search."""
+        endpoint = '/search/'
+        res = self.app_get_json_ld(endpoint, data={'order_by': 'rank'})
+        assert_equal(res.status_code, 400, res.data)
+
+    @with_context
+    def test_search_with_invalid_timestamp_range(self):
+        """Test search with an invalid timestamp range."""
+        endpoint = '/search/'
+        query = {
+            'range': {
+                'created': {
+                    'gt': 'foo'
+                }
+            }
+        }
+        res = self.app_get_json_ld(endpoint, data=query)
+        assert_equal(res.status_code, 400, res.data)
+
+    @with_context
+    def test_search_by_target_url_param(self):
+        """Test search by target using a URL parameter."""
+        anno = AnnotationFactory(data={'target': 'http://example.org/foo'})
+        AnnotationFactory(data={'target': 'http://example.org/bar'})
+        res = self.app_get_json_ld('/search/?target=http://example.org/foo')
+        data = json.loads(res.data.decode('utf8'))
+        ids = [item['id'] for item in data['first']['items']]
+        assert_equal(ids, [anno.iri])
+
+    @with_context
+    @freeze_time("1984-11-19")
+    def test_search_page(self):
+        """Test search AnnotationPage."""
+        endpoint = '/search/'
+        per_page = current_app.config.get('ANNOTATIONS_PER_PAGE')
+        annotations = AnnotationFactory.create_batch(per_page + 1)
+        query = {
+            'order_by': 'key'
+        }
+        res = self.app_get_json_ld(endpoint + '?page=1', data=query)
+        data = json.loads(res.data.decode('utf8'))
+        assert_equal(data['partOf']['total'], per_page + 1)
+        assert_equal(data['prev'], url_for('api.search', page=0, **query))
+        assert_not_in('next', data)
+        assert_equal([item['id'] for item in data['items']], [
+            url_for('api.annotations', collection_id=anno.collection.id,
+                    annotation_id=anno.id)
+            for anno in annotations[per_page:]
+        ])
+
+    @with_context
+    def test_search_page_issues_constant_number_of_queries(self):
+        """Test search page SQL does not grow with the Collections found."""
+        endpoint = '/search/'
+        n_queries = []
+        for n in [1, 3]:
+            AnnotationFactory.create_batch(n)
+            with capture_statements() as statements:
+                res = self.app_get_json_ld(endpoint)
+            assert_equal(res.status_code, 200, res.data)
+            n_queries.append(len(statements))
+        assert_equal(n_queries[0], n_queries[1])
+
+    @with_context
+    def test_streamed_search_same_as_rendered_search(self):
+        """Test streamed search results are identical to rendered results."""
+        AnnotationFactory.create_batch(4)
+        urls = ['/search/', '/search/?page=1', '/search/?limit=2&offset=1']
+        expected = [self.app.get(url).data for url in urls]
+        with patch.dict(current_app.config, {'STREAM_PAGES': True}):
+            for url, data in zip(urls, expected):
+                res = self.app.get(url, buffered=True)
+                assert_equal(res.headers.get('Content-Length'), None)
+                assert_equal(res.data, data)
+
+    @with_context
+    def test_search_with_iris_does_not_load_data(self):
+        """Test search with IRIs only loads the Annotation IRIs."""
+        AnnotationFactory.create_batch(2)
+        db.session.expunge_all()
+        with capture_statements() as statements:
+            res = self.app_get_json_ld('/search/?iris=1')
+        data = json.loads(res.data.decode('utf8'))
+        assert_equal(len(data['first']['items']), 2)
+        selects = [s for s in statements
+                   if s.startswith('SELECT annotation.')]
+        assert_equal(len(selects), 1)
+        assert_not_in('annotation._data', selects[0])
+
+    @with_context
+    def test_cached_search_does_not_query_database(self):
+        """Test the same search is answered from the search cache."""
+        AnnotationFactory(data={'body': 'foo', 'target': 'bar'})
+        contains = {'body': 'foo', 'target': 'bar'}
+        query = 'contains={"target": "bar", "body": "foo"}&limit=10'
+        cache = LRUCache()
+        with patch('explicates.api.search.search_cache', cache):
+            res1 = self.app_get_json_ld('/search/', data=dict(
+                contains=contains, limit=10))
+            with capture_statements() as statements:
+                res2 = self.app_get_json_ld('/search/?' + query)
+        assert_equal(res2.status_code, 200)
+        assert_equal(res1.data, res2.data)
+        assert_equal(statements, [])
+        assert_equal(cache.stats()['hits'], 1)
+
+    @with_context
+    def test_cached_search_invalidated_when_collection_changes(self):
+        """Test cached searches invalidated when a matching Collection
+        changes."""
+        collection = CollectionFactory()
+        other_collection = CollectionFactory()
+        endpoint = u'/annotations/{}/'.format(collection.id)
+        searches = [
+            '/search/',
+            '/search/?collection={}'.format(collection.id),
+            '/search/?collection={}'.format(other_collection.id)
+        ]
+        cache = LRUCache()
+        with patch('explicates.api.base.search_cache', cache):
+            with patch('explicates.api.search.search_cache', cache):
+                totals = [self._get_total(url) for url in searches]
+                self.app_post_json_ld(endpoint, data={'body': 'foo',
+                                                      'target': 'bar'})
+                new_totals = [self._get_total(url) for url in searches]
+        assert_equal(totals, [0, 0, 0])
+        assert_equal(new_totals, [1, 1, 0])
+        assert_equal(cache.stats()['hits'], 1)
+
+    @with_context
+    def test_cached_search_expires(self):
+        """Test cached searches expire after the TTL."""
+        cache = LRUCache(ttl=60)
+        with patch('explicates.api.search.search_cache', cache):
+            with freeze_time('1984-11-19 00:00:00'):
+                assert_equal(self._get_total('/search/'), 0)
+                AnnotationFactory()
+            with freeze_time('1984-11-19 00:00:59'):
+                assert_equal(self._get_total('/search/'), 0)
+            with freeze_time('1984-11-19 00:01:00'):
+                assert_equal(self._get_total('/search/'), 1)
+
+    def _get_total(self, url):
+        """Return the total number of search results."""
+        res = self.app_get_json_ld(url)
+        return json.loads(res.data.decode('utf8'))['total']
+
+    @with_context
+    def test_search_debug_requires_admin_api_key(self):
+        """Test search diagnostics are only returned to admins."""
+        endpoint = '/search/?debug=1'
+        headers = dict(Authorization='Bearer foo')
+        res = self.app_get_json_ld(endpoint, headers=headers)
+        assert_equal(res.status_code, 403)
+        with patch.dict(current_app.config, {'ADMIN_API_KEY': 'bar'}):
+            res = self.app_get_json_ld(endpoint, headers=headers)
+            assert_equal(res.status_code, 403)
+            res = self.app_get_json_ld(endpoint)
+            assert_equal(res.status_code, 403)
+
+    @with_context
+    def test_search_debug(self):
+        """Test search diagnostics returned."""
+        AnnotationFactory(data={'body': 'foo'})
+        endpoint = '/search/?debug=1&fts={"body": {"query": "foo"}}'
+        headers = dict(Authorization='Bearer bar')
+        with patch.dict(current_app.config, {'ADMIN_API_KEY': 'bar',
+                                             'STREAM_PAGES': True}):
+            res = self.app_get_json_ld(endpoint, headers=headers)
+        assert_equal(res.status_code, 200, res.data)
+        data = json.loads(res.data.decode('utf8'))
+        assert_equal(data['params'], {'fts': {'body': {'query': 'foo'}}})
+        count, page = data['queries'][:2]
+        assert_in("to_tsquery('english', 'foo:*')", count['sql'])
+        assert_in('count(*)', count['sql'])
+        assert_in("to_tsquery('english', 'foo:*')", page['sql'])
+        assert_in('LIMIT ', page['sql'])
+        for query in data['queries']:
+            plan = '\n'.join(query['plan'])
+            assert_in('actual time=', plan)
+            assert_in('Planning', plan)
+            assert_greater_equal(query['time'], 0)
+        query_time = sum(query['time'] for query in data['queries'])
+        assert_greater_equal(data['time'], query_time)
+
+    @with_context
+    def test_slow_search_logged(self):
+        """Test searches over the slow search threshold are logged."""
+        AnnotationFactory(data={'body': 'foo'})
+        endpoint = '/search/?limit=10&contains={"body": "foo"}'
+        for threshold, n_logged in [(60000, 0), (0, 1)]:
+            settings = {'SLOW_SEARCH_THRESHOLD': threshold}
+            with patch.dict(current_app.config, settings):
+                with patch.object(current_app.logger, 'warning') as warning:
+                    res = self.app_get_json_ld(endpoint)
+            assert_equal(res.status_code, 200)
+            assert_equal(warning.call_count, n_logged)
+        msg = warning.call_args[0][0]
+        assert_true(msg.startswith('Slow search ('))
+        assert_in('{"contains":{"body":"foo"},"limit":"10"}', msg)
+        assert_in('Limit', msg)
+
+    @with_context
+    def test_search_cancelled_after_statement_timeout(self):
+        """Test search statements cancelled after the statement timeout."""
+        def slow_search(**kwargs):
+            db.session.execute('SELECT pg_sleep(1)')
+
+        endpoint = '/search/'
+        settings = {'STATEMENT_TIMEOUTS': {'search': 10}}
+        with patch.dict(current_app.config, settings):
+            with patch.object(search, 'paginate', side_effect=slow_search):
+                res = self.app_get_json_ld(endpoint)
+        assert_equal(res.status_code, 504, res.data)
+        assert_equal(json.loads(res.data.decode('utf8')), {
+            'code': 504,
+            'message': 'The query took too long and was cancelled'
+        })
+        res = self.app_get_json_ld(endpoint)
+        assert_equal(res.status_code, 200, res.data)
+
+    @with_context
+    @freeze_time("1984-11-19")
+    def test_search_streamed_as_ndjson(self):
+        """Test all search results streamed as NDJSON."""
+        annotations = AnnotationFactory.create_batch(5)
+        expected = [json.loads(anno.render_jsonld()) for anno in annotations]
+        with capture_statements(cursors=True) as statements:
+            res = self.app.get('/search/?format=ndjson')
+        assert_equal(res.status_code, 200, res.data)
+        assert_equal(res.mimetype, 'application/x-ndjson')
+        lines = res.data.decode('utf8').splitlines()
+        assert_equal([json.loads(line) for line in lines], expected)
+
+        # The results are read from a single server-side cursor
+        cursors = [name for sql, name in statements
+                   if 'FROM annotation' in sql]
+        assert_equal(len(cursors), 1)
+        assert_not_equal(cursors[0], None)
+
+    @with_context
+    def test_search_streamed_as_ndjson_when_accepted(self):
+        """Test search results streamed as NDJSON for the Accept header."""
+        AnnotationFactory.create_batch(2)
+        headers = {'Accept': 'application/x-ndjson'}
+        res = self.app.get('/search/?offset=1', headers=headers)
+        assert_equal(res.mimetype, 'application/x-ndjson')
+        assert_equal(len(res.data.decode('utf8').splitlines()), 1)
+
+    @with_context
+    def test_ndjson_search_with_bad_query(self):
+        """Test 400 for invalid NDJSON searches."""
+        res = self.app.get('/search/?format=ndjson&fts={"body":"foo"}')
+        assert_equal(res.status_code, 400, res.data)
+        assert_equal(json.loads(res.data.decode('utf8'))['code'], 400)
+
+    @with_context
+    def test_search_streamed_as_zip(self):
+        """Test NDJSON search results streamed as a ZIP file."""
+        anno = AnnotationFactory()
+        res = self.app.get('/search/?format=ndjson&zip=1')
+        assert_equal(res.headers['Content-Type'], 'application/zip')
+        assert_equal(res.headers['Content-Disposition'],
+                     'attachment; filename=search.zip')
+        with zipfile.ZipFile(io.BytesIO(res.data)) as z:
+            assert_equal(z.namelist(), ['search.ndjson'])
+            lines = z.read('search.ndjson').decode('utf8').splitlines()
+        assert_equal([json.loads(line)['id'] for line in lines], [anno.iri])
+
+    def get_with_statements(self, endpoint, headers=None):
+        """Return a response and the statements run for it."""
+        with capture_statements() as statements:
+            res = self.app_get_json_ld(endpoint, headers=headers)
+        return res, statements
+
+    @with_context
+    def test_search_with_estimated_total(self):
+        """Test search totals estimated when requested."""
+        AnnotationFactory.create_batch(5)
+        db.session.execute('ANALYZE annotation')
+        query = dict(limit=4, count='estimated')
+        endpoint = url_for('api.search', **query)
+        prefer = {'Prefer': 'count=estimated'}
+        for url, headers in [(endpoint, None), ('/search/?limit=4', prefer)]:
+            res, statements = self.get_with_statements(url, headers)
+            assert_equal(res.status_code, 200, res.data)
+            data = json.loads(res.data.decode('utf8'))
+            assert_equal(data['total'], 4)
+            assert_true(data['approximateTotal'])
+            assert_false(any('count(*)' in sql for sql in statements))
+            assert_true(any(sql.startswith('EXPLAIN') for sql in statements))
+        data = json.loads(self.app_get_json_ld(endpoint).data.decode('utf8'))
+        assert_equal(data['last'], url_for('api.search', page=1, **query))
+        res = self.app_get_json_ld('/search/?limit=4')
+        assert_not_in('approximateTotal', json.loads(res.data.decode('utf8')))
+
+    @with_context
+    def test_search_pages_with_underestimated_total(self):
+        """Test search pages linked when the estimated total is too low."""
+        AnnotationFactory.create_batch(5)
+        for stream in [False, True]:
+            with patch.dict(current_app.config, STREAM_PAGES=stream):
+                with patch('explicates.bakery.estimate_rows', return_value=1):
+                    res = self.app_get_json_ld('/search/?count=estimated')
+                    data = json.loads(res.data.decode('utf8'))
+                    page = self.app_get_json_ld(
+                        '/search/?count=estimated&page=1')
+                    assert_equal(page.status_code, 200, page.data)
+                    page_data = json.loads(page.data.decode('utf8'))
+                    missing = self.app_get_json_ld(
+                        '/search/?count=estimated&page=2')
+                    assert_equal(missing.status_code, 404)
+            assert_equal(data['total'], 1)
+            assert_not_in('last', data)
+            assert_equal(len(data['first']['items']), 3)
+            assert_in('page=1', data['first']['next'])
+            assert_equal(len(page_data['items']), 2)
+            assert_not_in('next', page_data)
+
+    @with_context
+    def test_search_with_invalid_count(self):
+        """Test 400 for an invalid count mode."""
+        res = self.app_get_json_ld('/search/?count=foo')
+        assert_equal(res.status_code, 400, res.data)
+
+    @with_context
+    def test_search_count_only(self):
+        """Test only the total returned for count only searches."""
+        AnnotationFactory.create_batch(5)
+        cache = LRUCache()
+        with patch('explicates.api.search.search_cache', cache):
+            self.app_get_json_ld('/search/')
+            res, statements = self.get_with_statements(
+                '/search/?count_only=1')
+        assert_equal(res.status_code, 200, res.data)
+        data = json.loads(res.data.decode('utf8'))
+        assert_equal(data['total'], 5)
+        assert_not_in('first', data)
+        assert_not_in('last', data)
+        queries = [sql for sql in statements if 'FROM annotation' in sql]
+        assert_equal(len(queries), 1)
+        assert_in('count(*)', queries[0])
+
+    @with_context
+    def test_search_with_invalid_order_by(self):
+        """Test 400 when ordering search results by an invalid value."""
+        AnnotationFactory()
+        for query in ['order_by=foo', 'order_by=foo&count=estimated']:
+            res = self.app_get_json_ld('/search/?' + query)
+            assert_equal(res.status_code, 400, res.data)
+
+    @with_context
+    def test_cancelled_search_logged(self):
+        """Test searches cancelled after the statement timeout are logged."""
+        def slow_search(**kwargs):
+            db.session.execute('SELECT pg_sleep(1)')
+
+        settings = {
+            'SLOW_SEARCH_THRESHOLD': 60000,
+            'STATEMENT_TIMEOUTS': {'search': 10}
+        }
+        with patch.dict(current_app.config, settings):
+            with patch.object(search, 'paginate', side_effect=slow_search):
+                with patch.object(current_app.logger, 'warning') as warning:
+                    res = self.app_get_json_ld('/search/?limit=10')
+        assert_equal(res.status_code, 504, res.data)
+        assert_equal(warning.call_count, 1)
+        msg = warning.call_args[0][0]
+        assert_true(msg.startswith('Cancelled search ('))
+        assert_in('SELECT pg_sleep(1)', msg)
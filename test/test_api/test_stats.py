@@ -0,0 +1,68 @@
+# -*- coding: utf8 -*-
+
+import json
+from nose.tools import *
+from mock import patch
+from base import Test, with_context
+from flask import current_app
+
+from explicates.bakery import StatementCache
+from explicates.cache import LRUCache
+
+
+class TestStatsAPI(Test):
+
+    def setUp(self):
+        super(TestStatsAPI, self).setUp()
+        self.headers = {'Authorization': 'Bearer secret'}
+
+    def get_stats(self):
+        """Return the stats, requested with the admin API key."""
+        with patch.dict(current_app.config, ADMIN_API_KEY='secret'):
+            res = self.app.get('/stats/', headers=self.headers)
+        assert_equal(res.status_code, 200, res.data)
+        return json.loads(res.data.decode('utf8'))
+
+    @with_context
+    def test_stats_require_admin(self):
+        """Test 403 for stats requested without the admin API key."""
+        res = self.app.get('/stats/', headers=self.headers)
+        assert_equal(res.status_code, 403, res.data)
+        with patch.dict(current_app.config, ADMIN_API_KEY='secret'):
+            res = self.app.get('/stats/')
+            assert_equal(res.status_code, 403, res.data)
+            res = self.app.get('/stats/',
+                               headers={'Authorization': 'Bearer foo'})
+            assert_equal(res.status_code, 403, res.data)
+
+    @with_context
+    def test_render_cache_stats(self):
+        """Test render cache statistics returned."""
+        cache = LRUCache(max_bytes=10)
+        cache.set('foo', 1, 'bar', 3)
+        cache.get('foo', 1)
+        with patch('explicates.api.stats.render_cache', cache):
+            data = self.get_stats()
+        assert_dict_equal(data['render_cache'], {
+            'hits': 1,
+            'misses': 0,
+            'hit_rate': 1.0,
+            'evictions': 0,
+            'bytes_cached': 3
+        })
+
+    @with_context
+    def test_statement_cache_stats(self):
+        """Test statement cache statistics returned."""
+        cache = StatementCache()
+        cache['foo'] = 'bar'
+        cache.get('foo')
+        cache.get('baz')
+        with patch('explicates.api.stats.statement_cache', cache):
+            data = self.get_stats()
+        assert_dict_equal(data['statement_cache'], {
+            'hits': 1,
+            'misses': 1,
+            'hit_rate': 0.5,
+            'statements': 1
+        })
@@ -0,0 +1,93 @@
+# -*- coding: utf8 -*-
+
+from nose.tools import *
+from freezegun import freeze_time
+
+from explicates.cache import NullCache, LRUCache, create_cache
+
+
+class TestCache(object):
+
+    def test_null_cache_never_hits(self):
+        """Test NullCache never returns a cached value."""
+        cache = NullCache()
+        cache.set('foo', 1, 'bar', 3)
+        assert_equal(cache.get('foo', 1), None)
+        assert_equal(cache.stats()['misses'], 1)
+
+    def test_lru_cache_hits(self):
+        """Test LRUCache returns cached values."""
+        cache = LRUCache(max_bytes=10)
+        cache.set('foo', 1, 'bar', 3)
+        assert_equal(cache.get('foo', 1), 'bar')
+        assert_equal(cache.get('foo', 2), None)
+        assert_dict_equal(cache.stats(), {
+            'hits': 1,
+            'misses': 1,
+            'hit_rate': 0.5,
+            'evictions': 0,
+            'bytes_cached': 3
+        })
+
+    def test_lru_cache_evicts_least_recently_used(self):
+        """Test LRUCache evicts the least recently used values by size."""
+        cache = LRUCache(max_bytes=10)
+        cache.set('foo', 1, 'a', 4)
+        cache.set('foo', 2, 'b', 4)
+        cache.get('foo', 1)
+        cache.set('bar', 1, 'c', 4)
+        assert_equal(cache.get('foo', 1), 'a')
+        assert_equal(cache.get('foo', 2), None)
+        assert_equal(cache.get('bar', 1), 'c')
+        assert_equal(cache.stats()['evictions'], 1)
+        assert_equal(cache.stats()['bytes_cached'], 8)
+
+    def test_lru_cache_ignores_values_that_are_too_big(self):
+        """Test LRUCache does not cache values bigger than max_bytes."""
+        cache = LRUCache(max_bytes=10)
+        cache.set('foo', 1, 'a', 11)
+        assert_equal(cache.get('foo', 1), None)
+        assert_equal(cache.stats()['bytes_cached'], 0)
+
+    def test_lru_cache_invalidates_namespace(self):
+        """Test LRUCache invalidates all values for a namespace."""
+        cache = LRUCache(max_bytes=10)
+        cache.set('foo', 1, 'a', 1)
+        cache.set('foo', 2, 'b', 1)
+        cache.set('bar', 1, 'c', 1)
+        cache.invalidate('foo')
+        assert_equal(cache.get('foo', 1), None)
+        assert_equal(cache.get('foo', 2), None)
+        assert_equal(cache.get('bar', 1), 'c')
+        assert_equal(cache.stats()['bytes_cached'], 1)
+
+    def test_lru_cache_expires_values(self):
+        """Test LRUCache values expire after the time to live."""
+        cache = LRUCache(max_bytes=10, ttl=60)
+        with freeze_time('1984-11-19 00:00:00'):
+            cache.set('foo', 1, 'a', 1)
+        with freeze_time('1984-11-19 00:00:59'):
+            assert_equal(cache.get('foo', 1), 'a')
+        with freeze_time('1984-11-19 00:01:00'):
+            assert_equal(cache.get('foo', 1), None)
+        assert_equal(cache.stats()['bytes_cached'], 0)
+
+    def test_lru_cache_expires_values_with_shorter_ttl(self):
+        """Test LRUCache values set with a shorter time to live expire
+        first."""
+        cache = LRUCache(max_bytes=10, ttl=60)
+        with freeze_time('1984-11-19 00:00:00'):
+            cache.set('foo', 1, 'a', 1, ttl=5)
+            cache.set('foo', 2, 'b', 1, ttl=120)
+        with freeze_time('1984-11-19 00:00:05'):
+            assert_equal(cache.get('foo', 1), None)
+            assert_equal(cache.get('foo', 2), 'b')
+        with freeze_time('1984-11-19 00:01:00'):
+            assert_equal(cache.get('foo', 2), None)
+
+    def test_create_cache(self):
+        """Test caches created by type or import path."""
+        assert_is_instance(create_cache(None), NullCache)
+        assert_is_instance(create_cache('lru', max_bytes=1), LRUCache)
+        cache = create_cache('explicates.cache.LRUCache', max_bytes=1)
+        assert_is_instance(cache, LRUCache)
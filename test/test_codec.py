@@ -0,0 +1,50 @@
+# -*- coding: utf8 -*-
+
+from nose.tools import *
+
+from explicates.codec import CODEC_TYPES, JSONCodec, create_codec
+
+
+class TestCodec(object):
+
+    def get_codecs(self):
+        """Yield all installed codecs."""
+        for codec_type in CODEC_TYPES:
+            try:
+                yield create_codec(codec_type)
+            except ImportError:
+                continue
+
+    def test_auto_codec_installed(self):
+        """Test the fastest installed codec used by default."""
+        codec = create_codec('auto')
+        assert_equal(type(codec), type(next(self.get_codecs())))
+
+    def test_dumps(self):
+        """Test all codecs serialize equivalent JSON."""
+        obj = {'b': [1, 2.5, None, True], 'a': {'d': u'✓', 'c': '/'}}
+        for codec in self.get_codecs():
+            out = codec.dumps(obj)
+            assert_equal(JSONCodec().loads(out), obj)
+            assert_less(out.index('"a"'), out.index('"b"'))
+            assert_not_in('\n', out)
+            assert_in('\n  "a"', codec.dumps(obj, pretty=True))
+
+    def test_dumps_with_default(self):
+        """Test all codecs call default for objects they can't serialize."""
+        obj = {'a': object()}
+        for codec in self.get_codecs():
+            out = codec.dumps(obj, default=lambda o: 'foo')
+            assert_equal(codec.loads(out), {'a': 'foo'})
+
+    def test_loads(self):
+        """Test all codecs deserialize str and bytes."""
+        for codec in self.get_codecs():
+            assert_equal(codec.loads(u'{"a": "✓"}'), {'a': u'✓'})
+            assert_equal(codec.loads(u'{"a": "✓"}'.encode('utf8')),
+                         {'a': u'✓'})
+
+    def test_loads_invalid_json(self):
+        """Test all codecs raise ValueError for invalid JSON."""
+        for codec in self.get_codecs():
+            assert_raises(ValueError, codec.loads, '{""}')
@@ -0,0 +1,44 @@
+# -*- coding: utf8 -*-
+
+from nose.tools import *
+from base import Test, db, with_context
+from factories import AnnotationFactory
+from sqlalchemy.exc import DBAPIError
+
+from explicates.diagnostics import QueryRecorder
+from explicates.model.annotation import Annotation
+
+
+class TestDiagnostics(Test):
+
+    @with_context
+    def test_query_recorder(self):
+        """Test QueryRecorder records and explains executed statements."""
+        anno_id = AnnotationFactory().id
+        connection = db.session.connection()
+        with QueryRecorder(connection) as recorder:
+            db.session.query(Annotation).filter_by(id=anno_id).all()
+        db.session.query(Annotation).all()
+        assert_equal(len(recorder.queries), 1)
+        report = recorder.report()
+        assert_equal(len(report), 1)
+        assert_in("WHERE annotation.id = '{}'".format(anno_id),
+                  report[0]['sql'])
+        assert_not_in('actual time=', '\n'.join(report[0]['plan']))
+        analyzed = recorder.report(analyze=True)
+        assert_in('actual time=', '\n'.join(analyzed[0]['plan']))
+        assert_equal(recorder.time, recorder.queries[0][2])
+
+    @with_context
+    def test_query_recorder_records_failed_statements(self):
+        """Test QueryRecorder records statements that fail."""
+        connection = db.session.connection()
+        with assert_raises(DBAPIError):
+            with QueryRecorder(connection) as recorder:
+                connection.execute('SELECT 1 / 0')
+        assert_equal([query[0] for query in recorder.queries],
+                     ['SELECT 1 / 0'])
+        assert_not_in('query_start', connection.info)
+        report = recorder.report(explain=False)
+        assert_equal(report[0]['sql'], 'SELECT 1 / 0')
+        assert_equal(report[0]['plan'], None)
@@ -0,0 +1,49 @@
+# -*- coding: utf8 -*-
+
+from nose.tools import *
+from base import Test, with_context
+from flask import url_for
+
+from explicates.iri import iri_for, get_template
+
+
+class TestIRI(Test):
+
+    def setUp(self):
+        super(TestIRI, self).setUp()
+
+    @with_context
+    def test_iri_for_matches_url_for(self):
+        """Test IRIs match those built by url_for."""
+        cases = [
+            ('api.index', {}),
+            ('api.search', {}),
+            ('api.search', {'page': 0, 'iris': None}),
+            ('api.collections', {'collection_id': u'✓collection1'}),
+            ('api.collections', {'collection_id': 'foo bar', 'page': 2,
+                                 'iris': 1}),
+            ('api.annotations', {'collection_id': u'✓collection1',
+                                 'annotation_id': u'✓annotation1'}),
+            ('api.annotations', {'collection_id': 'foo%',
+                                 'annotation_id': 'bar'}),
+            ('api.search', {'contains': '{"body": "foo"}', 'page': 1})
+        ]
+        for endpoint, values in cases:
+            expected = url_for(endpoint, _external=True, **values)
+            assert_equal(iri_for(endpoint, **values), expected)
+
+    @with_context
+    def test_iri_for_within_request(self):
+        """Test IRIs match those built by url_for within a request."""
+        with self.flask_app.test_request_context('/', base_url='http://x.y'):
+            expected = url_for('api.collections', collection_id='foo',
+                               _external=True)
+            assert_equal(iri_for('api.collections', collection_id='foo'),
+                         expected)
+
+    @with_context
+    def test_templates_are_reused(self):
+        """Test IRI templates are built once per endpoint."""
+        template = get_template('api.annotations')
+        assert_equal(get_template('api.annotations'), template)
+        assert_not_equal(get_template('api.collections'), template)
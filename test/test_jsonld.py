@@ -0,0 +1,60 @@
+# -*- coding: utf8 -*-
+
+import json
+from nose.tools import *
+from mock import patch
+from base import Test, with_context
+
+from explicates.codec import CODEC_TYPES, create_codec
+from explicates.jsonld import RawJSON, JSONStream, dumps, iterdumps, iterlines
+
+
+class TestJSONLD(Test):
+
+    @with_context
+    def test_dumps_splices_raw_json(self):
+        """Test RawJSON values are included as is."""
+        raw = RawJSON('{"a":  [1, 2]}')
+        out = dumps({'items': [raw, {'b': 'c'}], 'd': '{"a":  [1, 2]}'})
+        assert_in('[{"a":  [1, 2]},', out)
+        assert_equal(json.loads(out), {
+            'items': [{'a': [1, 2]}, {'b': 'c'}],
+            'd': '{"a":  [1, 2]}'
+        })
+
+    def get_codecs(self):
+        """Yield all installed codecs."""
+        for codec_type in CODEC_TYPES:
+            try:
+                yield create_codec(codec_type)
+            except ImportError:
+                continue
+
+    @with_context
+    def test_iterdumps_same_as_dumps(self):
+        """Test streamed JSON is identical to JSON serialized at once."""
+        items = [{'b': [1, {'c': u'✓'}], 'a': None}, RawJSON('{"d":1}')]
+        for codec in self.get_codecs():
+            with patch('explicates.codec._codec', codec):
+                for pretty in [True, False]:
+                    for n in range(len(items) + 1):
+                        obj = {
+                            'first': {'items': items[:n], 'x': 1},
+                            'items': items[n:],
+                            'z': []
+                        }
+                        expected = dumps(obj, pretty=pretty)
+                        obj['first']['items'] = JSONStream(iter(items[:n]))
+                        obj['items'] = JSONStream(iter(items[n:]))
+                        out = ''.join(iterdumps(obj, pretty=pretty,
+                                                chunk_size=1))
+                        assert_equal(out, expected)
+
+    @with_context
+    def test_iterlines(self):
+        """Test items serialized as newline delimited JSON, in chunks."""
+        items = [{'b': [1, 2], 'a': u'✓'}, RawJSON('{"d":1}')]
+        for chunk_size, n_chunks in [(1, 2), (1024, 1)]:
+            chunks = list(iterlines(iter(items), chunk_size=chunk_size))
+            assert_equal(len(chunks), n_chunks)
+            assert_equal(''.join(chunks), u'{"a":"✓","b":[1,2]}\n{"d":1}\n')
@@ -1,7 +1,9 @@
 # -*- coding: utf8 -*-
 
+import json
 from flask import url_for, current_app
 from nose.tools import *
+from freezegun import freeze_time
 from base import Test, db, with_context
 
 from explicates.model.collection import Collection
@@ -85,3 +87,62 @@ class TestModelAnnotation(Test):
         db.session.add(annotation)
         db.session.commit()
         assert_equal(annotation.language, 'german')
+
+    @with_context
+    def test_generated_fixed_for_app_context(self):
+        """Test generated is the same for all Annotations in an app context."""
+        collection = Collection()
+        annotations = [Annotation(collection=collection, data={'body': i})
+                       for i in range(2)]
+        with freeze_time('1984-11-19'):
+            first = annotations[0].dictize()
+        with freeze_time('1984-11-20'):
+            second = annotations[1].dictize()
+        assert_equal(first['generated'], '1984-11-19T00:00:00Z')
+        assert_equal(second['generated'], first['generated'])
+
+    @with_context
+    def test_render_jsonld_with_stored_data(self):
+        """Test Annotation rendered from stored data as when dictized."""
+        collection = Collection()
+        data = {'id': 'foo', 'body': u'✓', 'target': {'source': 'bar'}}
+        annotation = Annotation(collection=collection, data=data)
+        db.session.add(annotation)
+        db.session.commit()
+        expected = json.loads(annotation.render_jsonld())
+        annotation.store_jsonld()
+        assert_equal(json.loads(annotation._jsonld),
+                     {'body': u'✓', 'target': {'source': 'bar'}})
+        assert_equal(json.loads(annotation.render_jsonld()), expected)
+        assert_equal(expected, annotation.dictize())
+
+    @with_context
+    def test_jsonld_not_stored_when_data_overrides_columns(self):
+        """Test Annotation data not stored when it overrides columns."""
+        annotation = Annotation(data={'body': 'foo', 'created': 'bar'})
+        annotation.store_jsonld()
+        assert_equal(annotation._jsonld, None)
+
+    @with_context
+    def test_stored_jsonld_cleared_when_data_changes(self):
+        """Test stored Annotation data cleared when the data changes."""
+        annotation = Annotation(data={'body': 'foo'})
+        annotation.store_jsonld()
+        annotation.data = {'body': 'bar'}
+        assert_equal(annotation._jsonld, None)
+
+    @with_context
+    def test_timestamps_stored_as_timestamptz(self):
+        """Test timestamps stored as timestamptz and loaded as xsd:datetime."""
+        collection = Collection()
+        annotation = Annotation(collection=collection,
+                                created='1984-11-19T01:02:03Z')
+        db.session.add(annotation)
+        db.session.commit()
+        row = db.session.execute("""
+            SELECT pg_typeof(created)::text, created = '1984-11-19 01:02:03Z'
+            FROM annotation
+        """).fetchone()
+        assert_equal(tuple(row), ('timestamp with time zone', True))
+        db.session.expire_all()
+        assert_equal(annotation.created, '1984-11-19T01:02:03Z')
@@ -71,3 +71,15 @@ class TestModelCollection(Test):
         db.session.add(deleted_annotation)
         db.session.commit()
         assert_equal(collection.total, 1)
+
+    @with_context
+    def test_total_expression_orders_by_size(self):
+        """Test Collection total expression can be used to order by size."""
+        collection1 = Collection()
+        collection2 = Collection()
+        db.session.add(collection1)
+        db.session.add(collection2)
+        db.session.add(Annotation(collection=collection2, data={'body': 1}))
+        db.session.commit()
+        collections = Collection.query.order_by(Collection.total.desc()).all()
+        assert_equal(collections, [collection2, collection1])
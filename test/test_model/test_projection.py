@@ -0,0 +1,71 @@
+# -*- coding: utf8 -*-
+
+from nose.tools import *
+
+from explicates.model.projection import get_projection
+
+
+class TestModelProjection(object):
+
+    def test_projection_of_string_target(self):
+        """Test projection of a target IRI, without any fragment."""
+        data = {'target': 'http://example.org/page1#xywh=1,2,3,4'}
+        assert_equal(get_projection(data),
+                     [('target', 'http://example.org/page1')])
+
+    def test_projection_of_specific_resource_targets(self):
+        """Test projection of the IDs and sources of multiple targets."""
+        data = {
+            'target': [
+                {
+                    'id': 'http://example.org/target1',
+                    'source': 'http://example.org/canvas1'
+                },
+                {
+                    'source': {
+                        'id': 'http://example.org/canvas2'
+                    },
+                    'selector': {
+                        'type': 'FragmentSelector',
+                        'value': 'xywh=1,2,3,4'
+                    }
+                }
+            ]
+        }
+        assert_equal(get_projection(data), [
+            ('target', 'http://example.org/canvas1'),
+            ('target', 'http://example.org/canvas2'),
+            ('target', 'http://example.org/target1')
+        ])
+
+    def test_projection_of_motivations_and_body_types(self):
+        """Test projection of motivations and body types."""
+        data = {
+            'motivation': ['commenting', 'tagging'],
+            'body': [
+                {
+                    'type': 'TextualBody',
+                    'value': 'foo'
+                },
+                {
+                    'type': ['SpecificResource', 'Dataset'],
+                    'source': 'http://example.org/bar'
+                },
+                'http://example.org/baz'
+            ]
+        }
+        assert_equal(get_projection(data), [
+            ('body_type', 'Dataset'),
+            ('body_type', 'SpecificResource'),
+            ('body_type', 'TextualBody'),
+            ('motivation', 'commenting'),
+            ('motivation', 'tagging')
+        ])
+
+    def test_projection_of_body_value(self):
+        """Test projection of a bodyValue."""
+        data = {'bodyValue': 'foo', 'motivation': 'commenting'}
+        assert_equal(get_projection(data), [
+            ('body_type', 'TextualBody'),
+            ('motivation', 'commenting')
+        ])
@@ -1,11 +1,18 @@
 # -*- coding: utf8 -*-
 
+import json
 from nose.tools import *
+from mock import patch
+from flask import current_app
 from base import Test, db, with_context
+from factories import CollectionFactory, AnnotationFactory
 
+from explicates.bakery import StatementCache, bakery
 from explicates.core import repo
-from explicates.model.annotation import Annotation
-from explicates.model.collection import Collection
+from explicates.model.annotation import Annotation, store_annotation_jsonld
+from explicates.model.collection import Collection, recount_annotations
+from explicates.model.projection import AnnotationProjection
+from explicates.model.projection import store_annotation_projections
 
 
 class TestRepository(Test):
@@ -29,6 +36,37 @@ class TestRepository(Test):
         })
         assert_raises(ValueError, repo.update, Collection, annotation)
 
+    @with_context
+    def test_get_by(self):
+        """Test objects got by attributes, including related objects."""
+        annotation = AnnotationFactory()
+        other_collection = CollectionFactory()
+        assert_equal(repo.get_by(Collection, id=annotation.collection.id),
+                     annotation.collection)
+        assert_equal(repo.get_by(Annotation, id=annotation.id,
+                                 collection=annotation.collection),
+                     annotation)
+        assert_equal(repo.get_by(Annotation, id=annotation.id,
+                                 collection=other_collection), None)
+        assert_equal(repo.get_by(Annotation, id=annotation.id,
+                                 collection=None), None)
+        assert_equal(repo.get_by(Collection, id='foo'), None)
+
+    @with_context
+    def test_get_by_reuses_baked_query(self):
+        """Test objects got by the same attributes share a baked query."""
+        collections = CollectionFactory.create_batch(2)
+        cache = StatementCache()
+        with patch.object(bakery, 'cache', cache):
+            repo.get_by(Collection, id=collections[0].id)
+            misses = cache.misses
+            statements = len(cache)
+            assert_equal(repo.get_by(Collection, id=collections[1].id),
+                         collections[1])
+        assert_equal(cache.misses, misses)
+        assert_equal(len(cache), statements)
+        assert_equal(cache.hits, 2)
+
     @with_context
     def test_count_does_not_include_deleted_collections(self):
         """Test count does not include deleted AnnotationCollections."""
@@ -57,3 +95,102 @@ class TestRepository(Test):
         db.session.commit()
         n = repo.count(Annotation)
         assert_equal(n, 1)
+
+    @with_context
+    def test_annotation_count_maintained_on_save_and_delete(self):
+        """Test Collection Annotation count maintained on save and delete."""
+        collection = CollectionFactory()
+        annotations = AnnotationFactory.create_batch(3, collection=collection)
+        AnnotationFactory(collection=collection, deleted=True)
+        assert_equal(repo.get(Collection, collection.key).total, 3)
+        repo.delete(Annotation, annotations[0].key)
+        assert_equal(repo.get(Collection, collection.key).total, 2)
+
+    @with_context
+    def test_annotation_count_maintained_on_batch_delete(self):
+        """Test Collection Annotation count maintained on batch delete."""
+        collection1 = CollectionFactory()
+        collection2 = CollectionFactory()
+        annotations1 = AnnotationFactory.create_batch(3,
+                                                      collection=collection1)
+        annotations2 = AnnotationFactory.create_batch(2,
+                                                      collection=collection2)
+        ids = [annotations1[0].id, annotations1[1].id, annotations2[0].id]
+        repo.delete(Annotation, annotations1[0].key)
+        repo.batch_delete(Annotation, ids)
+        assert_equal(repo.get(Collection, collection1.key).total, 1)
+        assert_equal(repo.get(Collection, collection2.key).total, 1)
+
+    @with_context
+    def test_recount_annotations(self):
+        """Test Collection Annotation counts recomputed."""
+        collection = CollectionFactory()
+        AnnotationFactory.create_batch(2, collection=collection)
+        collection.annotation_count = 42
+        db.session.commit()
+        recount_annotations()
+        db.session.commit()
+        assert_equal(repo.get(Collection, collection.key).total, 2)
+
+    @with_context
+    def test_annotation_jsonld_stored_when_enabled(self):
+        """Test Annotation JSON-LD stored on save and update when enabled."""
+        annotation = AnnotationFactory()
+        assert_equal(annotation._jsonld, None)
+        with patch.dict(current_app.config, {'STORE_ANNOTATION_JSONLD': True}):
+            annotation.data = {'body': 'foo'}
+            repo.update(Annotation, annotation)
+            assert_equal(json.loads(annotation._jsonld), {'body': 'foo'})
+            annotation = AnnotationFactory()
+        assert_not_equal(annotation._jsonld, None)
+
+    @with_context
+    def test_store_annotation_jsonld(self):
+        """Test JSON-LD stored for existing Annotations."""
+        annotation = AnnotationFactory()
+        modified = annotation.modified
+        store_annotation_jsonld(batch_size=1)
+        db.session.commit()
+        annotation = repo.get(Annotation, annotation.key)
+        assert_not_equal(annotation._jsonld, None)
+        assert_equal(annotation.modified, modified)
+
+    def get_projection(self, annotation):
+        """Return the stored projection for an Annotation."""
+        rows = db.session.query(AnnotationProjection) \
+            .filter_by(annotation_key=annotation.key) \
+            .order_by(AnnotationProjection.name, AnnotationProjection.value)
+        return [(row.name, row.value) for row in rows]
+
+    @with_context
+    def test_annotation_projection_stored(self):
+        """Test Annotation projection stored on save and update."""
+        annotation = AnnotationFactory(data={
+            'motivation': 'commenting',
+            'target': 'http://example.org/foo'
+        })
+        assert_equal(self.get_projection(annotation), [
+            ('motivation', 'commenting'),
+            ('target', 'http://example.org/foo')
+        ])
+        annotation.data = {'target': {'source': 'http://example.org/bar'}}
+        repo.update(Annotation, annotation)
+        assert_equal(self.get_projection(annotation), [
+            ('target', 'http://example.org/bar')
+        ])
+
+    @with_context
+    def test_annotation_projection_kept_on_delete(self):
+        """Test Annotation projection kept when an Annotation is deleted."""
+        annotation = AnnotationFactory(data={'target': 'foo'})
+        repo.delete(Annotation, annotation.key)
+        assert_equal(self.get_projection(annotation), [('target', 'foo')])
+
+    @with_context
+    def test_store_annotation_projections(self):
+        """Test projections stored for existing Annotations."""
+        annotation = AnnotationFactory(data={'target': 'foo'})
+        db.session.query(AnnotationProjection).delete()
+        store_annotation_projections(batch_size=1)
+        db.session.commit()
+        assert_equal(self.get_projection(annotation), [('target', 'foo')])
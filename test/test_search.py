@@ -2,15 +2,35 @@
 
 import json
 from nose.tools import *
-from base import Test, db, with_context
+from base import Test, db, with_context, capture_statements
+from flask import current_app
+from mock import patch
+from sqlalchemy import event
 from sqlalchemy.exc import InvalidRequestError
 from sqlalchemy.sql import and_
 from datetime import datetime, timedelta
 
 from factories import AnnotationFactory
+from explicates.bakery import StatementCache, bakery
 from explicates.search import Search
 
 
+def explain(query):
+    """Return the plan for a query."""
+    connection = db.session.connection()
+
+    def prefix_explain(conn, cursor, statement, params, context, many):
+        return 'EXPLAIN ' + statement, params
+
+    event.listen(connection, 'before_cursor_execute', prefix_explain,
+                 retval=True)
+    try:
+        cursor = connection.execute(query.statement).cursor
+        return '\n'.join(row[0] for row in cursor.fetchall())
+    finally:
+        event.remove(connection, 'before_cursor_execute', prefix_explain)
+
+
 class TestSearch(Test):
 
     def setUp(self):
@@ -19,9 +39,10 @@ class TestSearch(Test):
 
     def test_collection_clause(self):
         """Test collection clause."""
-        iri = 'foo'
-        clause = self.search._get_collection_clause(iri)
-        assert_equal(str(clause), 'collection.id = :id_1')
+        clause = self.search._get_collection_clause()
+        assert_equal(str(clause), 'annotation.collection_key = (SELECT '
+                                  'collection.key \nFROM collection \n'
+                                  'WHERE collection.id = :collection)')
 
     @with_context
     def test_search_by_collection(self):
@@ -34,14 +55,13 @@ class TestSearch(Test):
 
     def test_contains_clause(self):
         """Test contains clause."""
-        data = '{"foo": "bar"}'
-        clause = self.search._get_contains_clause(data)
-        assert_equal(str(clause), 'annotation._data @> :_data_1')
+        clause = self.search._get_contains_clause()
+        assert_equal(str(clause), 'annotation._data @> :contains')
 
     def test_contains_clause_with_invalid_json(self):
         """Test get contains with invalid JSON."""
         data = '{""}'
-        assert_raises(ValueError, self.search._get_contains_clause, data)
+        assert_raises(ValueError, self.search._get_criteria, contains=data)
 
     @with_context
     def test_search_by_contains(self):
@@ -52,6 +72,85 @@ class TestSearch(Test):
         results = self.search.search(contains=data)
         assert_equal(results, [anno])
 
+    @with_context
+    def test_contains_uses_index(self):
+        """Test contains searches use the data index."""
+        AnnotationFactory(data={'target': {'source': 'foo'}})
+        AnnotationFactory.create_batch(3)
+        data = {'target': {'source': 'foo'}}
+        query = self.search.paginate(contains=data).query
+        db.session.execute('SET LOCAL enable_seqscan = off')
+        assert_in('idx_annotation_data', explain(query))
+
+    @with_context
+    def test_search_by_target(self):
+        """Test search by target IRI."""
+        anno1 = AnnotationFactory(data={
+            'target': {
+                'source': 'http://example.org/canvas/1',
+                'selector': {
+                    'type': 'FragmentSelector',
+                    'value': 'xywh=1,2,3,4'
+                }
+            }
+        })
+        anno2 = AnnotationFactory(data={
+            'target': 'http://example.org/canvas/1#xywh=5,6,7,8'
+        })
+        AnnotationFactory(data={'target': 'http://example.org/canvas/10'})
+        results = self.search.search(target='http://example.org/canvas/1')
+        assert_equal(results, [anno1, anno2])
+
+    @with_context
+    def test_search_by_target_prefix(self):
+        """Test search by target IRI prefix."""
+        anno1 = AnnotationFactory(data={'target': 'http://example.org/a_1'})
+        anno2 = AnnotationFactory(data={'target': 'http://example.org/a_2'})
+        AnnotationFactory(data={'target': 'http://example.org/ab'})
+        target = '{"prefix": "http://example.org/a_"}'
+        results = self.search.search(target=target)
+        assert_equal(results, [anno1, anno2])
+
+    @with_context
+    def test_search_by_motivation(self):
+        """Test search by motivation."""
+        anno = AnnotationFactory(data={'motivation': ['tagging', 'linking']})
+        AnnotationFactory(data={'motivation': 'commenting'})
+        results = self.search.search(motivation='tagging')
+        assert_equal(results, [anno])
+
+    def test_target_clause_with_invalid_settings(self):
+        """Test target clause with invalid settings."""
+        assert_raises(ValueError, self.search._get_projection_match,
+                      'target', {'foo': 'bar'})
+        assert_raises(ValueError, self.search._get_projection_match,
+                      'target', 42)
+
+    @with_context
+    def test_target_uses_index(self):
+        """Test target searches use the projection index."""
+        AnnotationFactory.create_batch(3)
+        db.session.execute('SET LOCAL enable_seqscan = off')
+        for target in ['foo', {'prefix': 'foo'}]:
+            query = self.search.paginate(target=target).query
+            assert_in('idx_annotation_projection_value', explain(query))
+
+    @with_context
+    def test_searches_differing_by_value_share_baked_query(self):
+        """Test searches that differ only by value share a baked query."""
+        anno1 = AnnotationFactory(data={'motivation': 'tagging'})
+        anno2 = AnnotationFactory(data={'motivation': 'linking'})
+        cache = StatementCache()
+        with patch.object(bakery, 'cache', cache):
+            results = self.search.paginate(motivation='tagging', limit=5)
+            assert_equal(results[:], [anno1])
+            misses = cache.misses
+            statements = len(cache)
+            results = self.search.paginate(motivation='linking', limit=10)
+            assert_equal(results[:], [anno2])
+        assert_equal(cache.misses, misses)
+        assert_equal(len(cache), statements)
+
     @with_context
     def test_search_by_collection_and_contains(self):
         """Test search by collection and contains."""
@@ -72,27 +171,28 @@ class TestSearch(Test):
                 'lt': 'foo'
             }
         }
-        clauses = self.search._get_range_clauses(json.dumps(data))
-        assert_equal(len(clauses), 4)
-        str_clauses = [str(c) for c in clauses]
-        for op in ['<', '>', '<=', '>=']:
-            assert_in('annotation.created {} :created_1'.format(op),
-                      str_clauses)
+        ranges = self.search._get_ranges(json.dumps(data))
+        assert_equal(len(ranges), 4)
+        str_clauses = [str(self.search._get_range_clause(col, op, i))
+                       for i, (col, op, value) in enumerate(ranges)]
+        for i, op in enumerate(['>', '>=', '<', '<=']):
+            assert_equal('annotation.created {0} :range_{1}'.format(op, i),
+                         str_clauses[i])
 
     def test_range_clauses_with_invalid_settings(self):
         """Test range clauses with invalid settings."""
         data = '{"foo": "bar"}'
-        assert_raises(ValueError, self.search._get_range_clauses, data)
+        assert_raises(ValueError, self.search._get_ranges, data)
 
     def test_range_clauses_with_invalid_operator(self):
         """Test range clauses with invalid operator."""
         data = '{"created": {"foo": "bar"}}'
-        assert_raises(ValueError, self.search._get_range_clauses, data)
+        assert_raises(ValueError, self.search._get_ranges, data)
 
     def test_range_clauses_with_invalid_json(self):
         """Test range clauses with invalid JSON."""
         data = '{""}'
-        assert_raises(ValueError, self.search._get_range_clauses, data)
+        assert_raises(ValueError, self.search._get_ranges, data)
 
     @with_context
     def test_search_by_range_lt(self):
@@ -110,6 +210,42 @@ class TestSearch(Test):
         results = self.search.search(range=range_query)
         assert_equal(results, [anno_yesterday])
 
+    @with_context
+    def test_search_by_range_with_other_timestamp_formats(self):
+        """Test search by range with timestamps in other formats."""
+        anno1 = AnnotationFactory(created='2018-05-15T23:30:00Z')
+        AnnotationFactory(created='2018-05-16T00:30:00Z')
+        range_query = {
+            'created': {
+                'gte': '2018-05-15',
+                'lt': '2018-05-16T01:00:00+01:00'
+            }
+        }
+        results = self.search.search(range=range_query)
+        assert_equal(results, [anno1])
+
+    @with_context
+    def test_search_ordered_by_created(self):
+        """Test search ordered by Annotation created time."""
+        anno1 = AnnotationFactory(created='2018-05-16T00:00:00Z')
+        anno2 = AnnotationFactory(created='2018-05-15T00:00:00Z')
+        anno3 = AnnotationFactory(created='2018-05-15T00:00:00Z')
+        results = self.search.search()
+        assert_equal(results, [anno2, anno3, anno1])
+
+    @with_context
+    def test_created_range_uses_indexes(self):
+        """Test created ranges and ordering use the created indexes."""
+        anno = AnnotationFactory()
+        AnnotationFactory.create_batch(3)
+        db.session.execute('SET LOCAL enable_seqscan = off')
+        range_query = {'created': {'gte': '2018-05-15T00:00:00Z'}}
+        query = self.search.paginate(range=range_query).query
+        assert_in('Index Cond: (created >= ', explain(query))
+        db.session.execute('SET LOCAL enable_sort = off')
+        query = self.search.paginate(collection=anno.collection.id).query
+        assert_in('idx_annotation_collection_created', explain(query))
+
     @with_context
     def test_search_by_range_gt(self):
         """Test search by range greater than."""
@@ -123,20 +259,36 @@ class TestSearch(Test):
         results = self.search.search(range=range_query)
         assert_equal(results, [anno])
 
+    @with_context
+    def test_search_by_string_range(self):
+        """Test search by range of strings in the data."""
+        anno = AnnotationFactory(data={'label': 'abd'})
+        AnnotationFactory(data={'label': 'abb'})
+        AnnotationFactory()
+        range_query = {
+            'label': {
+                'gt': 'abc'
+            }
+        }
+        results = self.search.search(range=range_query)
+        assert_equal(results, [anno])
+
     def test_fts_clauses_with_invalid_json(self):
         """Test fts clauses with invalid JSON."""
         data = '{""}'
-        assert_raises(ValueError, self.search._get_fts_clauses, data)
+        assert_raises(ValueError, self.search._get_fts_queries, data)
 
+    @with_context
     def test_fts_clauses_with_invalid_settings(self):
         """Test fts clauses with invalid settings."""
         data = '{"foo": "bar"}'
-        assert_raises(ValueError, self.search._get_fts_clauses, data)
+        assert_raises(ValueError, self.search._get_fts_queries, data)
 
+    @with_context
     def test_fts_clauses_with_missing_query(self):
         """Test fts clauses with invalid settings."""
         data = '{"foo": {"bar":"baz"}}'
-        assert_raises(ValueError, self.search._get_fts_clauses, data)
+        assert_raises(ValueError, self.search._get_fts_queries, data)
 
     @with_context
     def test_search_by_fts_default(self):
@@ -205,15 +357,148 @@ class TestSearch(Test):
         results = self.search.search(fts=fts_query)
         assert_equal(results, [anno1, anno2])
 
+    @with_context
+    def test_fts_clauses_with_unindexed_field_disabled(self):
+        """Test fts clauses with a field that is not indexed when disabled."""
+        data = '{"foo": {"query": "bar"}}'
+        settings = {'FTS_UNINDEXED_FIELDS': False}
+        with patch.dict(current_app.config, settings):
+            assert_raises(ValueError, self.search._get_fts_queries, data)
+            assert_raises(ValueError, self.search._get_fts_phrase_queries,
+                          data)
+
+    @with_context
+    def test_search_by_fts_on_unindexed_field(self):
+        """Test search by fts on a field that is not indexed."""
+        anno = AnnotationFactory(data={'body': 'foo', 'label': 'bar'})
+        AnnotationFactory(data={'body': 'bar'})
+        fts_query = {
+            'label': {
+                'query': 'bar'
+            }
+        }
+        assert_equal(self.search.search(fts=fts_query), [anno])
+        assert_equal(self.search.search(fts_phrase=fts_query), [anno])
+
+    @with_context
+    def test_fts_clauses_with_unsupported_language(self):
+        """Test fts clauses with an unsupported language."""
+        data = '{"body": {"query": "foo", "language": "xx"}}'
+        assert_raises(ValueError, self.search._get_fts_queries, data)
+
+    @with_context
+    def test_search_by_fts_with_language(self):
+        """Test search by fts with the language of the query."""
+        anno1 = AnnotationFactory(data={'body': {'value': 'chevaux',
+                                                 'language': 'fr'}})
+        AnnotationFactory(data={'body': 'chevaux'})
+        fts_query = {
+            'body': {
+                'query': 'cheval',
+                'prefix': False,
+                'language': 'fr-FR'
+            }
+        }
+        results = self.search.search(fts=fts_query)
+        assert_equal(results, [anno1])
+
+    @with_context
+    def test_search_by_fts_on_multiple_fields(self):
+        """Test search by fts on multiple fields."""
+        anno1 = AnnotationFactory(data={'body': 'foo', 'target': 'bar'})
+        AnnotationFactory(data={'body': 'foo', 'target': 'baz'})
+        fts_query = {
+            'body': {
+                'query': 'foo'
+            },
+            'target': {
+                'query': 'bar'
+            }
+        }
+        results = self.search.search(fts=fts_query)
+        assert_equal(results, [anno1])
+
+    @with_context
+    def test_fts_uses_indexes(self):
+        """Test full-text searches use the full-text search indexes."""
+        AnnotationFactory.create_batch(3)
+        searches = [
+            (dict(fts={'body': {'query': 'foo'}}), 'idx_annotation_body'),
+            (dict(fts={'target': {'query': 'foo'}}), 'idx_annotation_target'),
+            (dict(fts_phrase={'body': {'query': 'foo bar'}}),
+             'idx_annotation_body')
+        ]
+        db.session.execute('SET LOCAL enable_seqscan = off')
+        for kwargs, index in searches:
+            query = self.search.paginate(**kwargs).query
+            assert_in(index, explain(query))
+
+    @with_context
+    def test_search_by_fts_ordered_by_rank(self):
+        """Test search by fts ordered by rank."""
+        anno1 = AnnotationFactory(data={'body': 'foo'})
+        anno2 = AnnotationFactory(data={'body': 'foo bar foo baz foo'})
+        anno3 = AnnotationFactory(data={'body': 'foo bar foo'})
+        AnnotationFactory(data={'body': 'bar'})
+        fts_query = {
+            'body': {
+                'query': 'foo'
+            }
+        }
+        results = self.search.search(fts=fts_query, order_by='rank')
+        assert_equal(results, [anno2, anno3, anno1])
+
+    @with_context
+    def test_search_by_fts_ordered_by_rank_weights_fields(self):
+        """Test search by fts ordered by rank weights each field."""
+        anno1 = AnnotationFactory(data={'body': 'bar', 'target': 'foo'})
+        anno2 = AnnotationFactory(data={'body': 'foo', 'target': 'bar'})
+        fts_query = {
+            'body': {
+                'query': 'foo bar',
+                'operator': 'or'
+            },
+            'target': {
+                'query': 'foo bar',
+                'operator': 'or'
+            }
+        }
+        weights = {'body': 0.5, 'target': 1.0}
+        with patch.dict(current_app.config, {'FTS_RANK_WEIGHTS': weights}):
+            results = self.search.search(fts=fts_query, order_by='rank')
+        assert_equal(results, [anno1, anno2])
+
+    @with_context
+    def test_search_by_fts_ordered_by_rank_with_limit(self):
+        """Test search by fts ordered by rank returns the top results."""
+        annos = [AnnotationFactory(data={'body': ' '.join(['foo'] * n)})
+                 for n in range(1, 5)]
+        fts_query = {
+            'body': {
+                'query': 'foo'
+            }
+        }
+        results = self.search.paginate(fts=fts_query, order_by='rank',
+                                       limit=2)
+        assert_equal(len(results), 2)
+        assert_equal(results[:], [annos[3], annos[2]])
+
+    @with_context
+    def test_rank_order_requires_fts(self):
+        """Test ordering by rank requires a full-text search."""
+        assert_raises(ValueError, self.search.search, order_by='rank')
+
+    @with_context
     def test_fts_phrase_clauses_with_invalid_settings(self):
         """Test fts phrase clauses with invalid settings."""
         data = '{"foo": "bar"}'
-        assert_raises(ValueError, self.search._get_fts_phrase_clauses, data)
+        assert_raises(ValueError, self.search._get_fts_phrase_queries, data)
 
+    @with_context
     def test_fts_phrase_clauses_with_missing_query(self):
         """Test fts phrase clauses with invalid settings."""
         data = '{"foo": {"bar":"baz"}}'
-        assert_raises(ValueError, self.search._get_fts_phrase_clauses, data)
+        assert_raises(ValueError, self.search._get_fts_phrase_queries, data)
 
     @with_context
     def test_search_by_fts_phrase(self):
@@ -246,9 +531,10 @@ class TestSearch(Test):
 
     def test_collection_clause(self):
         """Test collection clause."""
-        iri = 'foo'
-        clause = self.search._get_collection_clause(iri)
-        assert_equal(str(clause), 'collection.id = :id_1')
+        clause = self.search._get_collection_clause()
+        assert_equal(str(clause), 'annotation.collection_key = (SELECT '
+                                  'collection.key \nFROM collection \n'
+                                  'WHERE collection.id = :collection)')
 
     @with_context
     def test_search_excludes_deleted_annotations_by_default(self):
@@ -285,7 +571,7 @@ class TestSearch(Test):
     @with_context
     def test_search_raises_when_invalid_deleted_value(self):
         """Test search raises ValueError with invalid deleted argumement."""
-        assert_raises(ValueError, self.search._get_deleted_clause, 'foo')
+        assert_raises(ValueError, self.search._get_deleted_mode, 'foo')
 
     @with_context
     def test_offset(self):
@@ -295,3 +581,49 @@ class TestSearch(Test):
         annotations = AnnotationFactory.create_batch(size)
         results = self.search.search(offset=offset)
         assert_equal(len(results), size - offset)
+
+    @with_context
+    def test_paginate_total_respects_limit_and_offset(self):
+        """Test paginated search total respects limit and offset."""
+        AnnotationFactory.create_batch(5)
+        assert_equal(len(self.search.paginate()), 5)
+        assert_equal(len(self.search.paginate(offset=2)), 3)
+        assert_equal(len(self.search.paginate(limit=2)), 2)
+        assert_equal(len(self.search.paginate(limit=4, offset=3)), 2)
+        assert_equal(len(self.search.paginate(offset=10)), 0)
+
+    @with_context
+    def test_paginate_slices_within_limit(self):
+        """Test paginated search slices are bounded by limit and offset."""
+        annotations = AnnotationFactory.create_batch(6)
+        results = self.search.paginate(limit=4, offset=1, order_by='key')
+        assert_equal(results[0:3], annotations[1:4])
+        assert_equal(results[3:6], annotations[4:5])
+        assert_equal(results[4:6], [])
+
+    @with_context
+    def test_paginate_with_invalid_limit(self):
+        """Test paginated search raises ValueError with invalid limit."""
+        assert_raises(ValueError, self.search.paginate, limit='foo')
+
+    @with_context
+    def test_paginate_total_estimated(self):
+        """Test paginated search total estimated by the query planner."""
+        AnnotationFactory.create_batch(50)
+        db.session.execute('ANALYZE annotation')
+        with capture_statements() as statements:
+            results = self.search.paginate().estimated()
+            total = len(results)
+        assert_true(results.approximate)
+        assert_false(self.search.paginate().approximate)
+        assert_equal(total, 50)
+        assert_equal(len(statements), 1)
+        assert_true(statements[0].startswith('EXPLAIN (FORMAT JSON) SELECT'))
+        assert_not_in('count(*)', statements[0])
+        assert_equal(len(self.search.paginate(offset=40).estimated()), 10)
+
+    @with_context
+    def test_search_raises_when_invalid_order_by(self):
+        """Test search raises ValueError when ordered by an invalid value."""
+        for order_by in ['foo', 'created DESC', None]:
+            assert_raises(ValueError, self.search.paginate, order_by=order_by)